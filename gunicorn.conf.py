@@ -0,0 +1,50 @@
+"""
+gunicornの設定（本番環境用）
+
+    gunicorn image_analysis_app.asgi:application -c gunicorn.conf.py
+
+ワーカーのスレッド数・CPUの割り当ては ANALYSIS_TORCH_THREADS / ANALYSIS_CPU_AFFINITY で設定する
+（new_image_analyzer_v2/execution.py）。
+
+preload_appが有効な場合、マスタープロセスでANALYSIS_PRELOAD_MODELSのモデルを読み込んでから
+ワーカーをforkするため、モデルの重みはワーカー間で共有される（new_image_analyzer_v2/shared_models.py）。
+無効な場合は各ワーカーがリクエストを受け付ける前にモデルを読み込む。
+
+環境変数:
+    GUNICORN_BIND     待ち受けアドレス（既定: 0.0.0.0:8000）
+    GUNICORN_WORKERS  ワーカー数（既定: 4）
+    GUNICORN_PRELOAD  '0'でpreload_appを無効にする（既定: '1'）
+"""
+import itertools
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '4'))
+# 解析進捗のストリーム（SSE）は接続を保持し続けるため、ASGIのワーカーで動かす
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'uvicorn.workers.UvicornWorker')
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+# モデルの読み込みに時間がかかるため、起動直後のワーカーがタイムアウトで再起動されないようにする
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+
+
+def when_ready(server):
+    """ワーカーのfork前（マスタープロセス）"""
+    if server.cfg.preload_app:
+        from new_image_analyzer_v2.shared_models import prepare_master_for_fork
+        prepare_master_for_fork()
+
+
+def pre_fork(server, worker):
+    """ワーカーに番号を割り当てる（再起動したワーカーは空いた番号を引き継ぎ、同じCPUを使う）"""
+    used = {getattr(other, 'worker_index', None) for other in server.WORKERS.values()}
+    worker.worker_index = next(index for index in itertools.count() if index not in used)
+
+
+def post_worker_init(worker):
+    """ワーカーの起動後、リクエストの受け付け前"""
+    from new_image_analyzer_v2.execution import configure_worker
+    configure_worker(worker.worker_index, worker.cfg.workers)
+
+    if not worker.cfg.preload_app:
+        from new_image_analyzer_v2.shared_models import preload_models
+        preload_models()
@@ -5,6 +5,9 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+解析進捗のストリーム（/v2/api/analysis/events/）は接続を保持し続けるため、
+ASGIサーバーで起動する（例: gunicorn image_analysis_app.asgi:application -k uvicorn.workers.UvicornWorker）。
 """
 
 import os
@@ -160,6 +160,63 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # 開発用: 
 # パスワードリセット設定
 PASSWORD_RESET_TIMEOUT = 3600  # 1時間（秒）
 
+# 画像解析設定
+# 起動時に事前読み込みするモデル（例: ['resnet50', 'clip']）。空の場合は初回リクエスト時に読み込む
+ANALYSIS_PRELOAD_MODELS = []
+# 読み込み済みモデルのメモリ上限（MB）。超えた場合は最も長く使われていないモデルを破棄する。Noneで無制限
+ANALYSIS_MODEL_MEMORY_BUDGET_MB = None
+# 読み込みに失敗したモデル（重みのダウンロード失敗など）を再読み込みするまでの時間（秒）
+ANALYSIS_MODEL_RETRY_SECONDS = 60
+# 同時に来た推論リクエストをまとめるバッチの最大件数（1でバッチ化しない）と最大待ち時間（ミリ秒）
+ANALYSIS_BATCH_MAX_SIZE = 16
+ANALYSIS_BATCH_MAX_WAIT_MS = 5
+# 推論の実行リソース（プロセスごと）
+# 推論のスレッド数と演算間のスレッド数（Noneの場合、CPUを割り当てたときはそのCPU数、それ以外はPyTorchの既定値）
+ANALYSIS_TORCH_THREADS = None
+ANALYSIS_TORCH_INTEROP_THREADS = None
+# gunicornのワーカーへのCPUの割り当て（None: 割り当てない / 'auto': 使用できるCPUを等分 / ['0-3', '4-7']: ワーカー番号順に指定）
+ANALYSIS_CPU_AFFINITY = None
+# プロセス内で同時に実行する推論の数（Noneで無制限。待ち時間は /v2/api/metrics/ で確認できる）
+ANALYSIS_INFERENCE_SLOTS = None
+# 一括解析で画像のデコード・前処理を行うプロセス数（0で推論と同じスレッドで実行）と先読みする枚数
+ANALYSIS_DECODE_WORKERS = 0
+ANALYSIS_DECODE_PREFETCH = 8
+# 学習済みの重みをメモリマップで読み込むか（gunicornのワーカー間で重みのメモリを共有する。初回のみ重みをmmap可能な形式で保存）
+ANALYSIS_MODEL_WEIGHTS_MMAP = False
+ANALYSIS_MODEL_WEIGHTS_DIR = BASE_DIR / 'model_cache' / 'weights'
+# モデルの実行方式（'eager': torchvisionで組み立てる / 'torchscript' / 'onnx': export_modelsで書き出したファイルから読み込む）
+ANALYSIS_MODEL_BACKEND = 'eager'
+ANALYSIS_EXPORTED_MODEL_DIR = BASE_DIR / 'model_cache' / 'exported'
+# INT8量子化モデルの保存先（初回の読み込み時、または build_quantized_models で作成）
+ANALYSIS_QUANTIZED_MODEL_DIR = BASE_DIR / 'model_cache' / 'quantized'
+# 量子化エンジン（Noneで自動選択: x86 → fbgemm → qnnpack）
+ANALYSIS_QUANTIZATION_ENGINE = None
+# 静的量子化の校正に使う画像のディレクトリと枚数（ディレクトリ未指定の場合は最近アップロードされた画像を使う）
+ANALYSIS_QUANTIZATION_CALIBRATION_DIR = None
+ANALYSIS_QUANTIZATION_CALIBRATION_IMAGES = 64
+# 同じ内容の画像の解析結果を再利用するキャッシュのプロセス内保持件数（DBのキャッシュは件数無制限）
+ANALYSIS_RESULT_CACHE_SIZE = 1024
+# 再圧縮・リサイズされた類似画像の解析結果を再利用するか（知覚ハッシュのハミング距離が閾値以内の解析済み画像）
+ANALYSIS_NEAR_DUPLICATE_REUSE = False
+ANALYSIS_NEAR_DUPLICATE_MAX_DISTANCE = 4  # 64ビット中の異なるビット数
+
+# 解析ジョブのワーカー設定
+# 'thread': Webプロセス内のワーカースレッドで実行 / 'external': python manage.py run_analysis_workers で実行
+ANALYSIS_WORKER_MODE = 'thread'
+ANALYSIS_WORKER_COUNT = 2  # 同時に実行するジョブ数（プロセスごと）
+ANALYSIS_WORKER_POLL_INTERVAL = 1.0  # ジョブがない場合の待機間隔（秒）
+ANALYSIS_WORKER_BATCH_SIZE = 8  # 1つのワーカーがまとめて取得する同じモデルのジョブ数（まとめてデコード・バッチ推論する）
+ANALYSIS_JOB_MAX_ATTEMPTS = 3  # 失敗時の最大実行回数
+ANALYSIS_JOB_RETRY_BACKOFF_SECONDS = 5  # 再実行までの待機時間（試行ごとに2倍）
+ANALYSIS_JOB_LEASE_SECONDS = 600  # この時間を過ぎた実行中ジョブは他のワーカーが再取得する
+
+# 解析進捗ストリーム（SSE）の設定
+# 'local': 同一プロセス内のワーカーの進捗のみ配信 / 'postgres': LISTEN/NOTIFYで別プロセスのワーカーの進捗も配信
+# 'auto': DBがPostgreSQLの場合は 'postgres'、それ以外は 'local'
+ANALYSIS_EVENTS_BACKEND = 'auto'
+ANALYSIS_EVENTS_HEARTBEAT_SECONDS = 15  # 変化がない間に接続維持用のコメントを送り、DBの状態を読み直す間隔（秒）
+ANALYSIS_EVENTS_MAX_SECONDS = 600  # 1本のストリームの最大接続時間（超えるとクライアントが再接続する）
+
 # ログ設定
 LOGGING = {
     'version': 1,
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import MstUser, TransUploadedImage, TransImageAnalysis
+from .models import MstUser, TransUploadedImage, TransAnalysisRun, TransImageAnalysis, TransAnalysisJob, TransAnalysisResultCache
 
 
 @admin.register(MstUser)
@@ -14,13 +14,44 @@ class TransUploadedImageAdmin(admin.ModelAdmin):
     list_display = ['image_id', 'filename', 'user_id', 'status', 'created_at']
     list_filter = ['status', 'created_at', 'user_id']
     search_fields = ['filename', 'user_id__user__username']
-    readonly_fields = ['image_id', 'updated_at']
+    readonly_fields = ['image_id', 'latest_results', 'latest_model_name', 'latest_run_id', 'updated_at']
+
+
+@admin.register(TransAnalysisRun)
+class TransAnalysisRunAdmin(admin.ModelAdmin):
+    list_display = ['run_id', 'image_id', 'model_name', 'model_version', 'status', 'started_at', 'completed_at', 'total_time']
+    list_filter = ['status', 'model_name']
+    search_fields = ['image_id__filename']
+    readonly_fields = ['run_id', 'timings']
+    
+    @admin.display(description='処理時間(ms)')
+    def total_time(self, obj):
+        return (obj.timings or {}).get('total')
 
 
 @admin.register(TransImageAnalysis)
 class TransImageAnalysisAdmin(admin.ModelAdmin):
-    list_display = ['analysis_id', 'image_id', 'label', 'confidence', 'model_name', 'rank']
+    list_display = ['analysis_id', 'image_id', 'run_id', 'label', 'confidence', 'model_name', 'rank', 'reused_from']
     list_filter = ['model_name', 'rank', 'analysis_started_at']
     search_fields = ['label', 'image_id__filename']
     readonly_fields = ['analysis_id']
 
+
+@admin.register(TransAnalysisJob)
+class TransAnalysisJobAdmin(admin.ModelAdmin):
+    list_display = ['job_id', 'image_id', 'model_name', 'status', 'attempts', 'available_at', 'locked_by', 'total_time']
+    list_filter = ['status', 'model_name']
+    search_fields = ['image_id__filename', 'locked_by']
+    readonly_fields = ['job_id', 'timings', 'created_at', 'updated_at']
+    
+    @admin.display(description='処理時間(ms)')
+    def total_time(self, obj):
+        return (obj.timings or {}).get('total')
+
+
+@admin.register(TransAnalysisResultCache)
+class TransAnalysisResultCacheAdmin(admin.ModelAdmin):
+    list_display = ['cache_id', 'content_digest', 'model_name', 'model_version', 'hit_count', 'last_hit_at', 'created_at']
+    list_filter = ['model_name', 'model_version']
+    search_fields = ['content_digest']
+    readonly_fields = ['cache_id', 'created_at']
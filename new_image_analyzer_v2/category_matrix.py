@@ -0,0 +1,124 @@
+"""
+大分類カテゴリー
+ImageNet等のクラス名をキーワードで大分類カテゴリーに対応付ける
+キーワード照合はクラス一覧ごとに1回だけ行い、カテゴリー×クラスの重み行列として保持する
+"""
+from typing import Dict, List, Mapping, Tuple
+
+import numpy as np
+
+# 大分類カテゴリーのマッピング辞書（カテゴリー → クラス名に含まれるキーワード）
+BROAD_CATEGORY_MAPPING: Dict[str, List[str]] = {
+    '人物': [
+        'person', 'man', 'woman', 'child', 'baby', 'boy', 'girl',
+        'face', 'head', 'portrait', 'selfie', 'people', 'human',
+        'mask', 'wig', 'shower cap', 'hat', 'cap', 'helmet'
+    ],
+    '動物': [
+        'dog', 'cat', 'bird', 'fish', 'horse', 'cow', 'sheep', 'pig',
+        'elephant', 'lion', 'tiger', 'bear', 'wolf', 'fox', 'deer',
+        'rabbit', 'mouse', 'rat', 'hamster', 'squirrel', 'chipmunk',
+        'beaver', 'otter', 'weasel', 'skunk', 'badger', 'raccoon',
+        'panda', 'koala', 'kangaroo', 'monkey', 'ape', 'gorilla',
+        'chimpanzee', 'orangutan', 'lemur', 'sloth', 'anteater',
+        'armadillo', 'hedgehog', 'porcupine', 'platypus', 'echidna'
+    ],
+    '建物': [
+        'house', 'building', 'bridge', 'tower', 'castle', 'palace',
+        'church', 'temple', 'mosque', 'synagogue', 'cathedral',
+        'skyscraper', 'office', 'school', 'hospital', 'library',
+        'museum', 'theater', 'stadium', 'airport', 'station',
+        'hotel', 'restaurant', 'shop', 'store', 'market', 'mall'
+    ],
+    '乗り物': [
+        'car', 'truck', 'bus', 'van', 'motorcycle', 'bicycle',
+        'airplane', 'helicopter', 'boat', 'ship', 'yacht',
+        'train', 'subway', 'tram', 'taxi', 'ambulance', 'fire',
+        'police', 'tank', 'tractor', 'bulldozer', 'crane'
+    ],
+    '自然': [
+        'mountain', 'hill', 'valley', 'forest', 'tree', 'flower',
+        'grass', 'leaf', 'branch', 'root', 'bark', 'wood',
+        'ocean', 'sea', 'lake', 'river', 'stream', 'waterfall',
+        'beach', 'desert', 'canyon', 'cave', 'volcano', 'island',
+        'sky', 'cloud', 'sun', 'moon', 'star', 'rainbow',
+        'snow', 'ice', 'rock', 'stone', 'sand', 'dirt'
+    ],
+    '食べ物': [
+        'food', 'meal', 'dish', 'plate', 'bowl', 'cup', 'glass',
+        'bread', 'cake', 'cookie', 'pie', 'pizza', 'sandwich',
+        'burger', 'hotdog', 'sausage', 'bacon', 'ham', 'chicken',
+        'beef', 'pork', 'fish', 'shrimp', 'lobster', 'crab',
+        'apple', 'banana', 'orange', 'grape', 'strawberry',
+        'vegetable', 'carrot', 'potato', 'tomato', 'onion',
+        'lettuce', 'cabbage', 'broccoli', 'corn', 'pepper'
+    ],
+    'アニメ・イラスト': [
+        'comic book', 'cartoon', 'drawing', 'illustration',
+        'sketch', 'painting', 'artwork', 'manga', 'anime',
+        'book', 'magazine', 'poster', 'print', 'picture', 'image',
+        'envelope', 'paper', 'handkerchief', 'mask', 'towel'
+    ],
+    'テクノロジー': [
+        'computer', 'laptop', 'desktop', 'monitor', 'keyboard',
+        'mouse', 'phone', 'smartphone', 'tablet', 'camera',
+        'television', 'tv', 'radio', 'speaker', 'headphone',
+        'microphone', 'printer', 'scanner', 'router', 'modem',
+        'hardware', 'software', 'gadget', 'device', 'machine'
+    ],
+    'ファッション': [
+        'clothing', 'shirt', 'dress', 'pants', 'jeans', 'skirt',
+        'jacket', 'coat', 'sweater', 'hoodie', 't-shirt',
+        'shoes', 'boots', 'sneakers', 'sandals', 'heels',
+        'gloves', 'scarf', 'tie', 'belt', 'watch', 'jewelry', 
+        'ring', 'necklace', 'earring', 'bracelet', 'bag', 'purse', 'backpack'
+    ],
+    'スポーツ': [
+        'sports', 'game', 'ball', 'football', 'soccer', 'basketball',
+        'tennis', 'baseball', 'golf', 'hockey', 'cricket',
+        'volleyball', 'badminton', 'ping', 'pong', 'rugby',
+        'swimming', 'running', 'cycling', 'skiing', 'skating',
+        'surfing', 'diving', 'boxing', 'wrestling', 'martial',
+        'gym', 'fitness', 'exercise', 'workout', 'training'
+    ]
+}
+
+# カテゴリーごとの重み（人物とアニメ・イラストを優先）
+BROAD_CATEGORY_WEIGHTS: Dict[str, float] = {
+    '人物': 2.0,  # 2倍の重み
+    'アニメ・イラスト': 1.5,  # 1.5倍の重み
+}
+
+
+class CategoryMatrix:
+    """カテゴリー×クラスの対応行列
+
+    クラス名にカテゴリーのキーワードが含まれる位置を1とする。
+    softmax出力（バッチ×クラス）との行列積でカテゴリーごとの合計を求め、カテゴリーの重みを掛ける。
+    合計・重み付けの順序と精度（float32）は、クラスごとに足し合わせていた従来の計算に合わせている。
+    """
+
+    def __init__(self, class_names: Mapping[int, str],
+                 category_mapping: Dict[str, List[str]] = BROAD_CATEGORY_MAPPING,
+                 category_weights: Dict[str, float] = BROAD_CATEGORY_WEIGHTS):
+        self.categories: Tuple[str, ...] = tuple(category_mapping.keys())
+
+        num_classes = max(class_names.keys()) + 1 if class_names else 0
+        matrix = np.zeros((len(self.categories), num_classes), dtype=np.float32)
+        for row, keywords in enumerate(category_mapping.values()):
+            for idx, class_name in class_names.items():
+                lowered = class_name.lower()
+                if any(keyword in lowered for keyword in keywords):
+                    matrix[row, idx] = 1.0
+
+        weights = np.array([category_weights.get(category, 1.0) for category in self.categories], dtype=np.float32)
+        matrix.setflags(write=False)
+        weights.setflags(write=False)
+        self.matrix = matrix
+        self.weights = weights
+
+    def scores(self, predictions: np.ndarray) -> np.ndarray:
+        """softmax出力（バッチ×クラス）からカテゴリーの信頼度（バッチ×カテゴリー）を計算"""
+        num_classes = min(predictions.shape[1], self.matrix.shape[1])
+        totals = predictions[:, :num_classes].astype(np.float32, copy=False) @ self.matrix[:, :num_classes].T
+        return totals * self.weights
@@ -0,0 +1,234 @@
+"""
+画像デコードプール
+一括解析で、画像のデコード・前処理を別プロセスで先行して行い、推論と並行させる
+
+デコード結果のテンソルは共有メモリ上のスロットに直接書き込み、プロセス間では
+スロット番号だけを受け渡す（テンソルをpickleしてコピーしない）。
+スロット数が先読みの上限（キューの長さ）になり、推論が追いつかない場合はデコードが待つ。
+"""
+import atexit
+import logging
+import multiprocessing
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+from .preprocessing import PreprocessSpec, load_tensor
+
+logger = logging.getLogger(__name__)
+
+# スロット1つ分のテンソルの形状（C x H x W、float32）
+SLOT_SHAPE = (3, 224, 224)
+FLOAT32_BYTES = 4
+
+# ワーカープロセス側で開いている共有メモリ（名前 → SharedMemory）
+_worker_segments = {}
+
+
+def _attach_segment(name: str) -> shared_memory.SharedMemory:
+    """ワーカープロセスから共有メモリを開く（破棄は親プロセスが行う）"""
+    segment = _worker_segments.get(name)
+    if segment is None:
+        try:
+            segment = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python 3.12以前: spawnしたワーカーは親プロセスのresource_trackerを共有しているため
+            # 登録は重複するだけで、ワーカーの終了時には破棄されない
+            segment = shared_memory.SharedMemory(name=name)
+        _worker_segments[name] = segment
+    return segment
+
+
+def _decode_into_slot(segment_name: str, slot: int, image_path: str, spec: PreprocessSpec) -> int:
+    """ワーカープロセスで画像をデコードし、共有メモリのスロットにテンソルを書き込む"""
+    import numpy as np
+    import torch
+
+    segment = _attach_segment(segment_name)
+    slot_nbytes = int(np.prod(SLOT_SHAPE)) * FLOAT32_BYTES
+    buffer = np.ndarray(SLOT_SHAPE, dtype=np.float32, buffer=segment.buf, offset=slot * slot_nbytes)
+    load_tensor(image_path, spec, out=torch.from_numpy(buffer))
+    return slot
+
+
+def _init_worker(torch_threads: int) -> None:
+    """ワーカープロセスの初期化（プロセス数 x スレッド数でCPUを取り合わないようにする）"""
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+
+
+class DecodePool:
+    """画像のデコード・前処理を行うプロセスプール
+
+    imap()は入力順に (番号, テンソル, エラー, 解放関数) を返す。テンソルは共有メモリ上の
+    スロットを参照しているため、使い終わったら（推論の完了後に）解放関数を呼ぶ。
+    """
+
+    def __init__(self, num_workers: int, prefetch: int = 8):
+        self.num_workers = max(1, int(num_workers))
+        self.prefetch = max(1, int(prefetch))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._segment: Optional[shared_memory.SharedMemory] = None
+        self._slots = None
+        self._free_slots: "queue.Queue[int]" = queue.Queue()
+        self._lock = threading.Lock()
+
+    def _start(self) -> None:
+        """共有メモリとワーカープロセスを用意する（初回のみ）"""
+        with self._lock:
+            if self._executor is not None:
+                return
+
+            import numpy as np
+            import torch
+
+            slot_count = self.prefetch
+            slot_size = int(np.prod(SLOT_SHAPE))
+            self._segment = shared_memory.SharedMemory(create=True, size=slot_count * slot_size * FLOAT32_BYTES)
+            # 親プロセス側は共有メモリ全体を1つのテンソルとして参照する（スロットごとにコピーしない）
+            array = np.ndarray((slot_count,) + SLOT_SHAPE, dtype=np.float32, buffer=self._segment.buf)
+            self._slots = torch.from_numpy(array)
+            for slot in range(slot_count):
+                self._free_slots.put(slot)
+
+            # Webプロセスのスレッド・DB接続を引き継がないよう、forkではなくspawnで起動する
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(1,),
+            )
+            logger.info(f"画像デコードプール起動: {self.num_workers}プロセス, 先読み{slot_count}枚")
+
+    def close(self) -> None:
+        """ワーカープロセスを停止し、共有メモリを破棄する"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+            if self._segment is not None:
+                self._slots = None
+                self._segment.close()
+                self._segment.unlink()
+                self._segment = None
+            self._free_slots = queue.Queue()
+
+    def reset_after_fork(self) -> None:
+        """fork後の子プロセスで呼ぶ（親プロセスのワーカープロセス・共有メモリは親プロセスが破棄するため、参照だけを外す）"""
+        self._executor = None
+        self._segment = None
+        self._slots = None
+        self._free_slots = queue.Queue()
+        self._lock = threading.Lock()
+
+    def imap(self, image_paths: Iterable[str], spec: PreprocessSpec) -> Iterator[Tuple[int, object, Optional[Exception], Callable[[], None]]]:
+        """画像を並行してデコードし、入力順に (番号, テンソル, エラー, 解放関数) を返す"""
+        if (spec.crop_size,) * 2 != SLOT_SHAPE[1:]:
+            raise ValueError(f"デコードプールが対応していない入力サイズです: {spec.crop_size}")
+
+        self._start()
+        executor = self._executor
+        segment_name = self._segment.name
+        free_slots = self._free_slots
+        pending = deque()
+        remaining = iter(enumerate(image_paths))
+        exhausted = False
+
+        def submit(index: int, image_path: str, slot: int) -> None:
+            pending.append((index, slot, executor.submit(_decode_into_slot, segment_name, slot, image_path, spec)))
+
+        def acquire(block: bool) -> Optional[int]:
+            try:
+                return free_slots.get(block=block)
+            except queue.Empty:
+                return None
+
+        try:
+            while True:
+                # 空いているスロットの数だけ先にデコードを依頼する
+                while not exhausted and len(pending) < self.prefetch:
+                    slot = acquire(block=not pending)
+                    if slot is None:
+                        break
+                    item = next(remaining, None)
+                    if item is None:
+                        free_slots.put(slot)
+                        exhausted = True
+                        break
+                    submit(item[0], item[1], slot)
+
+                if not pending:
+                    return
+
+                index, slot, future = pending.popleft()
+                release = _SlotRelease(free_slots, slot)
+                try:
+                    future.result()
+                except BrokenProcessPool:
+                    release()
+                    self._reset_broken_pool()
+                    raise
+                except Exception as e:
+                    release()
+                    yield index, None, e, release
+                    continue
+                yield index, self._slots[slot], None, release
+        finally:
+            # 途中で中断された場合は実行中のデコードの完了を待ってスロットを戻す
+            for _, slot, future in pending:
+                try:
+                    future.result()
+                except Exception:
+                    pass
+                free_slots.put(slot)
+
+    def _reset_broken_pool(self) -> None:
+        logger.error("画像デコードプールのワーカーが異常終了しました。次回の解析で再起動します")
+        self.close()
+
+
+class _SlotRelease:
+    """スロットを1回だけ空きに戻す解放関数"""
+
+    __slots__ = ('_free_slots', '_slot', '_released', '_lock')
+
+    def __init__(self, free_slots: "queue.Queue[int]", slot: int):
+        self._free_slots = free_slots
+        self._slot = slot
+        self._released = False
+        self._lock = threading.Lock()
+
+    def __call__(self, *args) -> None:
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._free_slots.put(self._slot)
+
+
+_pools = []
+
+
+def create_decode_pool(num_workers: int, prefetch: int) -> Optional[DecodePool]:
+    """デコードプールを作成する（num_workersが0の場合は作成せず、呼び出し元のスレッドでデコードする）"""
+    if not num_workers:
+        return None
+    pool = DecodePool(num_workers, prefetch)
+    _pools.append(pool)
+    return pool
+
+
+@atexit.register
+def _close_pools() -> None:
+    for pool in _pools:
+        try:
+            pool.close()
+        except Exception:
+            pass
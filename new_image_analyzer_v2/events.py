@@ -0,0 +1,188 @@
+"""
+解析進捗イベント
+解析段階・ステータスの変化を購読中のストリーム（SSE）に配信する
+
+配信方式（ANALYSIS_EVENTS_BACKEND）
+- 'auto': DBがPostgreSQLの場合は 'postgres'、それ以外は 'local'
+- 'local': 同一プロセス内の購読者にのみ配信（Webプロセスが1つでワーカーもその中で動かす構成向け）
+- 'postgres': LISTEN/NOTIFYで配信し、別プロセスのワーカーからの変化も受け取る
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+from typing import Dict, Iterable, Optional, Set
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# LISTEN/NOTIFYのチャンネル名
+CHANNEL = 'analysis_progress'
+
+
+def _backend() -> str:
+    backend = getattr(settings, 'ANALYSIS_EVENTS_BACKEND', 'auto')
+    if backend == 'auto':
+        # 複数のWebプロセスがジョブを取り合うため、ストリームを配信するプロセスとは別のプロセスで解析されうる
+        return 'postgres' if connections['default'].vendor == 'postgresql' else 'local'
+    return backend
+
+
+class Subscription:
+    """ストリーム1本分の購読（購読したイベントループのキューにイベントが入る）"""
+
+    def __init__(self, image_ids: Iterable[int], loop: asyncio.AbstractEventLoop):
+        self.image_ids: Set[int] = {int(image_id) for image_id in image_ids}
+        self.loop = loop
+        self.queue: "asyncio.Queue[Dict]" = asyncio.Queue()
+
+    def deliver(self, event: Dict) -> None:
+        """任意のスレッドからイベントを渡す"""
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+        except RuntimeError:
+            # イベントループが終了済み（接続が切れた直後）
+            pass
+
+
+class ProgressBroker:
+    """画像IDごとの購読者にイベントを振り分けるプロセス内のブローカー"""
+
+    def __init__(self):
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, image_ids: Iterable[int]) -> Subscription:
+        """実行中のイベントループから呼び出し、指定画像のイベントを購読する"""
+        subscription = Subscription(image_ids, asyncio.get_running_loop())
+        with self._lock:
+            for image_id in subscription.image_ids:
+                self._subscribers.setdefault(image_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            for image_id in subscription.image_ids:
+                subscribers = self._subscribers.get(image_id)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[image_id]
+
+    def dispatch(self, event: Dict) -> None:
+        """イベントを該当画像の購読者に配信する"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(int(event['image_id']), ()))
+        for subscription in subscribers:
+            subscription.deliver(event)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len({s for subscribers in self._subscribers.values() for s in subscribers})
+
+
+broker = ProgressBroker()
+
+
+class PostgresListener:
+    """LISTENで受け取った通知をプロセス内のブローカーに転送するスレッド
+
+    通知待ちはDB接続1本で行い、イベントがない間はDBへのクエリを発行しない。
+    """
+
+    def __init__(self, target: ProgressBroker, channel: str = CHANNEL, poll_timeout: float = 5.0):
+        self.target = target
+        self.channel = channel
+        self.poll_timeout = poll_timeout
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """リスナースレッドを起動する（起動済みの場合は何もしない）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='analysis-events-listener', daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            db = connections.create_connection('default')
+            try:
+                db.ensure_connection()
+                db.set_autocommit(True)
+                with db.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.channel}')
+                logger.info(f"進捗イベントのLISTEN開始: {self.channel}")
+                self._listen(db.connection)
+            except Exception as e:
+                logger.error(f"進捗イベントのLISTENエラー（再接続します）: {e}")
+            finally:
+                try:
+                    db.close()
+                except Exception:
+                    pass
+            threading.Event().wait(self.poll_timeout)
+
+    def _listen(self, raw_connection) -> None:
+        if hasattr(raw_connection, 'poll'):
+            # psycopg2
+            while True:
+                if select.select([raw_connection], [], [], self.poll_timeout) == ([], [], []):
+                    continue
+                raw_connection.poll()
+                while raw_connection.notifies:
+                    self._forward(raw_connection.notifies.pop(0).payload)
+        else:
+            # psycopg 3
+            while True:
+                try:
+                    notifies = raw_connection.notifies(timeout=self.poll_timeout)
+                except TypeError:
+                    # psycopg 3.2未満はtimeoutを指定できない
+                    notifies = raw_connection.notifies()
+                for notify in notifies:
+                    self._forward(notify.payload)
+
+    def _forward(self, payload: str) -> None:
+        try:
+            self.target.dispatch(json.loads(payload))
+        except Exception as e:
+            logger.warning(f"進捗イベントの解析に失敗: {e}")
+
+
+_listener = PostgresListener(broker)
+
+
+def subscribe(image_ids: Iterable[int]) -> Subscription:
+    """画像の進捗イベントを購読する（イベントループ上で呼ぶ）"""
+    if _backend() == 'postgres':
+        _listener.start()
+    return broker.subscribe(image_ids)
+
+
+def unsubscribe(subscription: Subscription) -> None:
+    broker.unsubscribe(subscription)
+
+
+def publish(event: Dict) -> None:
+    """進捗イベントを配信する
+
+    トランザクション内で呼ばれた場合はコミット後に配信する（購読側がDBを読んだ時に
+    変更が見えるようにするため）。
+    """
+    def send():
+        if _backend() == 'postgres':
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, json.dumps(event)])
+            except Exception as e:
+                logger.warning(f"進捗イベントの通知に失敗: {e}")
+        else:
+            broker.dispatch(event)
+
+    transaction.on_commit(send)
@@ -0,0 +1,206 @@
+"""
+解析の実行リソース管理
+推論に使うスレッド数・CPUの割り当て・同時に実行する推論の数（推論スロット）を設定する
+
+PyTorchは既定でコア数と同じ数のスレッドで推論するため、gunicornのワーカー・解析ワーカースレッド・
+推論エンジンのスレッドがそれぞれ同時に推論すると、コア数を大きく超えるスレッドがCPUを奪い合う。
+ワーカーごとにスレッド数とCPUを割り当て、プロセス内で同時に実行する推論の数を制限する。
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# このプロセスに適用した設定（統計情報として返す）
+_process_config: Dict = {'configured': False}
+_process_config_lock = threading.Lock()
+
+
+def parse_cpu_list(value: str) -> List[int]:
+    """'0-3,8,10-11' 形式のCPU番号のリストを展開する"""
+    cpus = []
+    for part in str(value).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return sorted(set(cpus))
+
+
+def get_available_cpus() -> List[int]:
+    """このプロセスが使用できるCPU番号"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def split_cpus(cpus: Sequence[int], worker_index: int, num_workers: int) -> List[int]:
+    """CPUをワーカー数で等分し、worker_index番目のワーカーの分を返す（CPUよりワーカーが多い場合は重複させる）"""
+    cpus = list(cpus)
+    num_workers = max(1, num_workers)
+    if num_workers >= len(cpus):
+        return [cpus[worker_index % len(cpus)]]
+    size, extra = divmod(len(cpus), num_workers)
+    start = worker_index * size + min(worker_index, extra)
+    return cpus[start:start + size + (1 if worker_index < extra else 0)]
+
+
+def configure_torch_threads(num_threads: Optional[int], interop_threads: Optional[int]) -> None:
+    """推論のスレッド数（演算内の並列数）と、演算間の並列数を設定する"""
+    try:
+        import torch
+    except ImportError:
+        return
+
+    if num_threads:
+        torch.set_num_threads(int(num_threads))
+    if interop_threads:
+        try:
+            torch.set_interop_threads(int(interop_threads))
+        except RuntimeError as e:
+            # 演算間の並列処理を一度でも実行した後（forkしたワーカーなど）は変更できない
+            logger.warning(f"演算間のスレッド数を変更できませんでした: {e}")
+
+
+def configure_process(cpus: Optional[Sequence[int]] = None) -> Dict:
+    """このプロセスのCPUの割り当てと推論のスレッド数を設定する
+
+    cpusを指定した場合はそのCPUだけで実行し、ANALYSIS_TORCH_THREADSが未指定であれば
+    推論のスレッド数を割り当てたCPUの数にする。
+    """
+    if cpus:
+        if hasattr(os, 'sched_setaffinity'):
+            # 以降に起動するスレッド（PyTorchのスレッドプールを含む）は割り当てを引き継ぐ
+            os.sched_setaffinity(0, cpus)
+        else:
+            logger.warning("このOSではCPUの割り当てに対応していません")
+
+    num_threads = getattr(settings, 'ANALYSIS_TORCH_THREADS', None) or (len(cpus) if cpus else None)
+    interop_threads = getattr(settings, 'ANALYSIS_TORCH_INTEROP_THREADS', None)
+    configure_torch_threads(num_threads, interop_threads)
+
+    _process_config.update({
+        'configured': True,
+        'cpus': list(cpus) if cpus else None,
+        'torch_threads': num_threads,
+        'interop_threads': interop_threads,
+    })
+    logger.info(f"実行リソース設定: CPU={_process_config['cpus']}, スレッド数={num_threads}, 演算間スレッド数={interop_threads}")
+    return dict(_process_config)
+
+
+def ensure_process_configured() -> None:
+    """まだ設定していなければ、CPUを割り当てずにスレッド数だけ設定する（gunicorn以外で起動した場合）
+
+    モデルの初回読み込み時に呼ばれる（インポート時に呼ぶと、gunicornではワーカーより先にマスターを設定してしまう）。
+    """
+    if _process_config['configured']:
+        return
+    with _process_config_lock:
+        if not _process_config['configured']:
+            configure_process()
+
+
+def configure_worker(worker_index: int, num_workers: int) -> Dict:
+    """gunicornのワーカーごとの設定（ANALYSIS_CPU_AFFINITYに従ってCPUを割り当てる）
+
+    - None: 割り当てない
+    - 'auto': 使用できるCPUをワーカー数で等分する
+    - ['0-3', '4-7', ...]: ワーカー番号順に指定する（ワーカー数より少ない場合は繰り返す）
+    """
+    affinity = getattr(settings, 'ANALYSIS_CPU_AFFINITY', None)
+    cpus = None
+    if affinity == 'auto':
+        cpus = split_cpus(get_available_cpus(), worker_index, num_workers)
+    elif affinity:
+        cpus = parse_cpu_list(affinity[worker_index % len(affinity)])
+    return configure_process(cpus)
+
+
+def get_process_config() -> Dict:
+    try:
+        import torch
+        threads = {'current_torch_threads': torch.get_num_threads(), 'current_interop_threads': torch.get_num_interop_threads()}
+    except ImportError:
+        threads = {}
+    return {**_process_config, **threads}
+
+
+class InferenceSlots:
+    """プロセス内で同時に実行する推論の数を制限するセマフォ
+
+    スロットの空き待ちの時間を記録する。slotsがNone（無制限）の場合も実行数は記録する。
+    """
+
+    # この時間以上待った場合に「待ちが発生した」とみなす（秒）
+    WAIT_THRESHOLD = 0.001
+
+    def __init__(self, slots: Optional[int] = None):
+        self.slots = int(slots) if slots else None
+        self._init_state()
+
+    def _init_state(self) -> None:
+        self._semaphore = threading.BoundedSemaphore(self.slots) if self.slots else None
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.waiting = 0
+        self.acquired = 0
+        self.waited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def reset_after_fork(self) -> None:
+        """fork後の子プロセスで呼ぶ（親プロセスで取得中だったスロットは子プロセスでは解放されないため作り直す）"""
+        self._init_state()
+
+    @contextmanager
+    def acquire(self):
+        """スロットを1つ取得して推論を実行する（空きがなければ待つ）"""
+        started = time.perf_counter()
+        if self._semaphore is not None:
+            with self._lock:
+                self.waiting += 1
+            try:
+                self._semaphore.acquire()
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+        wait = time.perf_counter() - started
+
+        with self._lock:
+            self.in_use += 1
+            self.acquired += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            if wait >= self.WAIT_THRESHOLD:
+                self.waited += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'slots': self.slots,
+                'in_use': self.in_use,
+                'waiting': self.waiting,
+                'acquired': self.acquired,
+                'waited': self.waited,
+                'total_wait_seconds': self.total_wait,
+                'average_wait_ms': (self.total_wait / self.acquired * 1000.0) if self.acquired else 0.0,
+                'max_wait_ms': self.max_wait * 1000.0,
+            }
@@ -0,0 +1,146 @@
+"""
+推論エンジン（動的マイクロバッチ）
+同じモデルへの推論リクエストを一定時間・一定件数まで集めて1回の推論（バッチ）で処理する
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingRequest:
+    """バッチ待ちの推論リクエスト"""
+
+    __slots__ = ('item', 'future', 'enqueued_at')
+
+    def __init__(self, item: Any):
+        self.item = item
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class InferenceEngine:
+    """モデルごとにリクエストを集めてバッチ推論するエンジン
+
+    batch_fn(model_key, items) はitemsと同じ長さ・同じ順序の結果を返す関数。
+    バッチはmax_batch_sizeに達した時点、または最初のリクエストからmax_wait_ms
+    経過した時点で実行される。max_batch_sizeが1の場合は呼び出し元のスレッドで直接実行する。
+    """
+
+    def __init__(self, batch_fn: Callable[[str, List[Any]], Sequence[Any]],
+                 max_batch_size: int = 16, max_wait_ms: float = 5.0):
+        self._batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queues: Dict[str, "queue.Queue[_PendingRequest]"] = {}
+        self._workers: Dict[str, threading.Thread] = {}
+        self._lock = threading.Lock()
+
+        # 統計情報
+        self.batches = 0
+        self.items = 0
+        self.max_observed_batch = 0
+
+    def submit(self, model_key: str, item: Any) -> Future:
+        """推論リクエストを登録し、結果を受け取るFutureを返す"""
+        if self.max_batch_size == 1:
+            # バッチ化しない場合は待ち合わせなしで実行
+            request = _PendingRequest(item)
+            self._run_batch(model_key, [request])
+            return request.future
+
+        request = _PendingRequest(item)
+        self._get_queue(model_key).put(request)
+        return request.future
+
+    def infer(self, model_key: str, item: Any, timeout: float = None) -> Any:
+        """1件の推論を実行して結果を返す（他のリクエストとまとめてバッチ処理される）"""
+        return self.submit(model_key, item).result(timeout=timeout)
+
+    def infer_many(self, model_key: str, items: Sequence[Any], timeout: float = None) -> List[Any]:
+        """複数件の推論をまとめて登録し、全ての結果を返す"""
+        futures = [self.submit(model_key, item) for item in items]
+        return [future.result(timeout=timeout) for future in futures]
+
+    def stats(self) -> Dict:
+        """バッチ処理の統計情報"""
+        with self._lock:
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'batches': self.batches,
+                'items': self.items,
+                'average_batch_size': (self.items / self.batches) if self.batches else 0.0,
+                'max_observed_batch': self.max_observed_batch,
+                'pending': {key: q.qsize() for key, q in self._queues.items()},
+            }
+
+    def reset_after_fork(self) -> None:
+        """fork後の子プロセスで呼ぶ（親プロセスのワーカースレッドは子プロセスに存在しないため、キューごと作り直す）"""
+        self._queues = {}
+        self._workers = {}
+        self._lock = threading.Lock()
+
+    def _get_queue(self, model_key: str) -> "queue.Queue[_PendingRequest]":
+        """モデルごとのキューを取得（初回はワーカースレッドも起動）"""
+        q = self._queues.get(model_key)
+        if q is not None:
+            return q
+
+        with self._lock:
+            q = self._queues.get(model_key)
+            if q is None:
+                q = queue.Queue()
+                worker = threading.Thread(
+                    target=self._worker_loop,
+                    args=(model_key, q),
+                    name=f'inference-{model_key}',
+                    daemon=True,
+                )
+                self._queues[model_key] = q
+                self._workers[model_key] = worker
+                worker.start()
+            return q
+
+    def _worker_loop(self, model_key: str, q: "queue.Queue[_PendingRequest]") -> None:
+        """キューからリクエストを集めてバッチを実行し続ける"""
+        while True:
+            batch = [q.get()]
+            deadline = time.perf_counter() + self.max_wait
+
+            # 上限件数に達するか待ち時間を過ぎるまで集める
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    if remaining <= 0:
+                        batch.append(q.get_nowait())
+                    else:
+                        batch.append(q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._run_batch(model_key, batch)
+
+    def _run_batch(self, model_key: str, batch: List[_PendingRequest]) -> None:
+        """1回の推論でバッチを処理し、各リクエストに結果を返す"""
+        try:
+            outputs = self._batch_fn(model_key, [request.item for request in batch])
+            if len(outputs) != len(batch):
+                raise RuntimeError(f"バッチ推論の結果数が一致しません: {len(outputs)} != {len(batch)}")
+        except Exception as e:
+            logger.error(f"バッチ推論エラー: {model_key} (件数={len(batch)}): {e}")
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        with self._lock:
+            self.batches += 1
+            self.items += len(batch)
+            self.max_observed_batch = max(self.max_observed_batch, len(batch))
+
+        for request, output in zip(batch, outputs):
+            request.future.set_result(output)
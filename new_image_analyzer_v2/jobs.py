@@ -0,0 +1,299 @@
+"""
+解析ジョブキューとワーカー
+解析リクエストをDBのジョブテーブルに登録し、固定数のワーカーが取得して実行する
+ジョブはDBに残るため、ワーカープロセスが再起動しても失われない
+"""
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import TransAnalysisJob, TransUploadedImage
+from .progress import notify_images
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def enqueue_analysis_jobs(image_ids: Iterable[int], model_name: str) -> List[TransAnalysisJob]:
+    """画像ごとの解析ジョブを登録する"""
+    max_attempts = _setting('ANALYSIS_JOB_MAX_ATTEMPTS', 3)
+    jobs = TransAnalysisJob.objects.bulk_create([
+        TransAnalysisJob(image_id_id=image_id, model_name=model_name, max_attempts=max_attempts)
+        for image_id in image_ids
+    ])
+    image_ids = [job.image_id_id for job in jobs]
+    TransUploadedImage.objects.filter(image_id__in=image_ids).update(analysis_stage='queued')
+    notify_images(image_ids)
+    logger.info(f"解析ジョブ登録: {len(jobs)}件, モデル={model_name}")
+    return jobs
+
+
+def _lease_expired_at(now):
+    return now - timedelta(seconds=_setting('ANALYSIS_JOB_LEASE_SECONDS', 600))
+
+
+def fail_expired_jobs() -> List[int]:
+    """ロック期限を過ぎ、再実行の上限に達した実行中ジョブを失敗にする（失敗にした画像IDを返す）
+
+    ワーカーが異常終了（巨大な画像でのOOMなど）したジョブは fail_job が呼ばれないため、
+    ここで失敗にしないと画像が解析中のまま残る。
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        expired = list(
+            TransAnalysisJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(status='running', locked_at__lt=_lease_expired_at(now), attempts__gte=F('max_attempts'))
+            .values_list('job_id', 'image_id')
+        )
+        if not expired:
+            return []
+
+        job_ids = [job_id for job_id, _ in expired]
+        image_ids = [image_id for _, image_id in expired]
+        TransAnalysisJob.objects.filter(job_id__in=job_ids).update(
+            status='failed', last_error='ワーカーが処理中に終了しました（再実行上限）', updated_at=now
+        )
+        TransUploadedImage.objects.filter(image_id__in=image_ids).update(status='failed')
+
+    notify_images(image_ids)
+    logger.error(f"解析ジョブ失敗（ロック期限切れ・再実行上限）: ジョブID={job_ids}")
+    return image_ids
+
+
+def claim_next_jobs(worker_id: str, limit: int = 1) -> List[TransAnalysisJob]:
+    """実行可能なジョブを最大limit件取得して実行中にする
+
+    最も古いジョブと同じモデルのジョブだけをまとめて取得する（まとめてデコード・バッチ推論するため）。
+    SELECT ... FOR UPDATE SKIP LOCKED で取得するため、複数のワーカー（別プロセスを含む）が
+    同時に取得しても同じジョブを二重に実行しない。ロック期限を過ぎた実行中ジョブ
+    （ワーカーが異常終了したもの）も、再実行の上限に達していなければ再取得の対象とする。
+    上限に達したものは fail_expired_jobs で失敗にする。
+    """
+    fail_expired_jobs()
+
+    now = timezone.now()
+    runnable = (
+        Q(status='queued', available_at__lte=now) |
+        Q(status='running', locked_at__lt=_lease_expired_at(now), attempts__lt=F('max_attempts'))
+    )
+
+    with transaction.atomic():
+        candidates = TransAnalysisJob.objects.select_for_update(skip_locked=True).filter(runnable)
+        job = candidates.order_by('available_at', 'job_id').first()
+        if job is None:
+            return []
+
+        jobs = [job]
+        if limit > 1:
+            jobs += list(
+                candidates
+                .filter(model_name=job.model_name)
+                .exclude(job_id=job.job_id)
+                .order_by('available_at', 'job_id')[:limit - 1]
+            )
+
+        TransAnalysisJob.objects.filter(job_id__in=[job.job_id for job in jobs]).update(
+            status='running', locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1, updated_at=now
+        )
+        for job in jobs:
+            job.status = 'running'
+            job.locked_by = worker_id
+            job.locked_at = now
+            job.attempts += 1
+            job.updated_at = now
+
+    return jobs
+
+
+def claim_next_job(worker_id: str) -> Optional[TransAnalysisJob]:
+    """実行可能なジョブを1件取得して実行中にする（ない場合はNone）"""
+    jobs = claim_next_jobs(worker_id, 1)
+    return jobs[0] if jobs else None
+
+
+def complete_job(job: TransAnalysisJob, timings: Optional[Dict[str, float]] = None) -> None:
+    """ジョブを完了にする（段階ごとの処理時間を記録する）"""
+    job.status = 'succeeded'
+    job.last_error = None
+    job.timings = timings
+    job.save(update_fields=['status', 'last_error', 'timings', 'updated_at'])
+
+
+def fail_job(job: TransAnalysisJob, error: str) -> None:
+    """ジョブの失敗を記録する（上限回数までは指数バックオフで再実行）"""
+    job.last_error = error
+    if job.attempts < job.max_attempts:
+        backoff = _setting('ANALYSIS_JOB_RETRY_BACKOFF_SECONDS', 5) * (2 ** (job.attempts - 1))
+        job.status = 'queued'
+        job.available_at = timezone.now() + timedelta(seconds=backoff)
+        job.save(update_fields=['status', 'last_error', 'available_at', 'updated_at'])
+        # 再実行待ちの間は準備中として表示
+        TransUploadedImage.objects.filter(image_id=job.image_id_id).update(status='preparing', analysis_stage='queued')
+        notify_images([job.image_id_id])
+        logger.warning(f"解析ジョブ失敗（{backoff}秒後に再実行）: ジョブID={job.job_id}, 試行={job.attempts}/{job.max_attempts}: {error}")
+    else:
+        job.status = 'failed'
+        job.save(update_fields=['status', 'last_error', 'updated_at'])
+        TransUploadedImage.objects.filter(image_id=job.image_id_id).update(status='failed')
+        notify_images([job.image_id_id])
+        logger.error(f"解析ジョブ失敗（再実行上限）: ジョブID={job.job_id}: {error}")
+
+
+def run_job(job: TransAnalysisJob) -> None:
+    """ジョブを実行して結果を記録する"""
+    from .views.helpers import run_image_analysis
+
+    try:
+        timings = run_image_analysis(job.image_id_id, job.model_name)
+    except Exception as e:
+        fail_job(job, str(e))
+    else:
+        complete_job(job, timings)
+
+
+def run_jobs(jobs: List[TransAnalysisJob]) -> None:
+    """同じモデルのジョブをまとめて実行する
+
+    2件以上の場合は画像のデコード（デコードプール）と推論をまとめて行い、画像ごとに成否を記録する。
+    """
+    if len(jobs) == 1:
+        run_job(jobs[0])
+        return
+
+    from .views.helpers import run_batch_image_analysis
+
+    try:
+        outcomes = run_batch_image_analysis([job.image_id_id for job in jobs], jobs[0].model_name)
+    except Exception as e:
+        for job in jobs:
+            fail_job(job, str(e))
+        return
+
+    for job in jobs:
+        outcome = outcomes[job.image_id_id]
+        if isinstance(outcome, Exception):
+            fail_job(job, str(outcome))
+        else:
+            complete_job(job, outcome)
+
+
+class AnalysisWorkerPool:
+    """固定数のワーカースレッドでジョブを実行するプール
+
+    各ワーカーは同じモデルのジョブを最大batch_size件まとめて取得して実行する。
+    """
+
+    def __init__(self, num_workers: int, poll_interval: float = 1.0, name: str = None, batch_size: int = 1):
+        self.num_workers = max(1, int(num_workers))
+        self.poll_interval = poll_interval
+        self.batch_size = max(1, int(batch_size))
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self._threads: List[threading.Thread] = []
+        self._stop_event = threading.Event()
+        self._wakeup_event = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def is_running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self) -> None:
+        """ワーカースレッドを起動する（起動済みの場合は何もしない）"""
+        with self._lock:
+            if self.is_running:
+                return
+            self._stop_event.clear()
+            self._threads = [
+                threading.Thread(
+                    target=self._worker_loop,
+                    args=(f'{self.name}-{i}',),
+                    name=f'analysis-worker-{i}',
+                    daemon=True,
+                )
+                for i in range(self.num_workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+            logger.info(f"解析ワーカー起動: {self.num_workers}スレッド ({self.name})")
+
+    def notify(self) -> None:
+        """新しいジョブが登録されたことを待機中のワーカーに知らせる"""
+        self._wakeup_event.set()
+
+    def stop(self, timeout: float = None) -> None:
+        """ワーカーを停止する（実行中のジョブは完了まで待つ）"""
+        self._stop_event.set()
+        self._wakeup_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        logger.info(f"解析ワーカー停止: {self.name}")
+
+    def join(self) -> None:
+        for thread in self._threads:
+            thread.join()
+
+    def _worker_loop(self, worker_id: str) -> None:
+        while not self._stop_event.is_set():
+            try:
+                close_old_connections()
+                jobs = claim_next_jobs(worker_id, self.batch_size)
+                if not jobs:
+                    # ジョブがない場合は通知またはポーリング間隔まで待機
+                    self._wakeup_event.wait(self.poll_interval)
+                    self._wakeup_event.clear()
+                    continue
+
+                logger.info(
+                    f"解析ジョブ開始: ジョブID={[job.job_id for job in jobs]}, "
+                    f"画像ID={[job.image_id_id for job in jobs]}, ワーカー={worker_id}"
+                )
+                run_jobs(jobs)
+            except Exception as e:
+                logger.error(f"解析ワーカーエラー: {worker_id}: {e}")
+                self._stop_event.wait(self.poll_interval)
+        close_old_connections()
+
+
+_worker_pool: Optional[AnalysisWorkerPool] = None
+_worker_pool_lock = threading.Lock()
+
+
+def get_worker_pool() -> AnalysisWorkerPool:
+    """プロセス内のワーカープールを取得（初回に作成）"""
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = AnalysisWorkerPool(
+                num_workers=_setting('ANALYSIS_WORKER_COUNT', 2),
+                poll_interval=_setting('ANALYSIS_WORKER_POLL_INTERVAL', 1.0),
+                batch_size=_setting('ANALYSIS_WORKER_BATCH_SIZE', 8),
+            )
+        return _worker_pool
+
+
+def dispatch_analysis_jobs(image_ids: Iterable[int], model_name: str) -> List[TransAnalysisJob]:
+    """解析ジョブを登録し、プロセス内ワーカーを使う設定ならワーカーを起こす"""
+    jobs = enqueue_analysis_jobs(image_ids, model_name)
+
+    # 'thread': Webプロセス内のワーカーで実行 / 'external': run_analysis_workersコマンドで実行
+    if _setting('ANALYSIS_WORKER_MODE', 'thread') == 'thread':
+        # コミット後に通知しないとワーカーからジョブが見えない
+        def wake_workers():
+            pool = get_worker_pool()
+            pool.start()
+            pool.notify()
+        transaction.on_commit(wake_workers)
+
+    return jobs
@@ -0,0 +1,64 @@
+"""
+画像ハッシュ補完コマンド
+内容ダイジェスト（SHA-256）・知覚ハッシュ（dHash）が未計算の既存画像について計算して保存する
+
+使用例:
+    python manage.py backfill_image_hashes --batch-size 500
+"""
+import hashlib
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from ...models import TransUploadedImage
+from ...near_duplicates import compute_dhash
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Command(BaseCommand):
+    help = '内容ダイジェスト・知覚ハッシュが未計算の画像について計算して保存します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='1回の更新で保存する件数')
+
+    def handle(self, *args, **options):
+        images = (
+            TransUploadedImage.objects
+            .filter(Q(content_digest='') | Q(perceptual_hash=''))
+            .only('image_id', 'file_path', 'content_digest', 'perceptual_hash')
+            .order_by('image_id')
+        )
+
+        updated = []
+        missing = 0
+        total = 0
+        for image in images.iterator():
+            try:
+                if not image.content_digest:
+                    image.content_digest = _file_digest(image.file_path)
+                if not image.perceptual_hash:
+                    image.perceptual_hash = compute_dhash(image.file_path)
+            except (OSError, ValueError) as e:
+                missing += 1
+                self.stderr.write(f"スキップ: 画像ID={image.image_id}: {e}")
+                continue
+
+            updated.append(image)
+            if len(updated) >= options['batch_size']:
+                total += self._save(updated)
+                updated = []
+
+        total += self._save(updated)
+        self.stdout.write(self.style.SUCCESS(f"ハッシュを保存しました: {total}件（スキップ: {missing}件）"))
+
+    def _save(self, images):
+        if images:
+            TransUploadedImage.objects.bulk_update(images, ['content_digest', 'perceptual_hash'])
+        return len(images)
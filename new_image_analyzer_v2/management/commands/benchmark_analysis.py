@@ -0,0 +1,306 @@
+"""
+解析のベンチマークコマンド
+合成したJPEG・PNG・GIF画像を各モデルで解析し、コールドスタート時間・1枚あたりのレイテンシ（p50/p95/p99）・
+スループット（枚/秒）をバッチサイズ・スレッド数ごとに計測してJSONで出力する
+
+- コールドスタート: モデルを破棄した状態から読み込みが完了するまでの時間
+- レイテンシ: 画像の解析を依頼してから結果が得られるまでの時間（デコード・前処理・推論・後処理を含む。
+  バッチの場合はバッチ全体の完了までの時間がバッチ内の各画像のレイテンシになる）
+- スループット: 計測した画像数 / 全体の処理時間
+
+--compareに以前のJSONを指定すると、同じ条件（モデル・バッチサイズ・スレッド数）の結果と比較し、
+比較結果も出力するJSONの 'comparison' に含める。--fail-on-regression を指定すると回帰があった場合に
+終了コード1で終了するため、CIで繰り返し実行して前回の結果と比較できる。
+
+出力するJSONの形式（format_version: 1）:
+    {
+      "format_version": 1,
+      "meta": {"timestamp", "git_commit", "python", "torch", "platform", "cpu_count", "model_backend", "inputs"},
+      "results": [{"model", "internal_model", "cold_start_seconds", "cases": [
+          {"batch_size", "threads", "images", "errors", "p50_ms", "p95_ms", "p99_ms", "mean_ms", "images_per_second"}
+      ]}],
+      "comparison": {"baseline", "baseline_commit", "regression_threshold_percent", "regressions", "cases": [
+          {"model", "batch_size", "threads", "before", "after", "throughput_change_percent", "p50_change_percent", "regression"}
+      ]}  # --compare指定時のみ
+    }
+形式を変更する場合は BENCHMARK_FORMAT_VERSION を上げる（異なる形式の結果とは比較しない）。
+
+使用例:
+    python manage.py benchmark_analysis --output benchmark.json
+    python manage.py benchmark_analysis --models resnet50 mobilenet --batch-sizes 1 8 64 --threads 1 4 --compare baseline.json
+    python manage.py benchmark_analysis --compare baseline.json --fail-on-regression > benchmark.json
+"""
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image as PILImage
+
+# 出力するJSONの形式のバージョン
+BENCHMARK_FORMAT_VERSION = 1
+
+FORMATS = {
+    'jpeg': ('JPEG', '.jpg'),
+    'png': ('PNG', '.png'),
+    'gif': ('GIF', '.gif'),
+}
+
+
+def _default_threads():
+    cpu_count = os.cpu_count() or 1
+    threads = [1]
+    while threads[-1] * 2 < cpu_count:
+        threads.append(threads[-1] * 2)
+    if threads[-1] != cpu_count:
+        threads.append(cpu_count)
+    return threads
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True, timeout=10,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare_reports(report, baseline, threshold):
+    """同じ条件（モデル・バッチサイズ・スレッド数）の計測結果を比較する
+
+    スループットがthreshold（%）以上低下した条件を回帰とする。異なる形式の結果はValueError。
+    format_versionがない結果は、バージョンを付ける前の同じ形式（1）として扱う。
+    """
+    baseline_version = baseline.get('format_version', 1)
+    if baseline_version != report.get('format_version'):
+        raise ValueError(f"結果の形式が異なるため比較できません: {baseline_version} != {report.get('format_version')}")
+
+    def index(data):
+        return {
+            (result['model'], case['batch_size'], case['threads']): case
+            for result in data.get('results', [])
+            for case in result.get('cases', [])
+        }
+
+    previous = index(baseline)
+    cases = []
+    for (model, batch_size, threads), case in index(report).items():
+        before = previous.get((model, batch_size, threads))
+        if before is None:
+            continue
+        throughput_change = (case['images_per_second'] / before['images_per_second'] - 1) * 100
+        cases.append({
+            'model': model,
+            'batch_size': batch_size,
+            'threads': threads,
+            'before': {key: before[key] for key in ('p50_ms', 'p95_ms', 'p99_ms', 'images_per_second')},
+            'after': {key: case[key] for key in ('p50_ms', 'p95_ms', 'p99_ms', 'images_per_second')},
+            'throughput_change_percent': throughput_change,
+            'p50_change_percent': (case['p50_ms'] / before['p50_ms'] - 1) * 100,
+            'regression': throughput_change <= -threshold,
+        })
+
+    return {
+        'baseline_commit': baseline.get('meta', {}).get('git_commit'),
+        'regression_threshold_percent': threshold,
+        'regressions': sum(1 for case in cases if case['regression']),
+        'cases': cases,
+    }
+
+
+class Command(BaseCommand):
+    help = '各モデルのコールドスタート時間・レイテンシ・スループットを計測してJSONで出力します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--models', nargs='+', default=['resnet50', 'mobilenet', 'efficientnet', 'vgg16', 'clip'],
+                            help='計測するモデル（フロントエンドのモデル名）')
+        parser.add_argument('--formats', nargs='+', choices=sorted(FORMATS), default=sorted(FORMATS), help='合成する画像の形式')
+        parser.add_argument('--sizes', nargs='+', default=['640x480', '1920x1080', '4032x3024'],
+                            help='合成する画像のサイズ（幅x高さ）')
+        parser.add_argument('--images', type=int, default=64, help='1つの条件で解析する画像の枚数')
+        parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 4, 16, 64], help='計測するバッチサイズ')
+        parser.add_argument('--threads', nargs='+', type=int, default=_default_threads(), help='計測する推論のスレッド数')
+        parser.add_argument('--output', default=None, help='結果を書き出すJSONファイル（省略時は標準出力）')
+        parser.add_argument('--compare', default=None, help='比較する以前の結果のJSONファイル')
+        parser.add_argument('--regression-threshold', type=float, default=10.0,
+                            help='スループットがこの割合（%%）以上低下した条件を回帰として表示する')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='回帰があった場合に終了コード1で終了する（結果は書き出してから終了する）')
+
+    def handle(self, *args, **options):
+        import torch
+
+        from ...services import MODEL_NAME_MAPPING, MODEL_VERSIONS, analysis_service
+
+        # 比較する結果は計測前に読み込む（読み込めない場合に計測の時間を無駄にしない）
+        baseline = self._load_baseline(options['compare']) if options['compare'] else None
+
+        unknown = [name for name in options['models'] if MODEL_NAME_MAPPING.get(name, name) not in MODEL_VERSIONS]
+        if unknown:
+            raise CommandError(f"未知のモデルです: {', '.join(unknown)}")
+
+        engine = analysis_service.engine
+        original_threads = torch.get_num_threads()
+        original_batch_size = engine.max_batch_size
+        # バッチサイズの上限まで1回の推論にまとめる（推論エンジンの設定による分割をしない）
+        engine.max_batch_size = max(options['batch_sizes'])
+
+        try:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                image_paths = self._make_images(tmpdir, options)
+                results = [self._benchmark_model(analysis_service, model_name, image_paths, options)
+                           for model_name in options['models']]
+        finally:
+            engine.max_batch_size = original_batch_size
+            torch.set_num_threads(original_threads)
+
+        report = {
+            'format_version': BENCHMARK_FORMAT_VERSION,
+            'meta': {
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'git_commit': _git_commit(),
+                'python': platform.python_version(),
+                'torch': torch.__version__,
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'model_backend': getattr(settings, 'ANALYSIS_MODEL_BACKEND', 'eager'),
+                'inputs': {
+                    'formats': options['formats'],
+                    'sizes': options['sizes'],
+                    'images': len(image_paths),
+                },
+            },
+            'results': results,
+        }
+
+        if baseline is not None:
+            report['comparison'] = {'baseline': options['compare'],
+                                    **compare_reports(report, baseline, options['regression_threshold'])}
+            # 標準出力はJSONだけにするため、比較の表は標準エラー出力に出す
+            self._print_comparison(report['comparison'])
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+            self.stderr.write(self.style.SUCCESS(f"結果を書き出しました: {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+        if options['fail_on_regression'] and baseline is not None and report['comparison']['regressions']:
+            raise CommandError(f"回帰があります: {report['comparison']['regressions']}件")
+
+    def _make_images(self, tmpdir, options):
+        """写真に近い（滑らかな変化とノイズを含む）画像を形式・サイズを順に入れ替えながら作成する"""
+        combinations = [(fmt, size) for size in options['sizes'] for fmt in options['formats']]
+        rng = np.random.default_rng(0)
+        image_paths = []
+        for i in range(options['images']):
+            fmt, size = combinations[i % len(combinations)]
+            width, height = (int(v) for v in size.lower().split('x'))
+            base = (rng.random((max(2, height // 32), max(2, width // 32), 3)) * 255).astype('uint8')
+            image = PILImage.fromarray(base).resize((width, height), PILImage.BICUBIC)
+            pil_format, extension = FORMATS[fmt]
+            if pil_format == 'GIF':
+                image = image.convert('P', palette=PILImage.ADAPTIVE)
+            path = os.path.join(tmpdir, f'{i:04d}_{width}x{height}{extension}')
+            image.save(path, pil_format)
+            image_paths.append(path)
+        return image_paths
+
+    def _benchmark_model(self, service, model_name, image_paths, options):
+        import torch
+
+        from ...services import MODEL_NAME_MAPPING
+
+        internal_name = MODEL_NAME_MAPPING.get(model_name, model_name)
+        self.stderr.write(f"計測中: {model_name}")
+
+        service.registry.unload(internal_name)
+        started = time.perf_counter()
+        model_info = service.registry.get(internal_name)
+        cold_start = time.perf_counter() - started
+        if model_info['model'] is None:
+            self.stderr.write(f"モデルを読み込めませんでした: {model_name}")
+            return {'model': model_name, 'internal_model': internal_name, 'cold_start_seconds': cold_start,
+                    'error': 'モデルを読み込めませんでした', 'cases': []}
+
+        cases = []
+        for threads in options['threads']:
+            torch.set_num_threads(threads)
+            for batch_size in options['batch_sizes']:
+                cases.append(self._run_case(service, model_name, image_paths, batch_size, threads))
+
+        return {
+            'model': model_name,
+            'internal_model': internal_name,
+            'cold_start_seconds': cold_start,
+            'cases': cases,
+        }
+
+    def _run_case(self, service, model_name, image_paths, batch_size, threads):
+        def analyze(paths):
+            if len(paths) == 1:
+                return [service.analyze_image(paths[0], model_name)]
+            return service.analyze_images(paths, model_name)
+
+        analyze(image_paths[:batch_size])  # ウォームアップ
+
+        latencies = []
+        errors = 0
+        started = time.perf_counter()
+        for i in range(0, len(image_paths), batch_size):
+            paths = image_paths[i:i + batch_size]
+            batch_started = time.perf_counter()
+            responses = analyze(paths)
+            elapsed = (time.perf_counter() - batch_started) * 1000
+            latencies.extend([elapsed] * len(paths))
+            errors += sum(1 for response in responses if not response.get('success'))
+        total = time.perf_counter() - started
+
+        latencies = np.array(latencies)
+        return {
+            'batch_size': batch_size,
+            'threads': threads,
+            'images': len(latencies),
+            'errors': errors,
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p95_ms': float(np.percentile(latencies, 95)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'mean_ms': float(latencies.mean()),
+            'images_per_second': len(latencies) / total,
+        }
+
+    def _load_baseline(self, baseline_path):
+        try:
+            with open(baseline_path, encoding='utf-8') as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"比較する結果を読み込めません: {baseline_path}: {e}")
+        if baseline.get('format_version', 1) != BENCHMARK_FORMAT_VERSION:
+            raise CommandError(f"比較する結果の形式が異なります: {baseline_path} (format_version={baseline.get('format_version')})")
+        return baseline
+
+    def _print_comparison(self, comparison):
+        self.stderr.write(f"\n比較対象: {comparison['baseline']} (commit={comparison['baseline_commit']})")
+        self.stderr.write(f"{'モデル':<14} {'バッチ':>6} {'スレッド':>8} {'p50(ms)':>18} {'枚/秒':>18} {'変化':>8}")
+        for case in comparison['cases']:
+            before, after = case['before'], case['after']
+            mark = ' 回帰' if case['regression'] else ''
+            self.stderr.write(
+                f"{case['model']:<14} {case['batch_size']:>6} {case['threads']:>8} "
+                f"{before['p50_ms']:>8.1f} → {after['p50_ms']:>7.1f} "
+                f"{before['images_per_second']:>8.1f} → {after['images_per_second']:>7.1f} "
+                f"{case['throughput_change_percent']:>+7.1f}%{mark}"
+            )
+        self.stderr.write(
+            f"回帰: {comparison['regressions']}件（スループットが{comparison['regression_threshold_percent']:.0f}%以上低下）"
+        )
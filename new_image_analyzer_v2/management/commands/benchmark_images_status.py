@@ -0,0 +1,120 @@
+"""
+画像ステータス一括取得APIのベンチマークコマンド
+指定件数の画像IDでapi_get_images_statusを呼び出し、クエリ数と応答時間を計測する
+計測用のデータは一時的に作成し、終了時にロールバックする
+
+使用例:
+    python manage.py benchmark_images_status --sizes 10 100 1000 --repeat 5
+"""
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from ...models import MstUser, TransAnalysisRun, TransImageAnalysis, TransUploadedImage
+from ...views import api_get_images_status
+
+# 計測用データのステータス構成（テーブル画面の典型的な混在状態）
+STATUS_CYCLE = ['completed', 'completed', 'preparing', 'analyzing', 'uploaded']
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'api_get_images_status のクエリ数と応答時間を画像ID数ごとに計測します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000], help='計測する画像ID数')
+        parser.add_argument('--repeat', type=int, default=5, help='各件数での計測回数')
+        parser.add_argument('--results-per-image', type=int, default=3, help='画像ごとの解析結果数')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def _run(self, options):
+        image_ids = self._create_fixtures(max(options['sizes']), options['results_per_image'])
+        factory = RequestFactory()
+
+        self.stdout.write(f"{'画像ID数':>8} {'クエリ数':>8} {'中央値(ms)':>12} {'最大(ms)':>10}")
+        for size in options['sizes']:
+            request_ids = ','.join(str(image_id) for image_id in image_ids[:size])
+            timings = []
+            query_count = 0
+            for _ in range(options['repeat']):
+                request = factory.get('/v2/api/images/status/', {'image_ids': request_ids})
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = api_get_images_status(request)
+                    timings.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    self.stderr.write(f"APIエラー: {response.content.decode()}")
+                    return
+                query_count = len(queries.captured_queries)
+
+            self.stdout.write(
+                f"{size:>8} {query_count:>8} {statistics.median(timings):>12.2f} {max(timings):>10.2f}"
+            )
+
+    def _create_fixtures(self, count, results_per_image):
+        """計測用のユーザー・画像・解析結果を作成する"""
+        user = MstUser.objects.create(
+            username='bench_status',
+            email='bench_status@example.com',
+            password='!',
+        )
+        analysis_results = [
+            {'label': f'label_{rank}', 'confidence': round(0.9 - rank * 0.1, 2)}
+            for rank in range(results_per_image)
+        ]
+        images = [
+            TransUploadedImage(
+                user_id=user,
+                filename=f'bench_{i}.jpg',
+                file_path=f'bench/bench_{i}.jpg',
+                upload_order=i,
+                status=STATUS_CYCLE[i % len(STATUS_CYCLE)],
+            )
+            for i in range(count)
+        ]
+        images = TransUploadedImage.objects.bulk_create(images)
+        if images and images[0].pk is None:
+            # 主キーを返さないDBの場合は取得し直す
+            images = list(TransUploadedImage.objects.filter(user_id=user).order_by('upload_order'))
+
+        now = timezone.now()
+        completed = [image for image in images if image.status == 'completed']
+        TransAnalysisRun.objects.bulk_create([
+            TransAnalysisRun(image_id=image, model_name='resnet50', status='succeeded', started_at=now, completed_at=now)
+            for image in completed
+        ])
+        runs = list(TransAnalysisRun.objects.filter(image_id__user_id=user).order_by('image_id'))
+        for image, run in zip(completed, runs):
+            image.set_latest_results(run, analysis_results, 'resnet50')
+        TransUploadedImage.objects.bulk_update(completed, ['latest_results', 'latest_model_name', 'latest_run_id'])
+
+        TransImageAnalysis.objects.bulk_create([
+            TransImageAnalysis(
+                image_id=image,
+                run_id=run,
+                label=result['label'],
+                confidence=result['confidence'],
+                model_name='resnet50',
+                rank=rank + 1,
+                analysis_started_at=now,
+                analysis_completed_at=now,
+            )
+            for image, run in zip(completed, runs)
+            for rank, result in enumerate(analysis_results)
+        ])
+        return [image.image_id for image in images]
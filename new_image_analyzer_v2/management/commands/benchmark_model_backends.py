@@ -0,0 +1,94 @@
+"""
+モデルバックエンドの比較コマンド
+eager（torchvisionで組み立てたモデル）・TorchScript・ONNX（onnxruntime）の読み込み時間と推論時間を比較する
+TorchScript・ONNXは export_models で書き出したファイルを使う
+
+- 読み込み: モデルを読み込んで使える状態になるまでの時間（コールドスタート）
+- 1枚: バッチサイズ1の推論時間の中央値
+- 枚/秒: バッチ推論のスループット
+- 最大差: eagerとのsoftmax出力の差の最大値
+
+使用例:
+    python manage.py benchmark_model_backends
+    python manage.py benchmark_model_backends --models resnet50 --backends eager onnx --repeat 50
+"""
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...model_export import BACKEND_EAGER, BACKENDS, EXPORTABLE_MODELS
+
+
+class Command(BaseCommand):
+    help = 'eager・TorchScript・ONNXの読み込み時間と推論時間を比較します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--models', nargs='+', default=list(EXPORTABLE_MODELS),
+                            help='比較するモデル（内部モデル名またはフロントエンドのモデル名）')
+        parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS), help='比較するバックエンド')
+        parser.add_argument('--repeat', type=int, default=20, help='バッチサイズ1の推論の計測回数')
+        parser.add_argument('--batch-size', type=int, default=16, help='スループット計測のバッチサイズ')
+
+    def handle(self, *args, **options):
+        import torch
+
+        from ...services import MODEL_NAME_MAPPING, analysis_service
+
+        internal_names = [MODEL_NAME_MAPPING.get(name, name) for name in options['models']]
+        unknown = [name for name in internal_names if name not in EXPORTABLE_MODELS]
+        if unknown:
+            raise CommandError(f"比較に対応していないモデルです: {', '.join(unknown)}")
+
+        # 全バックエンドで同じ入力を使う
+        generator = torch.Generator().manual_seed(0)
+        batch = torch.randn(options['batch_size'], 3, 224, 224, generator=generator)
+
+        self.stdout.write(f"{'モデル':<24} {'バックエンド':<12} {'読み込み(秒)':>12} {'1枚(ms)':>9} {'枚/秒':>8} {'速度比':>7} {'最大差':>10}")
+        for internal_name in internal_names:
+            reference = None
+            for backend in options['backends']:
+                started = time.perf_counter()
+                model_info = analysis_service.load_model_backend(internal_name, backend)
+                load_seconds = time.perf_counter() - started
+                if model_info['model'] is None:
+                    self.stderr.write(f"読み込めませんでした: {internal_name} ({backend})。export_modelsで書き出してください")
+                    continue
+
+                measured = self._measure(model_info['model'], batch, options['repeat'])
+                if backend == BACKEND_EAGER or reference is None:
+                    reference = measured
+                max_diff = (measured['probabilities'] - reference['probabilities']).abs().max().item()
+                speedup = reference['latency_ms'] / measured['latency_ms']
+                self.stdout.write(
+                    f"{internal_name:<24} {backend:<12} {load_seconds:>12.2f} {measured['latency_ms']:>9.2f} "
+                    f"{measured['throughput']:>8.1f} {speedup:>6.2f}x {max_diff:>10.2e}"
+                )
+
+    def _measure(self, model, batch, repeat):
+        import torch
+
+        single_input = batch[:1]
+        with torch.no_grad():
+            # ウォームアップ（TorchScriptは最初の数回でグラフの最適化を行う）
+            for _ in range(3):
+                model(single_input)
+                model(batch)
+
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                model(single_input)
+                timings.append((time.perf_counter() - started) * 1000)
+
+            batch_runs = max(1, repeat // 4)
+            started = time.perf_counter()
+            for _ in range(batch_runs):
+                outputs = model(batch)
+            throughput = len(batch) * batch_runs / (time.perf_counter() - started)
+
+        return {
+            'latency_ms': statistics.median(timings),
+            'throughput': throughput,
+            'probabilities': torch.softmax(outputs, dim=1),
+        }
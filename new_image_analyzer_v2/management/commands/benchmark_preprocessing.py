@@ -0,0 +1,96 @@
+"""
+画像前処理のベンチマークコマンド
+従来の前処理（224x224に縮小 → NumPy → PIL → Resize(256) + CenterCrop(224)）と
+1回デコードの前処理（preprocessing.load_tensor）の1枚あたりの処理時間を比較する
+
+使用例:
+    python manage.py benchmark_preprocessing --sizes 640x480 1920x1080 4032x3024 --repeat 20
+    python manage.py benchmark_preprocessing --images uploads/images/*.jpg
+"""
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image as PILImage
+
+from ...preprocessing import CLIP_SPEC, IMAGENET_SPEC, load_tensor
+
+SPECS = {
+    'imagenet': IMAGENET_SPEC,
+    'clip': CLIP_SPEC,
+}
+
+
+def _legacy_pipeline(spec):
+    """変更前の前処理（services.preprocess_image + _prepare_tensor と同じ処理）"""
+    import torchvision.transforms as transforms
+
+    transform = transforms.Compose([
+        transforms.Resize(spec.resize_to, interpolation=transforms.InterpolationMode(
+            'bicubic' if spec.resample == PILImage.BICUBIC else 'bilinear')),
+        transforms.CenterCrop(spec.crop_size),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=list(spec.mean), std=list(spec.std)),
+    ])
+
+    def preprocess(image_path):
+        image = PILImage.open(image_path).convert('RGB')
+        image = image.resize((224, 224))
+        img_array = np.expand_dims(np.array(image), axis=0)
+        return transform(PILImage.fromarray(img_array[0].astype('uint8')))
+
+    return preprocess
+
+
+def _measure(func, image_path, repeat):
+    func(image_path)  # ウォームアップ
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(image_path)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+class Command(BaseCommand):
+    help = '従来の前処理と1回デコードの前処理の1枚あたりの処理時間を比較します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', nargs='*', default=[], help='計測に使う画像ファイル（省略時は合成画像）')
+        parser.add_argument('--sizes', nargs='+', default=['640x480', '1920x1080', '4032x3024'],
+                            help='合成するJPEG画像のサイズ（幅x高さ）')
+        parser.add_argument('--spec', choices=sorted(SPECS), default='imagenet', help='前処理の仕様')
+        parser.add_argument('--repeat', type=int, default=20, help='1枚あたりの計測回数')
+
+    def handle(self, *args, **options):
+        spec = SPECS[options['spec']]
+        legacy = _legacy_pipeline(spec)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            image_paths = options['images'] or [
+                self._make_image(tmpdir, size) for size in options['sizes']
+            ]
+
+            self.stdout.write(f"{'画像':<28} {'従来(ms)':>10} {'新(ms)':>10} {'高速化':>8}")
+            for image_path in image_paths:
+                if not os.path.exists(image_path):
+                    raise CommandError(f"画像が見つかりません: {image_path}")
+                with PILImage.open(image_path) as image:
+                    label = f"{os.path.basename(image_path)} ({image.width}x{image.height})"
+
+                before = _measure(legacy, image_path, options['repeat'])
+                after = _measure(lambda path: load_tensor(path, spec), image_path, options['repeat'])
+                self.stdout.write(f"{label:<28} {before:>10.2f} {after:>10.2f} {before / after:>7.1f}x")
+
+    def _make_image(self, tmpdir, size):
+        """写真に近い（滑らかな変化とノイズを含む）JPEG画像を作成する"""
+        width, height = (int(v) for v in size.lower().split('x'))
+        rng = np.random.default_rng(0)
+        base = (rng.random((max(2, height // 32), max(2, width // 32), 3)) * 255).astype('uint8')
+        image = PILImage.fromarray(base).resize((width, height), PILImage.BICUBIC)
+        path = os.path.join(tmpdir, f'{width}x{height}.jpg')
+        image.save(path, quality=90)
+        return path
@@ -0,0 +1,128 @@
+"""
+INT8量子化モデルの精度・速度比較コマンド
+固定の画像セットを量子化元のfp32モデルと量子化モデルで解析し、大分類カテゴリーの一致率と推論時間を比較する
+
+- 1位一致率: 1位の大分類カテゴリーがfp32モデルと同じ画像の割合
+- 上位3件一致率: fp32モデルの上位3件のカテゴリーのうち、量子化モデルの上位3件にも含まれる割合
+- 推論時間: 1枚ずつ推論した場合の中央値と、バッチ推論のスループット（前処理を含まない）
+
+使用例:
+    python manage.py benchmark_quantization --images data/eval_images
+    python manage.py benchmark_quantization --images data/eval_images --models resnet50_int8 vgg16_int8_dynamic --repeat 5
+"""
+import glob
+import os
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...model_registry import get_model_nbytes
+from ...preprocessing import load_tensor
+from ...quantization import IMAGE_EXTENSIONS, QUANTIZED_VARIANTS
+
+
+def _top_labels(response):
+    if not response.get('success'):
+        return []
+    return [result['label'] for result in sorted(response['results'], key=lambda r: r['rank'])]
+
+
+class Command(BaseCommand):
+    help = 'INT8量子化モデルとfp32モデルの大分類カテゴリーの一致率・推論時間を比較します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', required=True, help='比較に使う画像のディレクトリ')
+        parser.add_argument('--limit', type=int, default=200, help='使用する画像の最大枚数（ファイル名順）')
+        parser.add_argument('--models', nargs='+', default=sorted(QUANTIZED_VARIANTS),
+                            help='比較する量子化モデル（内部モデル名またはフロントエンドのモデル名）')
+        parser.add_argument('--repeat', type=int, default=3, help='推論時間の計測回数')
+        parser.add_argument('--batch-size', type=int, default=16, help='スループット計測のバッチサイズ')
+
+    def handle(self, *args, **options):
+        from ...services import MODEL_NAME_MAPPING, analysis_service
+
+        image_paths = sorted(
+            path for path in glob.glob(os.path.join(options['images'], '*'))
+            if path.lower().endswith(IMAGE_EXTENSIONS)
+        )[:options['limit']]
+        if not image_paths:
+            raise CommandError(f"画像が見つかりません: {options['images']}")
+
+        internal_names = [MODEL_NAME_MAPPING.get(name, name) for name in options['models']]
+        unknown = [name for name in internal_names if name not in QUANTIZED_VARIANTS]
+        if unknown:
+            raise CommandError(f"量子化モデルではありません: {', '.join(unknown)}")
+
+        self.stdout.write(f"画像: {len(image_paths)}枚")
+        self.stdout.write(
+            f"{'モデル':<34} {'サイズ(MB)':>10} {'1枚(ms)':>9} {'枚/秒':>8} {'速度比':>7} {'1位一致':>8} {'上位3件一致':>11}"
+        )
+
+        # 量子化元ごとにfp32モデルを1回だけ計測し、その後に各量子化モデルを比較する
+        base_names = sorted({QUANTIZED_VARIANTS[name].base_model for name in internal_names})
+        for base_name in base_names:
+            base = self._measure(analysis_service, base_name, image_paths, options)
+            if base is None:
+                continue
+            self._write_row(base_name, base, base)
+
+            for internal_name in internal_names:
+                if QUANTIZED_VARIANTS[internal_name].base_model != base_name:
+                    continue
+                measured = self._measure(analysis_service, internal_name, image_paths, options)
+                if measured is not None:
+                    self._write_row(internal_name, measured, base)
+
+    def _measure(self, service, internal_name, image_paths, options):
+        import torch
+
+        model_info = service.registry.get(internal_name)
+        model = model_info['model']
+        if model is None:
+            self.stderr.write(f"モデルを読み込めませんでした: {internal_name}")
+            return None
+
+        spec = model_info['preprocess_spec']
+        tensors = [load_tensor(path, spec) for path in image_paths]
+        batch_size = options['batch_size']
+
+        with torch.no_grad():
+            model(tensors[0].unsqueeze(0))  # ウォームアップ
+
+            single = []
+            for _ in range(options['repeat']):
+                for tensor in tensors:
+                    started = time.perf_counter()
+                    model(tensor.unsqueeze(0))
+                    single.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                for i in range(0, len(tensors), batch_size):
+                    model(torch.stack(tensors[i:i + batch_size]))
+            throughput = len(tensors) * options['repeat'] / (time.perf_counter() - started)
+
+        return {
+            'nbytes': model_info.get('nbytes') or get_model_nbytes(model),
+            'latency_ms': statistics.median(single),
+            'throughput': throughput,
+            'labels': [_top_labels(response) for response in service.analyze_images(image_paths, internal_name)],
+        }
+
+    def _write_row(self, name, measured, base):
+        top1 = []
+        top3 = []
+        for labels, base_labels in zip(measured['labels'], base['labels']):
+            if not base_labels:
+                continue
+            top1.append(bool(labels) and labels[0] == base_labels[0])
+            top3.append(len(set(labels[:3]) & set(base_labels[:3])) / len(base_labels[:3]))
+
+        top1_rate = 100 * sum(top1) / len(top1) if top1 else 0.0
+        top3_rate = 100 * sum(top3) / len(top3) if top3 else 0.0
+        speedup = base['latency_ms'] / measured['latency_ms']
+        self.stdout.write(
+            f"{name:<34} {measured['nbytes'] / 1024 / 1024:>10.1f} {measured['latency_ms']:>9.2f} "
+            f"{measured['throughput']:>8.1f} {speedup:>6.2f}x {top1_rate:>7.1f}% {top3_rate:>10.1f}%"
+        )
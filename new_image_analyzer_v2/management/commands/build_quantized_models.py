@@ -0,0 +1,56 @@
+"""
+INT8量子化モデル作成コマンド
+fp32モデルを量子化してANALYSIS_QUANTIZED_MODEL_DIRに保存する（Webプロセスは起動時に保存済みのファイルを読み込む）
+
+使用例:
+    python manage.py build_quantized_models
+    python manage.py build_quantized_models --models resnet50_int8 vgg16_int8 --calibration-dir data/calibration --rebuild
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from ...quantization import QUANTIZED_VARIANTS, get_calibration_paths, get_quantized_model_path
+
+
+class Command(BaseCommand):
+    help = 'INT8量子化モデルを作成して保存します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--models', nargs='+', default=sorted(QUANTIZED_VARIANTS),
+                            help='作成する量子化モデル（内部モデル名またはフロントエンドのモデル名）')
+        parser.add_argument('--rebuild', action='store_true', help='保存済みのファイルが有効でも作り直す')
+        parser.add_argument('--calibration-dir', default=None,
+                            help='静的量子化の校正に使う画像のディレクトリ（省略時は設定値、なければ最近アップロードされた画像）')
+        parser.add_argument('--calibration-images', type=int, default=None, help='校正に使う画像の枚数')
+
+    def handle(self, *args, **options):
+        from ...services import MODEL_NAME_MAPPING, analysis_service
+
+        internal_names = [MODEL_NAME_MAPPING.get(name, name) for name in options['models']]
+        unknown = [name for name in internal_names if name not in QUANTIZED_VARIANTS]
+        if unknown:
+            raise CommandError(f"量子化モデルではありません: {', '.join(unknown)}（対象: {', '.join(sorted(QUANTIZED_VARIANTS))}）")
+
+        calibration_paths = None
+        if any(QUANTIZED_VARIANTS[name].method == 'static' for name in internal_names):
+            calibration_paths = get_calibration_paths(options['calibration_images'], options['calibration_dir'])
+            self.stdout.write(f"校正画像: {len(calibration_paths)}枚")
+
+        failed = 0
+        for internal_name in internal_names:
+            variant = QUANTIZED_VARIANTS[internal_name]
+            try:
+                _, nbytes = analysis_service.build_quantized_model(
+                    internal_name, rebuild=options['rebuild'], calibration_paths=calibration_paths,
+                )
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"作成失敗: {internal_name} ({variant.method}): {e}")
+                continue
+            self.stdout.write(
+                f"{internal_name} ({variant.method}): {get_quantized_model_path(internal_name)} "
+                f"({nbytes / 1024 / 1024:.1f}MB)"
+            )
+
+        if failed:
+            raise CommandError(f"{failed}件の量子化モデルを作成できませんでした")
+        self.stdout.write(self.style.SUCCESS(f"量子化モデルを保存しました: {len(internal_names)}件"))
@@ -0,0 +1,172 @@
+"""
+主要クエリの実行計画・実行時間の記録コマンド
+画像一覧・解析待ちの順番・最新の解析結果など、頻繁に実行されるクエリの実行計画（EXPLAIN）と
+実行時間を記録する。PostgreSQLではEXPLAIN ANALYZEの結果を記録する。
+
+インデックスの追加前後を比較する手順:
+    python manage.py seed_analysis_data
+    python manage.py migrate new_image_analyzer_v2 0024
+    python manage.py explain_hot_queries --output before.json
+    python manage.py migrate new_image_analyzer_v2
+    python manage.py explain_hot_queries --output after.json --compare before.json
+
+使用例:
+    python manage.py explain_hot_queries
+    python manage.py explain_hot_queries --queries user_table latest_run --repeat 20
+"""
+import json
+import statistics
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import Rank
+
+from ...models import MstUser, TransAnalysisRun, TransImageAnalysis, TransUploadedImage
+from ...pagination import KEYSET_ORDERING
+
+PAGE_SIZE = 20
+# 深いページの計測に使うページ番号
+DEEP_PAGE = 1000
+
+
+def _sample_parameters():
+    """計測に使う値（画像が最も多いユーザー・解析結果のある最新の画像）を取得する"""
+    user_id = (
+        TransUploadedImage.objects.values('user_id').annotate(count=Count('image_id'))
+        .order_by('-count').values_list('user_id', flat=True).first()
+    )
+    latest = (
+        TransAnalysisRun.objects.filter(status='succeeded').order_by('-run_id')
+        .values_list('image_id', 'run_id').first()
+    )
+    if user_id is None or latest is None:
+        raise CommandError("計測用のデータがありません。seed_analysis_data で作成してください")
+    # 深いページの先頭の画像（キーセット方式のカーソルの位置）
+    boundary = (
+        TransUploadedImage.objects.order_by(*KEYSET_ORDERING)
+        .values_list('created_at', 'image_id')[DEEP_PAGE * PAGE_SIZE:DEEP_PAGE * PAGE_SIZE + 1].first()
+    ) or (None, None)
+    return {
+        'user_id': user_id, 'image_id': latest[0], 'run_id': latest[1],
+        'boundary_created_at': boundary[0], 'boundary_image_id': boundary[1],
+    }
+
+
+def build_hot_queries(params):
+    """計測するクエリ（名前 → QuerySet）"""
+    queries = {
+        # ユーザーの画像一覧（1ページ目）
+        'user_table': TransUploadedImage.objects.filter(user_id=params['user_id']).order_by(*KEYSET_ORDERING)[:PAGE_SIZE],
+        # 全ユーザーの画像一覧（管理者画面の1ページ目）
+        'admin_table': TransUploadedImage.objects.all().order_by(*KEYSET_ORDERING)[:PAGE_SIZE],
+        # 解析待ちの順番（api_get_images_status の待ち枚数）
+        'queue_position': (
+            TransUploadedImage.objects
+            .filter(user_id__in=[params['user_id']], status__in=['analyzing', 'preparing'])
+            .annotate(
+                analyzing_count=Window(expression=Count('image_id', filter=Q(status='analyzing')), partition_by=[F('user_id')]),
+                order_rank=Window(expression=Rank(), partition_by=[F('user_id'), F('status')], order_by=F('upload_order').asc()),
+            )
+            .values_list('image_id', 'status', 'analyzing_count', 'order_rank')
+        ),
+        # 準備中の画像全体（解析ジョブの登録）
+        'pending_images': TransUploadedImage.objects.filter(status='preparing').order_by('upload_order').values_list('image_id', flat=True),
+        # 画像の最新の解析実行
+        'latest_run': TransAnalysisRun.objects.filter(image_id=params['image_id'], status='succeeded').order_by('-completed_at')[:1],
+        # 最新の解析実行の上位3件
+        'top_results': TransImageAnalysis.objects.filter(run_id=params['run_id']).order_by('-confidence')[:3],
+    }
+    if params['boundary_image_id'] is not None:
+        # 全ユーザーの画像一覧の深いページ（OFFSET。番号付きページは主キーだけを読む）
+        queries['admin_table_offset'] = (
+            TransUploadedImage.objects.order_by(*KEYSET_ORDERING)
+            .values_list('image_id', flat=True)[DEEP_PAGE * PAGE_SIZE:(DEEP_PAGE + 1) * PAGE_SIZE]
+        )
+        # 全ユーザーの画像一覧の深いページ（キーセット方式）
+        queries['admin_table_keyset'] = TransUploadedImage.objects.filter(
+            Q(created_at__lte=params['boundary_created_at']),
+            Q(created_at__lt=params['boundary_created_at']) | Q(image_id__lt=params['boundary_image_id']),
+        ).order_by(*KEYSET_ORDERING)[:PAGE_SIZE]
+    return queries
+
+
+def _explain(queryset):
+    if connection.vendor == 'postgresql':
+        return queryset.explain(analyze=True, buffers=True)
+    return queryset.explain()
+
+
+def _median_ms(queryset, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        list(queryset.all())
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+class Command(BaseCommand):
+    help = '主要クエリの実行計画と実行時間を記録します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', nargs='+', default=None, help='計測するクエリ（省略時は全て）')
+        parser.add_argument('--repeat', type=int, default=10, help='実行時間の計測回数（中央値を記録する）')
+        parser.add_argument('--output', default=None, help='結果を書き出すJSONファイル')
+        parser.add_argument('--compare', default=None, help='比較する以前の結果のJSONファイル')
+        parser.add_argument('--quiet', action='store_true', help='実行計画を表示しない')
+
+    def handle(self, *args, **options):
+        params = _sample_parameters()
+        queries = build_hot_queries(params)
+        if options['queries']:
+            unknown = set(options['queries']) - set(queries)
+            if unknown:
+                raise CommandError(f"未知のクエリです: {', '.join(sorted(unknown))}（{', '.join(queries)}）")
+            queries = {name: queries[name] for name in options['queries']}
+
+        results = {}
+        for name, queryset in queries.items():
+            plan = _explain(queryset)
+            median_ms = _median_ms(queryset, options['repeat'])
+            results[name] = {'sql': str(queryset.query), 'plan': plan, 'median_ms': median_ms}
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{name}: {median_ms:.2f}ms"))
+            if not options['quiet']:
+                self.stdout.write(plan)
+
+        report = {
+            'meta': {
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'vendor': connection.vendor,
+                'images': TransUploadedImage.objects.count(),
+                'analysis_runs': TransAnalysisRun.objects.count(),
+                'analysis_results': TransImageAnalysis.objects.count(),
+                'users': MstUser.objects.count(),
+                'parameters': {key: str(value) for key, value in params.items()},
+            },
+            'queries': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"結果を書き出しました: {options['output']}"))
+
+        if options['compare']:
+            self._compare(results, options['compare'])
+
+    def _compare(self, results, baseline_path):
+        try:
+            with open(baseline_path, encoding='utf-8') as f:
+                baseline = json.load(f)['queries']
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"比較する結果を読み込めません: {baseline_path}: {e}")
+
+        self.stdout.write(f"\n{'クエリ':<18} {'以前(ms)':>10} {'今回(ms)':>10} {'倍率':>8}")
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            ratio = before['median_ms'] / result['median_ms'] if result['median_ms'] else 0.0
+            self.stdout.write(f"{name:<18} {before['median_ms']:>10.2f} {result['median_ms']:>10.2f} {ratio:>7.1f}x")
@@ -0,0 +1,45 @@
+"""
+モデル書き出しコマンド
+torchvisionの分類モデルをTorchScript（freeze済み）・ONNXに書き出す
+ANALYSIS_MODEL_BACKENDを 'torchscript' / 'onnx' にすると、起動時にこのファイルから読み込む
+
+使用例:
+    python manage.py export_models
+    python manage.py export_models --models resnet50 vgg16 --formats torchscript onnx
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from ...model_export import BACKEND_ONNX, BACKEND_TORCHSCRIPT, EXPORTABLE_MODELS
+
+
+class Command(BaseCommand):
+    help = '解析モデルをTorchScript・ONNXに書き出します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--models', nargs='+', default=list(EXPORTABLE_MODELS),
+                            help='書き出すモデル（内部モデル名またはフロントエンドのモデル名）')
+        parser.add_argument('--formats', nargs='+', choices=[BACKEND_TORCHSCRIPT, BACKEND_ONNX],
+                            default=[BACKEND_TORCHSCRIPT], help='書き出す形式')
+
+    def handle(self, *args, **options):
+        from ...services import MODEL_NAME_MAPPING, analysis_service
+
+        internal_names = [MODEL_NAME_MAPPING.get(name, name) for name in options['models']]
+        unknown = [name for name in internal_names if name not in EXPORTABLE_MODELS]
+        if unknown:
+            raise CommandError(f"書き出しに対応していないモデルです: {', '.join(unknown)}（対象: {', '.join(EXPORTABLE_MODELS)}）")
+
+        failed = 0
+        for internal_name in internal_names:
+            try:
+                exported = analysis_service.export_model(internal_name, options['formats'])
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"書き出し失敗: {internal_name}: {e}")
+                continue
+            for backend, (path, nbytes) in exported.items():
+                self.stdout.write(f"{internal_name} ({backend}): {path} ({nbytes / 1024 / 1024:.1f}MB)")
+
+        if failed:
+            raise CommandError(f"{failed}件のモデルを書き出せませんでした")
+        self.stdout.write(self.style.SUCCESS(f"モデルを書き出しました: {len(internal_names)}件"))
@@ -0,0 +1,171 @@
+"""
+gunicornワーカーのメモリ計測コマンド
+ワーカー数・モデルの共有方法ごとにgunicornを起動し、モデル読み込み後のプロセスごとのRSS・PSSを計測する（Linuxのみ）
+
+- RSS: プロセスが参照している物理メモリ（他のプロセスと共有しているページも全て数える）
+- PSS: 共有しているページを共有しているプロセス数で割って数えたメモリ（合計が実際の使用量になる）
+
+共有方法:
+- independent: preload_appなし。各ワーカーがモデルを読み込む
+- preload: マスタープロセスでモデルを読み込んでからforkする（コピーオンライトで共有）
+- mmap: preload_appなし。各ワーカーが重みをメモリマップで読み込む（ページキャッシュで共有）
+
+使用例:
+    python manage.py measure_worker_memory
+    python manage.py measure_worker_memory --workers 1 4 8 --modes independent preload mmap --models resnet50 vgg16
+"""
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+MODES = {
+    'independent': {'preload': False, 'mmap': False},
+    'preload': {'preload': True, 'mmap': False},
+    'mmap': {'preload': False, 'mmap': True},
+}
+
+
+def read_memory(pid: int) -> dict:
+    """プロセスのRSS・PSS・共有・専有メモリ（KB）"""
+    totals = {'Rss': 0, 'Pss': 0, 'Shared_Clean': 0, 'Shared_Dirty': 0, 'Private_Clean': 0, 'Private_Dirty': 0}
+    # smaps_rollupがないカーネルではsmapsの全マッピングを合計する
+    path = f'/proc/{pid}/smaps_rollup'
+    if not os.path.exists(path):
+        path = f'/proc/{pid}/smaps'
+    with open(path) as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in totals:
+                totals[key] += int(value.split()[0])
+    return {
+        'rss': totals['Rss'],
+        'pss': totals['Pss'],
+        'shared': totals['Shared_Clean'] + totals['Shared_Dirty'],
+        'private': totals['Private_Clean'] + totals['Private_Dirty'],
+    }
+
+
+def child_pids(parent_pid: int) -> list:
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # 2番目の項目（コマンド名）は空白を含むことがあるため、最後の')'以降を分割する
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == parent_pid:
+            pids.append(int(entry))
+    return sorted(pids)
+
+
+class Command(BaseCommand):
+    help = 'gunicornのワーカー数・モデルの共有方法ごとにワーカーのRSS・PSSを計測します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', nargs='+', type=int, default=[1, 4, 8], help='計測するワーカー数')
+        parser.add_argument('--modes', nargs='+', choices=sorted(MODES), default=['independent', 'preload', 'mmap'],
+                            help='モデルの共有方法')
+        parser.add_argument('--models', nargs='+', default=['resnet50'], help='各ワーカーで読み込むモデル')
+        parser.add_argument('--app', default='image_analysis_app.asgi:application', help='gunicornで起動するアプリケーション')
+        parser.add_argument('--worker-class', default=None, help='gunicornのワーカークラス（省略時はgunicorn.conf.pyの設定）')
+        parser.add_argument('--timeout', type=float, default=300, help='モデルの読み込み完了を待つ最大時間（秒）')
+
+    def handle(self, *args, **options):
+        if not os.path.exists('/proc/self/smaps'):
+            raise CommandError("このコマンドはLinux（/proc/<pid>/smaps）でのみ使用できます")
+
+        self.stdout.write(
+            f"{'共有方法':<12} {'ワーカー数':>8} {'マスターPSS(MB)':>15} {'ワーカーRSS(MB)':>15} "
+            f"{'ワーカーPSS(MB)':>15} {'ワーカー専有(MB)':>16} {'合計PSS(MB)':>12}"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for mode in options['modes']:
+                settings_module = self._write_settings(tmpdir, mode, options['models'])
+                for num_workers in options['workers']:
+                    master, workers = self._measure(tmpdir, settings_module, mode, num_workers, options)
+                    self._write_row(mode, num_workers, master, workers)
+
+    def _write_settings(self, tmpdir, mode, models):
+        """計測用の設定モジュール（現在の設定に、読み込むモデルと重みの読み込み方法を上書きする）"""
+        module_name = f'measure_settings_{mode}'
+        with open(os.path.join(tmpdir, f'{module_name}.py'), 'w', encoding='utf-8') as f:
+            f.write(f"from {settings.SETTINGS_MODULE} import *  # noqa\n")
+            f.write(f"ANALYSIS_PRELOAD_MODELS = {list(models)!r}\n")
+            f.write(f"ANALYSIS_MODEL_WEIGHTS_MMAP = {MODES[mode]['mmap']!r}\n")
+        return module_name
+
+    def _measure(self, tmpdir, settings_module, mode, num_workers, options):
+        socket_path = os.path.join(tmpdir, f'{mode}-{num_workers}.sock')
+        command = [
+            sys.executable, '-m', 'gunicorn', options['app'],
+            '-c', os.path.join(settings.BASE_DIR, 'gunicorn.conf.py'),
+            '--bind', f'unix:{socket_path}',
+            '--workers', str(num_workers),
+        ]
+        if options['worker_class']:
+            command += ['--worker-class', options['worker_class']]
+        env = dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE=settings_module,
+            PYTHONPATH=os.pathsep.join([tmpdir, str(settings.BASE_DIR), os.environ.get('PYTHONPATH', '')]),
+            GUNICORN_PRELOAD='1' if MODES[mode]['preload'] else '0',
+        )
+
+        process = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            workers = self._wait_until_loaded(process, num_workers, options['timeout'])
+            return read_memory(process.pid), [read_memory(pid) for pid in workers]
+        finally:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+    def _wait_until_loaded(self, process, num_workers, timeout):
+        """全ワーカーが起動し、メモリ使用量が3秒間変化しなくなるまで待つ（モデルの読み込み完了とみなす）"""
+        deadline = time.monotonic() + timeout
+        previous = None
+        stable_count = 0
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"gunicornが終了しました:\n{process.stderr.read().decode(errors='replace')}")
+
+            workers = child_pids(process.pid)
+            if len(workers) == num_workers:
+                try:
+                    current = [read_memory(pid)['rss'] for pid in workers]
+                except OSError:
+                    current = None
+                # 1MB未満の変化は読み込み完了後の揺らぎとして扱う
+                if previous is not None and current is not None and len(previous) == len(current) \
+                        and all(abs(a - b) < 1024 for a, b in zip(previous, current)):
+                    stable_count += 1
+                    if stable_count >= 3:
+                        return workers
+                else:
+                    stable_count = 0
+                previous = current
+            time.sleep(1)
+        raise CommandError(f"{timeout}秒以内にワーカーのモデル読み込みが完了しませんでした")
+
+    def _write_row(self, mode, num_workers, master, workers):
+        def average(key):
+            return sum(worker[key] for worker in workers) / len(workers) / 1024
+
+        total_pss = (master['pss'] + sum(worker['pss'] for worker in workers)) / 1024
+        self.stdout.write(
+            f"{mode:<12} {num_workers:>8} {master['pss'] / 1024:>15.1f} {average('rss'):>15.1f} "
+            f"{average('pss'):>15.1f} {average('private'):>16.1f} {total_pss:>12.1f}"
+        )
@@ -0,0 +1,68 @@
+"""
+解析ワーカー起動コマンド
+Webプロセスとは別のプロセスで解析ジョブを実行する
+
+使用例:
+    python manage.py run_analysis_workers --workers 4
+    python manage.py run_analysis_workers --workers 2 --batch-size 16
+    python manage.py run_analysis_workers --workers 2 --cpus 4-7
+"""
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...execution import configure_process, parse_cpu_list
+from ...jobs import AnalysisWorkerPool
+
+
+class Command(BaseCommand):
+    help = '解析ジョブキューからジョブを取得して実行するワーカーを起動します'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'ANALYSIS_WORKER_COUNT', 2),
+            help='このプロセスで同時に実行するジョブ数',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=getattr(settings, 'ANALYSIS_WORKER_POLL_INTERVAL', 1.0),
+            help='ジョブがない場合の待機間隔（秒）',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=getattr(settings, 'ANALYSIS_WORKER_BATCH_SIZE', 8),
+            help='1つのワーカーがまとめて取得・解析する同じモデルのジョブ数（1で1件ずつ）',
+        )
+        parser.add_argument(
+            '--cpus',
+            default=None,
+            help="このプロセスで使用するCPU（例: '4-7'。推論のスレッド数も同じ数になる）",
+        )
+
+    def handle(self, *args, **options):
+        if options['cpus']:
+            configure_process(parse_cpu_list(options['cpus']))
+
+        pool = AnalysisWorkerPool(
+            num_workers=options['workers'],
+            poll_interval=options['poll_interval'],
+            batch_size=options['batch_size'],
+        )
+
+        # SIGTERM / SIGINTで実行中のジョブを完了してから停止する
+        def shutdown(signum, frame):
+            self.stdout.write('停止シグナルを受信しました。実行中のジョブの完了を待っています...')
+            pool.stop()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+
+        pool.start()
+        self.stdout.write(self.style.SUCCESS(f'解析ワーカーを起動しました: {pool.num_workers}スレッド ({pool.name})'))
+        pool.join()
+        self.stdout.write(self.style.SUCCESS('解析ワーカーを停止しました'))
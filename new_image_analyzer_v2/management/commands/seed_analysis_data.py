@@ -0,0 +1,193 @@
+"""
+計測用データ作成コマンド
+インデックス・クエリの計測用に、大量の画像と解析結果を作成する（既定は100万枚）
+作成したデータはユーザー名が seed_user_ で始まるユーザーに属し、--clear で削除できる
+
+使用例:
+    python manage.py seed_analysis_data
+    python manage.py seed_analysis_data --images 100000 --users 200
+    python manage.py seed_analysis_data --clear
+"""
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from ...models import MstUser, TransAnalysisJob, TransAnalysisRun, TransImageAnalysis, TransUploadedImage
+
+SEED_USER_PREFIX = 'seed_user_'
+
+# 画像のステータスの構成（重み）
+STATUS_WEIGHTS = {
+    'completed': 90,
+    'uploaded': 4,
+    'preparing': 3,
+    'failed': 2,
+    'analyzing': 1,
+}
+
+LABELS = ['cat', 'dog', 'car', 'tree', 'house', 'person', 'bird', 'flower', 'boat', 'mountain']
+MODEL_NAMES = ['resnet50', 'mobilenet', 'efficientnet', 'vgg16', 'clip']
+
+
+@contextmanager
+def _explicit_timestamps(model, *field_names):
+    """auto_now / auto_now_add を一時的に無効にして、作成日時などを指定した値で保存する"""
+    fields = [model._meta.get_field(name) for name in field_names]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = '計測用の画像・解析結果を大量に作成します（--clear で削除）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', type=int, default=1_000_000, help='作成する画像の枚数')
+        parser.add_argument('--users', type=int, default=1000, help='画像を割り当てるユーザー数')
+        parser.add_argument('--results-per-image', type=int, default=3, help='解析完了の画像ごとの解析結果数')
+        parser.add_argument('--days', type=int, default=365, help='アップロード日時を分散させる日数（現在から遡る）')
+        parser.add_argument('--batch-size', type=int, default=5000, help='1回のbulk_createで作成する画像の枚数')
+        parser.add_argument('--seed', type=int, default=0, help='乱数のシード')
+        parser.add_argument('--clear', action='store_true', help='作成済みの計測用データを削除する')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            self._clear()
+            return
+
+        rng = random.Random(options['seed'])
+        users = self._create_users(options['users'])
+        statuses = list(STATUS_WEIGHTS)
+        weights = list(STATUS_WEIGHTS.values())
+
+        total = options['images']
+        now = timezone.now()
+        start = now - timedelta(days=options['days'])
+        step = (now - start) / max(1, total)
+        # 既存の画像に続けて upload_order を振る
+        upload_orders = {user.user_id: 0 for user in users}
+        upload_orders.update(
+            TransUploadedImage.objects.filter(user_id__in=users)
+            .values('user_id').annotate(max_order=Max('upload_order')).values_list('user_id', 'max_order')
+        )
+
+        started = time.perf_counter()
+        created = 0
+        with _explicit_timestamps(TransUploadedImage, 'created_at', 'updated_at'):
+            while created < total:
+                count = min(options['batch_size'], total - created)
+                images = []
+                image_results = []
+                for i in range(created, created + count):
+                    user = rng.choice(users)
+                    upload_orders[user.user_id] += 1
+                    status = rng.choices(statuses, weights)[0]
+                    created_at = start + step * i
+                    images.append(TransUploadedImage(
+                        user_id=user,
+                        filename=f'seed_{i}.jpg',
+                        file_path=f'/seed/images/seed_{i}.jpg',
+                        upload_order=upload_orders[user.user_id],
+                        status=status,
+                        analysis_stage='persisted' if status == 'completed' else '',
+                        created_at=created_at,
+                        updated_at=created_at,
+                        analysis_started_at=created_at if status in ('completed', 'analyzing', 'failed') else None,
+                        analysis_completed_at=created_at + timedelta(seconds=2) if status == 'completed' else None,
+                    ))
+                    image_results.append(self._build_results(rng, images[-1], options['results_per_image']))
+
+                with transaction.atomic():
+                    images = TransUploadedImage.objects.bulk_create(images)
+                    self._create_runs(images, image_results, options['batch_size'])
+
+                created += count
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"  {created}/{total}枚作成 ({elapsed:.0f}秒)")
+
+        # 大量に追加した直後は実行計画の統計情報が古いため更新する
+        with connection.cursor() as cursor:
+            for model in (TransUploadedImage, TransAnalysisRun, TransImageAnalysis):
+                cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"計測用データを作成しました: 画像{total}枚, ユーザー{len(users)}人 ({time.perf_counter() - started:.0f}秒)"
+        ))
+
+    def _create_users(self, count):
+        # MstUserはpkが読み取り専用のプロパティのためbulk_createできない
+        existing = set(MstUser.objects.filter(username__startswith=SEED_USER_PREFIX).values_list('username', flat=True))
+        with transaction.atomic():
+            for i in range(count):
+                username = f'{SEED_USER_PREFIX}{i}'
+                if username not in existing:
+                    MstUser.objects.create(username=username, email=f'{username}@example.com')
+        return list(MstUser.objects.filter(username__startswith=SEED_USER_PREFIX).order_by('user_id')[:count])
+
+    def _build_results(self, rng, image, results_per_image):
+        """解析完了の画像の解析結果（モデル名と label / confidence のリスト）を作成する"""
+        if image.status != 'completed':
+            return None
+        confidences = sorted((round(rng.uniform(0, 100), 2) for _ in range(results_per_image)), reverse=True)
+        results = [{'label': rng.choice(LABELS), 'confidence': confidence} for confidence in confidences]
+        return rng.choice(MODEL_NAMES), results
+
+    def _create_runs(self, images, image_results, batch_size):
+        """解析完了の画像の解析実行・解析結果を作成し、画像に最新の解析結果を設定する"""
+        completed = [(image, built) for image, built in zip(images, image_results) if built is not None]
+        runs = TransAnalysisRun.objects.bulk_create([
+            TransAnalysisRun(
+                image_id=image,
+                model_name=model_name,
+                status='succeeded',
+                started_at=image.analysis_started_at,
+                completed_at=image.analysis_completed_at,
+            )
+            for image, (model_name, _) in completed
+        ], batch_size=batch_size)
+
+        rows = []
+        for (image, (model_name, results)), run in zip(completed, runs):
+            image.set_latest_results(run, results, model_name)
+            rows.extend(
+                TransImageAnalysis(
+                    image_id=image,
+                    run_id=run,
+                    label=result['label'],
+                    confidence=result['confidence'],
+                    model_name=model_name,
+                    rank=rank,
+                    analysis_started_at=image.analysis_started_at,
+                    analysis_completed_at=image.analysis_completed_at,
+                )
+                for rank, result in enumerate(results, 1)
+            )
+        TransUploadedImage.objects.bulk_update(
+            [image for image, _ in completed], ['latest_results', 'latest_model_name', 'latest_run_id'], batch_size=batch_size
+        )
+        TransImageAnalysis.objects.bulk_create(rows, batch_size=batch_size)
+
+    def _clear(self):
+        """計測用データを削除する（大量の行をORMのカスケードで1件ずつ削除しないよう、参照する側から削除する）"""
+        images = TransUploadedImage.objects.filter(user_id__username__startswith=SEED_USER_PREFIX)
+        with transaction.atomic():
+            results, _ = TransImageAnalysis.objects.filter(image_id__in=images).delete()
+            TransUploadedImage.objects.filter(pk__in=images).update(latest_run_id=None)
+            TransAnalysisRun.objects.filter(image_id__in=images)._raw_delete(images.db)
+            TransAnalysisJob.objects.filter(image_id__in=images).delete()
+            image_count = images._raw_delete(images.db)
+            users, _ = MstUser.objects.filter(username__startswith=SEED_USER_PREFIX).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f"計測用データを削除しました: 画像{image_count}枚, 解析結果{results}件, ユーザー{users}人"
+        ))
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-18 13:06
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new_image_analyzer_v2', '0019_transuploadedimage_upload_order'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransAnalysisJob',
+            fields=[
+                ('job_id', models.AutoField(primary_key=True, serialize=False, verbose_name='ジョブID')),
+                ('model_name', models.CharField(max_length=50, verbose_name='モデル名')),
+                ('status', models.CharField(choices=[('queued', '待機中'), ('running', '実行中'), ('succeeded', '完了'), ('failed', '失敗')], default='queued', max_length=20, verbose_name='ステータス')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='実行回数')),
+                ('max_attempts', models.PositiveIntegerField(default=3, verbose_name='最大実行回数')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, help_text='リトライ時はバックオフ後の時刻', verbose_name='実行可能時刻')),
+                ('locked_by', models.CharField(blank=True, default='', max_length=100, verbose_name='実行ワーカー')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='取得時刻')),
+                ('last_error', models.TextField(blank=True, null=True, verbose_name='最終エラー')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='登録日時')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('image_id', models.ForeignKey(db_column='image_id', on_delete=django.db.models.deletion.CASCADE, related_name='analysis_jobs', to='new_image_analyzer_v2.transuploadedimage', verbose_name='画像ID')),
+            ],
+            options={
+                'verbose_name': '画像解析ジョブ',
+                'verbose_name_plural': '画像解析ジョブ',
+                'db_table': 'trans_analysis_job_v2',
+                'ordering': ['available_at', 'job_id'],
+                'indexes': [models.Index(fields=['status', 'available_at'], name='analysis_job_claim_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 13:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new_image_analyzer_v2', '0020_transanalysisjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transuploadedimage',
+            name='analysis_stage',
+            field=models.CharField(blank=True, choices=[('queued', '解析待ち'), ('decoding', '画像読み込み中'), ('preprocessing', '前処理中'), ('inference', '解析中'), ('postprocessing', '結果処理中'), ('persisted', '解析完了')], default='', help_text='解析パイプラインが最後に到達した段階', max_length=20, verbose_name='解析段階'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-18 13:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new_image_analyzer_v2', '0021_transuploadedimage_analysis_stage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transuploadedimage',
+            name='content_digest',
+            field=models.CharField(blank=True, db_index=True, default='', help_text='ファイル内容のSHA-256（同じ画像の解析結果を再利用するためのキー）', max_length=64, verbose_name='内容ダイジェスト'),
+        ),
+        migrations.CreateModel(
+            name='TransAnalysisResultCache',
+            fields=[
+                ('cache_id', models.AutoField(primary_key=True, serialize=False, verbose_name='キャッシュID')),
+                ('content_digest', models.CharField(max_length=64, verbose_name='内容ダイジェスト')),
+                ('model_name', models.CharField(max_length=50, verbose_name='モデル名')),
+                ('model_version', models.CharField(help_text='重みや後処理が変わった場合は別のキャッシュとして扱う', max_length=100, verbose_name='モデルバージョン')),
+                ('results', models.JSONField(verbose_name='解析結果')),
+                ('hit_count', models.PositiveIntegerField(default=0, verbose_name='ヒット回数')),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True, verbose_name='最終ヒット日時')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='登録日時')),
+            ],
+            options={
+                'verbose_name': '解析結果キャッシュ',
+                'verbose_name_plural': '解析結果キャッシュ',
+                'db_table': 'trans_analysis_result_cache_v2',
+                'constraints': [models.UniqueConstraint(fields=('content_digest', 'model_name', 'model_version'), name='analysis_result_cache_key_uniq')],
+            },
+        ),
+    ]
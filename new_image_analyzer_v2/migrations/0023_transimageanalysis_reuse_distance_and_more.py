@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-18 13:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new_image_analyzer_v2', '0022_transuploadedimage_content_digest_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transimageanalysis',
+            name='reuse_distance',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='知覚ハッシュのハミング距離', null=True, verbose_name='再利用元との距離'),
+        ),
+        migrations.AddField(
+            model_name='transimageanalysis',
+            name='reused_from',
+            field=models.ForeignKey(blank=True, db_column='reused_from_image_id', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reused_analysis_results', to='new_image_analyzer_v2.transuploadedimage', verbose_name='再利用元画像ID'),
+        ),
+        migrations.AddField(
+            model_name='transuploadedimage',
+            name='perceptual_hash',
+            field=models.CharField(blank=True, default='', help_text='64ビットのdHash（16進）。再圧縮・リサイズされた類似画像の検出に使用', max_length=16, verbose_name='知覚ハッシュ'),
+        ),
+    ]
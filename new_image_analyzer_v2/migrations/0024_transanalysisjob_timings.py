@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 13:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new_image_analyzer_v2', '0023_transimageanalysis_reuse_distance_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transanalysisjob',
+            name='timings',
+            field=models.JSONField(blank=True, help_text='解析パイプラインの段階ごとの処理時間（ミリ秒）', null=True, verbose_name='処理時間'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18 13:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new_image_analyzer_v2', '0024_transanalysisjob_timings'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transimageanalysis',
+            index=models.Index(fields=['image_id', '-analysis_completed_at'], name='image_analysis_latest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transimageanalysis',
+            index=models.Index(fields=['image_id', '-confidence', 'analysis_id'], name='image_analysis_top_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transuploadedimage',
+            index=models.Index(fields=['user_id', '-created_at'], name='uploaded_image_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transuploadedimage',
+            index=models.Index(condition=models.Q(('status__in', ['analyzing', 'preparing'])), fields=['user_id', 'status', 'upload_order'], name='uploaded_image_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transuploadedimage',
+            index=models.Index(condition=models.Q(('status__in', ['analyzing', 'preparing'])), fields=['status', 'upload_order'], name='uploaded_image_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 13:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new_image_analyzer_v2', '0025_transimageanalysis_image_analysis_latest_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transuploadedimage',
+            name='latest_model_name',
+            field=models.CharField(blank=True, default='', max_length=50, verbose_name='最新の解析モデル'),
+        ),
+        migrations.AddField(
+            model_name='transuploadedimage',
+            name='latest_results',
+            field=models.JSONField(blank=True, default=list, help_text='最新の解析実行の上位の結果（信頼度の高い順、label / confidence / rank）', verbose_name='最新の解析結果'),
+        ),
+        migrations.AddField(
+            model_name='transuploadedimage',
+            name='latest_run_id',
+            field=models.UUIDField(blank=True, help_text='解析が完了するたびに新しく採番する（結果が更新されたかどうかの判定に使用）', null=True, verbose_name='最新の解析実行ID'),
+        ),
+    ]
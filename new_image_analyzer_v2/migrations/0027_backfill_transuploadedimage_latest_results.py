@@ -0,0 +1,58 @@
+# Generated by Django 5.2.5 on 2026-10-18 13:55
+
+import uuid
+
+from django.db import migrations
+
+# 移行時点の LATEST_RESULTS_COUNT（モデルの定数は変わりうるため固定値で持つ）
+LATEST_RESULTS_COUNT = 3
+BATCH_SIZE = 1000
+
+
+def _save_latest_results(TransUploadedImage, latest):
+    images = list(TransUploadedImage.objects.filter(image_id__in=list(latest)))
+    for image in images:
+        entry = latest[image.image_id]
+        image.latest_results = entry['results']
+        image.latest_model_name = entry['model_name'] or ''
+        image.latest_run_id = uuid.uuid4()
+    TransUploadedImage.objects.bulk_update(images, ['latest_results', 'latest_model_name', 'latest_run_id'])
+
+
+def backfill_latest_results(apps, schema_editor):
+    """既存の解析結果から画像ごとの最新の解析結果を設定する"""
+    TransUploadedImage = apps.get_model('new_image_analyzer_v2', 'TransUploadedImage')
+    TransImageAnalysis = apps.get_model('new_image_analyzer_v2', 'TransImageAnalysis')
+
+    rows = (
+        TransImageAnalysis.objects
+        .order_by('image_id', '-analysis_completed_at', '-confidence', 'analysis_id')
+        .values_list('image_id', 'analysis_completed_at', 'label', 'confidence', 'rank', 'model_name')
+        .iterator(chunk_size=BATCH_SIZE * LATEST_RESULTS_COUNT)
+    )
+
+    # 画像IDの順に読むため、画像ごとに最新の解析完了時刻の結果の上位（信頼度の高い順）を集めて一定数ずつ保存する
+    latest = {}
+    for image_id, completed_at, label, confidence, rank, model_name in rows:
+        entry = latest.get(image_id)
+        if entry is None:
+            if len(latest) >= BATCH_SIZE:
+                _save_latest_results(TransUploadedImage, latest)
+                latest = {}
+            entry = latest[image_id] = {'completed_at': completed_at, 'model_name': model_name, 'results': []}
+        if completed_at != entry['completed_at'] or len(entry['results']) >= LATEST_RESULTS_COUNT:
+            continue
+        entry['results'].append({'label': label, 'confidence': round(float(confidence), 2), 'rank': rank})
+    if latest:
+        _save_latest_results(TransUploadedImage, latest)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new_image_analyzer_v2', '0026_transuploadedimage_latest_model_name_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_latest_results, migrations.RunPython.noop),
+    ]
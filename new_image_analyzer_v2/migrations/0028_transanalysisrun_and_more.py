@@ -0,0 +1,57 @@
+# Generated by Django 5.2.5 on 2026-10-18 13:56
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new_image_analyzer_v2', '0027_backfill_transuploadedimage_latest_results'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransAnalysisRun',
+            fields=[
+                ('run_id', models.AutoField(primary_key=True, serialize=False, verbose_name='解析実行ID')),
+                ('model_name', models.CharField(max_length=50, verbose_name='モデル名')),
+                ('status', models.CharField(choices=[('running', '実行中'), ('succeeded', '完了'), ('failed', '失敗')], default='running', max_length=20, verbose_name='ステータス')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='解析開始時刻')),
+                ('completed_at', models.DateTimeField(blank=True, null=True, verbose_name='解析完了時刻')),
+                ('timings', models.JSONField(blank=True, help_text='解析パイプラインの段階ごとの処理時間（ミリ秒）', null=True, verbose_name='処理時間')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='解析エラー')),
+            ],
+            options={
+                'verbose_name': '画像解析実行',
+                'verbose_name_plural': '画像解析実行',
+                'db_table': 'trans_analysis_run_v2',
+                'ordering': ['image_id', '-started_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='transanalysisrun',
+            name='image_id',
+            field=models.ForeignKey(db_column='image_id', on_delete=django.db.models.deletion.CASCADE, related_name='analysis_runs', to='new_image_analyzer_v2.transuploadedimage', verbose_name='画像ID'),
+        ),
+        migrations.AddField(
+            model_name='transimageanalysis',
+            name='run_id',
+            field=models.ForeignKey(db_column='run_id', db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='results', to='new_image_analyzer_v2.transanalysisrun', verbose_name='解析実行ID'),
+        ),
+        # UUIDから解析実行への外部キーに変わるため、列を作り直す（値は次のマイグレーションで設定する）
+        migrations.RemoveField(
+            model_name='transuploadedimage',
+            name='latest_run_id',
+        ),
+        migrations.AddField(
+            model_name='transuploadedimage',
+            name='latest_run_id',
+            field=models.ForeignKey(blank=True, db_column='latest_run_id', help_text='最後に完了した解析実行（最新の解析結果はこの実行の結果）', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='new_image_analyzer_v2.transanalysisrun', verbose_name='最新の解析実行ID'),
+        ),
+        migrations.AddIndex(
+            model_name='transanalysisrun',
+            index=models.Index(condition=models.Q(('status', 'succeeded')), fields=['image_id', '-completed_at'], name='analysis_run_latest_idx'),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:05
+
+from django.db import migrations
+from django.db.models import F, OuterRef, Subquery
+
+BATCH_SIZE = 1000
+
+
+def _save_runs(TransUploadedImage, TransAnalysisRun, TransImageAnalysis, runs):
+    """解析実行を作成し、解析結果の行と画像の最新の解析実行を設定する"""
+    TransAnalysisRun.objects.bulk_create(runs)
+
+    # 解析結果の行は、画像と解析完了時刻が同じ解析実行に1回のUPDATEで紐付ける
+    image_ids = list({run.image_id_id for run in runs})
+    results = TransImageAnalysis.objects.filter(image_id__in=image_ids, run_id__isnull=True)
+    results.filter(analysis_completed_at__isnull=False).update(run_id=Subquery(
+        TransAnalysisRun.objects.filter(
+            image_id=OuterRef('image_id'), completed_at=OuterRef('analysis_completed_at')
+        ).values('run_id')[:1]
+    ))
+    results.filter(analysis_completed_at__isnull=True).update(run_id=Subquery(
+        TransAnalysisRun.objects.filter(image_id=OuterRef('image_id'), completed_at__isnull=True).values('run_id')[:1]
+    ))
+
+    # 画像の最新の解析実行（解析完了時刻が最も新しい解析実行）を設定する
+    TransUploadedImage.objects.filter(image_id__in=image_ids).update(latest_run_id=Subquery(
+        TransAnalysisRun.objects.filter(image_id=OuterRef('image_id'))
+        .order_by(F('completed_at').desc(nulls_last=True), 'run_id').values('run_id')[:1]
+    ))
+
+
+def backfill_analysis_runs(apps, schema_editor):
+    """既存の解析結果を、画像と解析完了時刻が同じ行ごとに1回の解析実行としてまとめる"""
+    TransUploadedImage = apps.get_model('new_image_analyzer_v2', 'TransUploadedImage')
+    TransAnalysisRun = apps.get_model('new_image_analyzer_v2', 'TransAnalysisRun')
+    TransImageAnalysis = apps.get_model('new_image_analyzer_v2', 'TransImageAnalysis')
+
+    rows = (
+        TransImageAnalysis.objects
+        .filter(run_id__isnull=True)
+        .order_by('image_id', F('analysis_completed_at').desc(nulls_last=True))
+        .values_list('image_id', 'analysis_completed_at', 'analysis_started_at', 'model_name', 'analysis_error')
+        .iterator(chunk_size=BATCH_SIZE * 3)
+    )
+
+    runs = []
+    run = key = None
+    for image_id, completed_at, started_at, model_name, error in rows:
+        if (image_id, completed_at) != key:
+            # 画像の途中で区切ると解析実行が分かれるため、画像の境目で保存する
+            if len(runs) >= BATCH_SIZE and image_id != key[0]:
+                _save_runs(TransUploadedImage, TransAnalysisRun, TransImageAnalysis, runs)
+                runs = []
+            key = (image_id, completed_at)
+            run = TransAnalysisRun(
+                image_id_id=image_id,
+                model_name=model_name,
+                status='succeeded',
+                started_at=started_at,
+                completed_at=completed_at,
+            )
+            runs.append(run)
+        run.started_at = min(run.started_at, started_at)
+        if error:
+            run.status = 'failed'
+            run.error = error
+    if runs:
+        _save_runs(TransUploadedImage, TransAnalysisRun, TransImageAnalysis, runs)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new_image_analyzer_v2', '0028_transanalysisrun_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_analysis_runs, migrations.RunPython.noop),
+    ]
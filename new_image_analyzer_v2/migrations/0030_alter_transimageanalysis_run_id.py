@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new_image_analyzer_v2', '0029_backfill_transanalysisrun'),
+    ]
+
+    operations = [
+        # 移行中の run_id IS NULL の検索で使われないよう、解析実行の設定後に作成する
+        migrations.AddIndex(
+            model_name='transimageanalysis',
+            index=models.Index(fields=['run_id', '-confidence'], name='image_analysis_run_top_idx'),
+        ),
+        # 解析完了時刻による解析実行の判定は不要になったため、時刻のインデックスを削除する
+        migrations.RemoveIndex(
+            model_name='transimageanalysis',
+            name='image_analysis_latest_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='transimageanalysis',
+            name='image_analysis_top_idx',
+        ),
+        migrations.AlterField(
+            model_name='transimageanalysis',
+            name='run_id',
+            field=models.ForeignKey(db_column='run_id', db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='results', to='new_image_analyzer_v2.transanalysisrun', verbose_name='解析実行ID'),
+        ),
+    ]
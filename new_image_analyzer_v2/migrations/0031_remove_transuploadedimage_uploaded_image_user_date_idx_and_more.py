@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new_image_analyzer_v2', '0030_alter_transimageanalysis_run_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transuploadedimage',
+            index=models.Index(fields=['user_id', '-created_at', '-image_id'], name='uploaded_image_user_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transuploadedimage',
+            index=models.Index(fields=['-created_at', '-image_id'], name='uploaded_image_keyset_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='transuploadedimage',
+            name='uploaded_image_user_date_idx',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new_image_analyzer_v2', '0031_remove_transuploadedimage_uploaded_image_user_date_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transanalysisrun',
+            name='model_version',
+            field=models.CharField(blank=True, default='', help_text='類似画像の解析結果は同じバージョンで成功した解析実行のものだけを再利用する', max_length=100, verbose_name='モデルバージョン'),
+        ),
+    ]
@@ -0,0 +1,157 @@
+"""
+モデルの事前エクスポート
+torchvisionの分類モデルをTorchScript（freeze済み）・ONNXに書き出し、起動時にそのファイルから読み込む
+
+eagerバックエンドでは起動のたびにtorchvisionのコンストラクタでモデルを組み立てて重みを読み込むが、
+書き出したファイルから読み込めばモデルの組み立てを省略できる。推論もfreezeで定数畳み込み・
+Conv+BatchNormの融合が済んだグラフ（ONNXの場合はonnxruntime）で実行される。
+書き出し時の元モデルのバージョン・PyTorchのバージョンが一致しないファイルは使わない。
+"""
+import inspect
+import json
+import logging
+import os
+from typing import Dict, Optional
+
+from django.conf import settings
+
+from .preprocessing import PreprocessSpec
+
+logger = logging.getLogger(__name__)
+
+BACKEND_EAGER = 'eager'
+BACKEND_TORCHSCRIPT = 'torchscript'
+BACKEND_ONNX = 'onnx'
+BACKENDS = (BACKEND_EAGER, BACKEND_TORCHSCRIPT, BACKEND_ONNX)
+
+# 書き出すモデル（CLIPは画像とテキストの埋め込みを組み合わせて推論するため対象外）
+EXPORTABLE_MODELS = ('pytorch_resnet50', 'pytorch_mobilenet', 'pytorch_vgg16', 'pytorch_efficientnet')
+
+FILE_EXTENSIONS = {
+    BACKEND_TORCHSCRIPT: '.torchscript.pt',
+    BACKEND_ONNX: '.onnx',
+}
+
+METADATA_FILE = 'export.json'
+
+
+def get_exported_model_path(internal_model_name: str, backend: str) -> str:
+    model_dir = getattr(settings, 'ANALYSIS_EXPORTED_MODEL_DIR', os.path.join(settings.BASE_DIR, 'model_cache', 'exported'))
+    return os.path.join(str(model_dir), f'{internal_model_name}{FILE_EXTENSIONS[backend]}')
+
+
+def get_export_metadata(internal_model_name: str, model_version: str) -> Dict:
+    import torch
+
+    return {
+        'model': internal_model_name,
+        'model_version': model_version,
+        'torch': torch.__version__,
+    }
+
+
+def _metadata_path(path: str) -> str:
+    """ONNXファイルのメタデータ（同じディレクトリのJSONファイル）"""
+    return f'{path}.json'
+
+
+def export_torchscript(model, path: str, metadata: Dict, spec: PreprocessSpec) -> int:
+    """モデルをトレースしてfreezeしたTorchScriptを保存し、ファイルサイズ（バイト）を返す"""
+    import torch
+
+    model.eval()
+    example = torch.zeros(1, 3, spec.crop_size, spec.crop_size)
+    with torch.no_grad():
+        frozen = torch.jit.freeze(torch.jit.trace(model, example))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 書き込み途中のファイルを他のプロセスが読み込まないよう、一時ファイルに保存してから置き換える
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    torch.jit.save(frozen, tmp_path, _extra_files={METADATA_FILE: json.dumps(metadata, sort_keys=True)})
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def export_onnx(model, path: str, metadata: Dict, spec: PreprocessSpec, opset_version: int = 17) -> int:
+    """モデルをONNX（バッチサイズ可変）で保存し、ファイルサイズ（バイト）を返す"""
+    import torch
+
+    model.eval()
+    example = torch.zeros(1, 3, spec.crop_size, spec.crop_size)
+    export_kwargs = {}
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        # TorchScriptベースの出力を使う（dynamoによる出力はonnxscriptが必要）
+        export_kwargs['dynamo'] = False
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with torch.no_grad():
+        torch.onnx.export(
+            model, (example,), tmp_path,
+            input_names=['input'],
+            output_names=['logits'],
+            dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}},
+            opset_version=opset_version,
+            do_constant_folding=True,
+            **export_kwargs,
+        )
+    with open(_metadata_path(path), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, sort_keys=True)
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+class OnnxRuntimeModel:
+    """onnxruntime（CPU）のセッションをPyTorchのモデルと同じように呼び出せるようにする"""
+
+    def __init__(self, path: str):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        import torch
+
+        outputs = self.session.run(None, {self.input_name: batch.numpy()})
+        return torch.from_numpy(outputs[0])
+
+    def eval(self):
+        return self
+
+
+def load_exported_model(internal_model_name: str, backend: str, metadata: Dict) -> Optional[object]:
+    """書き出したモデルを読み込む（ファイルがない・内容が古い場合はNone）"""
+    path = get_exported_model_path(internal_model_name, backend)
+    if not os.path.exists(path):
+        return None
+
+    if backend == BACKEND_TORCHSCRIPT:
+        import torch
+
+        extra_files = {METADATA_FILE: ''}
+        model = torch.jit.load(path, map_location='cpu', _extra_files=extra_files)
+        saved = extra_files[METADATA_FILE]
+    elif backend == BACKEND_ONNX:
+        try:
+            with open(_metadata_path(path), encoding='utf-8') as f:
+                saved = f.read()
+        except OSError:
+            saved = ''
+        model = None
+    else:
+        raise ValueError(f"未対応のバックエンドです: {backend}")
+
+    try:
+        saved = json.loads(saved)
+    except ValueError:
+        saved = None
+    if saved != metadata:
+        logger.warning(f"書き出し済みのモデルが古いため使用しません（export_modelsで書き出し直してください）: {path}")
+        return None
+
+    if backend == BACKEND_ONNX:
+        model = OnnxRuntimeModel(path)
+    return model.eval()
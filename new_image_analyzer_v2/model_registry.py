@@ -0,0 +1,210 @@
+"""
+モデルレジストリ
+解析モデルを初回リクエスト時に読み込み（遅延読み込み）、読み込み状態を管理する
+メモリ上限を設定した場合は、最も長く使われていないモデルから破棄する（LRU）
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 読み込み状態
+STATE_UNLOADED = 'unloaded'
+STATE_LOADING = 'loading'
+STATE_LOADED = 'loaded'
+STATE_FAILED = 'failed'
+
+
+def get_model_nbytes(model) -> int:
+    """モデルのパラメータとバッファの実バイト数を計算する"""
+    if model is None or not hasattr(model, 'parameters'):
+        return 0
+
+    total = 0
+    seen = set()
+    tensors = list(model.parameters())
+    if hasattr(model, 'buffers'):
+        tensors += list(model.buffers())
+    for tensor in tensors:
+        # 共有されている重みは1回だけ数える
+        key = tensor.data_ptr()
+        if key in seen:
+            continue
+        seen.add(key)
+        total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class ModelRegistry:
+    """モデルを必要になった時点で読み込むレジストリ
+
+    モデルごとにロックを持つため、同じモデルへの初回リクエストが同時に来ても
+    読み込みは1回だけ行われる。異なるモデルの読み込みは互いにブロックしない。
+    memory_budget_bytesを指定すると、読み込み済みモデルの合計サイズが上限を
+    超えた時点で最も長く使われていないモデルを破棄する。
+    読み込みに失敗したモデル（model=None）は retry_seconds の間だけ結果を保持し、
+    経過後の次のget時に再読み込みする（重みのダウンロード失敗など一時的な失敗から復旧するため）。
+    """
+
+    def __init__(self, loaders: Dict[str, Callable[[], Dict]], memory_budget_bytes: Optional[int] = None,
+                 retry_seconds: float = 60.0):
+        # ローダーはモデル情報（'model'キーを含む辞書）を返す関数
+        self._loaders = dict(loaders)
+        self._models: Dict[str, Dict] = {}
+        self._states = {name: STATE_UNLOADED for name in self._loaders}
+        self._load_times: Dict[str, float] = {}
+        self._loaded_at: Dict[str, float] = {}
+        self._locks = {name: threading.Lock() for name in self._loaders}
+        # 読み込みに失敗した時刻（time.monotonic()）
+        self.retry_seconds = retry_seconds
+        self._failed_at: Dict[str, float] = {}
+
+        # LRU管理（モデル名 → バイト数、末尾が最近使われたモデル）
+        self.memory_budget_bytes = memory_budget_bytes
+        self._lru: "OrderedDict[str, int]" = OrderedDict()
+        self._lru_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._loaders
+
+    def names(self) -> List[str]:
+        """登録されているモデル名の一覧"""
+        return list(self._loaders.keys())
+
+    def is_loaded(self, name: str) -> bool:
+        """モデルが読み込み済みかどうか"""
+        return self._states.get(name) == STATE_LOADED
+
+    def get(self, name: str) -> Dict:
+        """モデル情報を取得する（未読み込みの場合はここで読み込む）"""
+        if name not in self._loaders:
+            raise KeyError(name)
+
+        # 読み込み済みならモデルのロックを取らずに返す
+        model_info = self._models.get(name)
+        if model_info is not None and not self._should_retry(name):
+            self._record_hit(name)
+            return model_info
+
+        with self._locks[name]:
+            # ロック待ちの間に他のスレッドが読み込んだ場合
+            model_info = self._models.get(name)
+            if model_info is not None and not self._should_retry(name):
+                self._record_hit(name)
+                return model_info
+
+            # 推論のスレッド数はモデルを初めて読み込む時点で設定する（モジュールのインポートを軽く保つ）
+            from .execution import ensure_process_configured
+            ensure_process_configured()
+
+            with self._lru_lock:
+                self.misses += 1
+            self._states[name] = STATE_LOADING
+            logger.info(f"モデル読み込み開始: {name}")
+            started = time.perf_counter()
+            try:
+                model_info = self._loaders[name]()
+            except Exception as e:
+                self._states[name] = STATE_UNLOADED
+                logger.error(f"モデル読み込みエラー: {name}: {e}")
+                raise
+            elapsed = time.perf_counter() - started
+
+            self._load_times[name] = elapsed
+            self._loaded_at[name] = time.time()
+            # 読み込みに失敗したモデル（model=None）も再試行までの間は結果を保持し、毎回の再読み込みを避ける
+            self._states[name] = STATE_LOADED if model_info.get('model') is not None else STATE_FAILED
+            if self._states[name] == STATE_FAILED:
+                self._failed_at[name] = time.monotonic()
+            else:
+                self._failed_at.pop(name, None)
+            self._models[name] = model_info
+            logger.info(f"モデル読み込み完了: {name} ({elapsed:.2f}秒, 状態={self._states[name]})")
+
+            if self._states[name] == STATE_LOADED:
+                # 重みを数えられないモデル（TorchScriptの量子化モデルなど）はローダーが'nbytes'を返す
+                nbytes = model_info.get('nbytes') or get_model_nbytes(model_info['model'])
+                with self._lru_lock:
+                    self._lru[name] = nbytes
+                    self._evict_over_budget(keep=name)
+            return model_info
+
+    def _should_retry(self, name: str) -> bool:
+        """読み込みに失敗したモデルで、再試行までの時間が経過しているかどうか"""
+        failed_at = self._failed_at.get(name)
+        return failed_at is not None and time.monotonic() - failed_at >= self.retry_seconds
+
+    def _record_hit(self, name: str) -> None:
+        """キャッシュヒットを記録し、LRUの末尾に移動する"""
+        with self._lru_lock:
+            self.hits += 1
+            if name in self._lru:
+                self._lru.move_to_end(name)
+
+    def _evict_over_budget(self, keep: str) -> None:
+        """メモリ上限を超えている間、最も長く使われていないモデルを破棄する（_lru_lock取得済みで呼ぶ）"""
+        if self.memory_budget_bytes is None:
+            return
+
+        while sum(self._lru.values()) > self.memory_budget_bytes:
+            victim = next((name for name in self._lru if name != keep), None)
+            if victim is None:
+                # 読み込んだモデル単体で上限を超える場合は保持する
+                logger.warning(f"モデル単体でメモリ上限を超えています: {keep} ({self._lru[keep]} bytes)")
+                break
+            nbytes = self._lru.pop(victim)
+            # 推論中のスレッドが参照を持っている場合、その推論完了後に解放される
+            self._models.pop(victim, None)
+            self._states[victim] = STATE_UNLOADED
+            self.evictions += 1
+            logger.info(f"モデルを破棄（LRU）: {victim} ({nbytes} bytes)")
+
+    def unload(self, name: str) -> None:
+        """モデルを破棄する（次回のget時に再読み込みされる。読み込みに失敗したモデルもすぐに再試行できる）"""
+        if name not in self._loaders:
+            raise KeyError(name)
+        with self._locks[name]:
+            with self._lru_lock:
+                self._lru.pop(name, None)
+                self._models.pop(name, None)
+                self._failed_at.pop(name, None)
+                self._states[name] = STATE_UNLOADED
+            logger.info(f"モデルを破棄: {name}")
+
+    def preload(self, names: Iterable[str]) -> None:
+        """指定されたモデルを事前に読み込む"""
+        for name in names:
+            if name not in self._loaders:
+                logger.warning(f"事前読み込み対象のモデルが存在しません: {name}")
+                continue
+            self.get(name)
+
+    def status(self) -> Dict[str, Dict]:
+        """各モデルの読み込み状態と読み込み時間"""
+        return {
+            name: {
+                'state': self._states[name],
+                'load_time': self._load_times.get(name),
+                'loaded_at': self._loaded_at.get(name),
+                'size_bytes': self._lru.get(name),
+            }
+            for name in self._loaders
+        }
+
+    def cache_stats(self) -> Dict:
+        """メモリ上限の調整用の統計情報（ヒット・ミス・破棄回数と使用量）"""
+        with self._lru_lock:
+            return {
+                'memory_budget_bytes': self.memory_budget_bytes,
+                'resident_bytes': sum(self._lru.values()),
+                'resident_models': list(self._lru.keys()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
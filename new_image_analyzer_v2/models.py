@@ -3,9 +3,23 @@ from django.conf import settings
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth.models import BaseUserManager
+from decimal import Decimal
+from typing import NamedTuple
 import os
 
 
+# 画像ごとに保持する最新の解析結果の件数
+LATEST_RESULTS_COUNT = 3
+
+
+class LatestResult(NamedTuple):
+    """最新の解析実行の結果（TransUploadedImage.latest_results の1件。TransImageAnalysisと同じ属性名で参照できる）"""
+    label: str
+    confidence: Decimal
+    rank: int
+    model_name: str
+
+
 class MstUserManager(BaseUserManager):
     """MstUser用のカスタムマネージャー"""
     
@@ -119,6 +133,16 @@ class TransUploadedImage(models.Model):
         ('failed', '解析失敗'),
     ]
     
+    # 解析段階の選択肢（解析パイプラインの実行順）
+    ANALYSIS_STAGE_CHOICES = [
+        ('queued', '解析待ち'),
+        ('decoding', '画像読み込み中'),
+        ('preprocessing', '前処理中'),
+        ('inference', '解析中'),
+        ('postprocessing', '結果処理中'),
+        ('persisted', '解析完了'),
+    ]
+    
     # 主キー
     image_id = models.AutoField(
         primary_key=True,
@@ -158,6 +182,58 @@ class TransUploadedImage(models.Model):
         verbose_name='ステータス'
     )
     
+    analysis_stage = models.CharField(
+        max_length=20,
+        choices=ANALYSIS_STAGE_CHOICES,
+        blank=True,
+        default='',
+        verbose_name='解析段階',
+        help_text='解析パイプラインが最後に到達した段階'
+    )
+    
+    content_digest = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        db_index=True,
+        verbose_name='内容ダイジェスト',
+        help_text='ファイル内容のSHA-256（同じ画像の解析結果を再利用するためのキー）'
+    )
+    
+    perceptual_hash = models.CharField(
+        max_length=16,
+        blank=True,
+        default='',
+        verbose_name='知覚ハッシュ',
+        help_text='64ビットのdHash（16進）。再圧縮・リサイズされた類似画像の検出に使用'
+    )
+    
+    # 最新の解析実行の結果（一覧表示などで解析結果テーブルを参照しないよう、解析完了時に更新する）
+    latest_results = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name='最新の解析結果',
+        help_text='最新の解析実行の上位の結果（信頼度の高い順、label / confidence / rank）'
+    )
+    
+    latest_model_name = models.CharField(
+        max_length=50,
+        blank=True,
+        default='',
+        verbose_name='最新の解析モデル'
+    )
+    
+    latest_run_id = models.ForeignKey(
+        'TransAnalysisRun',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name='最新の解析実行ID',
+        related_name='+',
+        db_column='latest_run_id',
+        help_text='最後に完了した解析実行（最新の解析結果はこの実行の結果）'
+    )
+    
     # タイムスタンプ
     created_at = models.DateTimeField(
         auto_now_add=True,
@@ -187,6 +263,24 @@ class TransUploadedImage(models.Model):
         verbose_name = '画像アップロード'
         verbose_name_plural = '画像アップロード'
         ordering = ['-created_at']
+        indexes = [
+            # ユーザーごとの画像一覧（user_id + 新しい順。キーセット方式のページネーション用に image_id を含める）用
+            models.Index(fields=['user_id', '-created_at', '-image_id'], name='uploaded_image_user_keyset_idx'),
+            # 全ユーザーの画像一覧（新しい順）用
+            models.Index(fields=['-created_at', '-image_id'], name='uploaded_image_keyset_idx'),
+            # 解析待ちの順番（ユーザー・ステータスごとの upload_order 順）用。解析中・準備中の画像だけを対象にする
+            models.Index(
+                fields=['user_id', 'status', 'upload_order'],
+                condition=models.Q(status__in=['analyzing', 'preparing']),
+                name='uploaded_image_queue_idx'
+            ),
+            # 準備中の画像全体の upload_order 順（解析ジョブの登録）用
+            models.Index(
+                fields=['status', 'upload_order'],
+                condition=models.Q(status__in=['analyzing', 'preparing']),
+                name='uploaded_image_pending_idx'
+            ),
+        ]
     
     @property
     def thumbnail_url(self):
@@ -200,18 +294,43 @@ class TransUploadedImage(models.Model):
         encoded_path = urllib.parse.quote(relative_path, safe='/')
         return f"{settings.MEDIA_URL}{encoded_path}"
     
+    def set_latest_results(self, run, analysis_results, model_name):
+        """最新の解析実行とその結果を設定する（保存は呼び出し元で行う）
+
+        analysis_resultsは label / confidence を持つ辞書のリスト（保存した解析結果の行と同じ順序）。
+        信頼度の高い順に上位LATEST_RESULTS_COUNT件を保持する。
+        """
+        # 順位は保存した解析結果の行と同じ（結果の並び順）
+        ranked = [
+            {
+                'label': result.get('label', 'Unknown'),
+                'confidence': round(float(result.get('confidence', 0.0)), 2),
+                'rank': i + 1,
+            }
+            for i, result in enumerate(analysis_results)
+        ]
+        ranked.sort(key=lambda result: -result['confidence'])
+        self.latest_results = ranked[:LATEST_RESULTS_COUNT]
+        self.latest_model_name = model_name or ''
+        self.latest_run_id = run
+    
+    def clear_latest_results(self):
+        """最新の解析結果を消去する（解析結果を削除した場合。保存は呼び出し元で行う）"""
+        self.latest_results = []
+        self.latest_model_name = ''
+        self.latest_run_id = None
+    
     def get_previous_results(self):
         """前回の解析結果を取得（最新の解析実行の結果を信頼度順で取得、上位3件）"""
-        # まず最新の解析完了時刻を取得
-        latest_analysis_time = TransImageAnalysis.objects.filter(image_id=self).order_by('-analysis_completed_at').first()
-        if latest_analysis_time:
-            # 最新の解析実行の結果を信頼度順で取得（上位3件まで）
-            return TransImageAnalysis.objects.filter(
-                image_id=self,
-                analysis_completed_at=latest_analysis_time.analysis_completed_at
-            ).order_by('-confidence')[:3]
-        else:
-            return TransImageAnalysis.objects.none()
+        return [
+            LatestResult(
+                label=result['label'],
+                confidence=Decimal(str(result['confidence'])).quantize(Decimal('0.01')),
+                rank=result['rank'],
+                model_name=self.latest_model_name,
+            )
+            for result in self.latest_results or []
+        ]
     
     def get_previous_results_text(self):
         """前回の解析結果をテキスト形式で取得"""
@@ -229,6 +348,97 @@ class TransUploadedImage(models.Model):
         return f"{self.filename} ({self.get_status_display()})"
 
 
+class TransAnalysisRun(models.Model):
+    """画像解析実行テーブル（1回の解析の実行。解析結果の行はこの実行に属する）"""
+    
+    # ステータスの選択肢
+    STATUS_CHOICES = [
+        ('running', '実行中'),
+        ('succeeded', '完了'),
+        ('failed', '失敗'),
+    ]
+    
+    # 主キー
+    run_id = models.AutoField(
+        primary_key=True,
+        verbose_name='解析実行ID'
+    )
+    
+    # 外部キー
+    image_id = models.ForeignKey(
+        TransUploadedImage,
+        on_delete=models.CASCADE,
+        verbose_name='画像ID',
+        related_name='analysis_runs',
+        db_column='image_id'
+    )
+    
+    model_name = models.CharField(
+        max_length=50,
+        verbose_name='モデル名'
+    )
+    
+    # 解析結果のバージョン（AnalysisService.get_model_version）。外部から登録された結果など不明な場合は空
+    model_version = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        verbose_name='モデルバージョン',
+        help_text='類似画像の解析結果は同じバージョンで成功した解析実行のものだけを再利用する'
+    )
+    
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='running',
+        verbose_name='ステータス'
+    )
+    
+    # 実行時刻
+    started_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='解析開始時刻'
+    )
+    
+    completed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='解析完了時刻'
+    )
+    
+    # 段階ごとの処理時間（ミリ秒）。TransAnalysisJob.timings と同じ形式
+    timings = models.JSONField(
+        null=True,
+        blank=True,
+        verbose_name='処理時間',
+        help_text='解析パイプラインの段階ごとの処理時間（ミリ秒）'
+    )
+    
+    # エラー情報
+    error = models.TextField(
+        blank=True,
+        null=True,
+        verbose_name='解析エラー'
+    )
+    
+    class Meta:
+        db_table = 'trans_analysis_run_v2'
+        verbose_name = '画像解析実行'
+        verbose_name_plural = '画像解析実行'
+        ordering = ['image_id', '-started_at']
+        indexes = [
+            # 画像ごとの最新の完了した解析実行（image_id + 完了時刻の新しい順）用
+            models.Index(
+                fields=['image_id', '-completed_at'],
+                condition=models.Q(status='succeeded'),
+                name='analysis_run_latest_idx'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Run {self.run_id}: {self.image_id_id} {self.model_name} ({self.get_status_display()})"
+
+
 class TransImageAnalysis(models.Model):
     """画像解析結果テーブル"""
     
@@ -247,6 +457,16 @@ class TransImageAnalysis(models.Model):
         db_column='image_id'
     )
     
+    # 単独のインデックスは (run_id, -confidence) の複合インデックスで代用する
+    run_id = models.ForeignKey(
+        TransAnalysisRun,
+        on_delete=models.CASCADE,
+        verbose_name='解析実行ID',
+        related_name='results',
+        db_column='run_id',
+        db_index=False
+    )
+    
     # 解析結果
     label = models.CharField(
         max_length=100,
@@ -269,6 +489,24 @@ class TransImageAnalysis(models.Model):
         verbose_name='順位'
     )
     
+    # 再利用の記録（類似画像の解析結果を再利用した場合）
+    reused_from = models.ForeignKey(
+        TransUploadedImage,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name='再利用元画像ID',
+        related_name='reused_analysis_results',
+        db_column='reused_from_image_id'
+    )
+    
+    reuse_distance = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        verbose_name='再利用元との距離',
+        help_text='知覚ハッシュのハミング距離'
+    )
+    
     # 解析時刻
     analysis_started_at = models.DateTimeField(
         default=timezone.now,
@@ -293,7 +531,184 @@ class TransImageAnalysis(models.Model):
         verbose_name = '画像解析結果'
         verbose_name_plural = '画像解析結果'
         ordering = ['image_id', 'rank']
+        indexes = [
+            # 解析実行ごとの上位の解析結果（run_id + 信頼度の高い順）用
+            models.Index(fields=['run_id', '-confidence'], name='image_analysis_run_top_idx'),
+        ]
     
     def __str__(self):
         return f"{self.image_id.filename} - {self.label} ({self.confidence}%)"
 
+
+
+class TransAnalysisJob(models.Model):
+    """画像解析ジョブテーブル（ワーカーが取得して実行する解析キュー）"""
+    
+    # ステータスの選択肢
+    STATUS_CHOICES = [
+        ('queued', '待機中'),
+        ('running', '実行中'),
+        ('succeeded', '完了'),
+        ('failed', '失敗'),
+    ]
+    
+    # 主キー
+    job_id = models.AutoField(
+        primary_key=True,
+        verbose_name='ジョブID'
+    )
+    
+    # 外部キー
+    image_id = models.ForeignKey(
+        TransUploadedImage,
+        on_delete=models.CASCADE,
+        verbose_name='画像ID',
+        related_name='analysis_jobs',
+        db_column='image_id'
+    )
+    
+    model_name = models.CharField(
+        max_length=50,
+        verbose_name='モデル名'
+    )
+    
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='queued',
+        verbose_name='ステータス'
+    )
+    
+    # リトライ管理
+    attempts = models.PositiveIntegerField(
+        default=0,
+        verbose_name='実行回数'
+    )
+    
+    max_attempts = models.PositiveIntegerField(
+        default=3,
+        verbose_name='最大実行回数'
+    )
+    
+    available_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='実行可能時刻',
+        help_text='リトライ時はバックオフ後の時刻'
+    )
+    
+    # 実行中のワーカー情報
+    locked_by = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        verbose_name='実行ワーカー'
+    )
+    
+    locked_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='取得時刻'
+    )
+    
+    # エラー情報
+    last_error = models.TextField(
+        blank=True,
+        null=True,
+        verbose_name='最終エラー'
+    )
+    
+    # 段階ごとの処理時間（ミリ秒）。{'decoding': 12.3, 'inference': 45.6, ..., 'total': 80.1}
+    timings = models.JSONField(
+        null=True,
+        blank=True,
+        verbose_name='処理時間',
+        help_text='解析パイプラインの段階ごとの処理時間（ミリ秒）'
+    )
+    
+    # タイムスタンプ
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='登録日時'
+    )
+    
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='更新日時'
+    )
+    
+    class Meta:
+        db_table = 'trans_analysis_job_v2'
+        verbose_name = '画像解析ジョブ'
+        verbose_name_plural = '画像解析ジョブ'
+        ordering = ['available_at', 'job_id']
+        indexes = [
+            # ワーカーのジョブ取得（status + available_at）用
+            models.Index(fields=['status', 'available_at'], name='analysis_job_claim_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Job {self.job_id}: {self.image_id_id} ({self.get_status_display()})"
+
+
+class TransAnalysisResultCache(models.Model):
+    """解析結果キャッシュテーブル（同じ画像・モデル・モデルバージョンの解析結果を再利用する）"""
+    
+    # 主キー
+    cache_id = models.AutoField(
+        primary_key=True,
+        verbose_name='キャッシュID'
+    )
+    
+    # キャッシュキー
+    content_digest = models.CharField(
+        max_length=64,
+        verbose_name='内容ダイジェスト'
+    )
+    
+    model_name = models.CharField(
+        max_length=50,
+        verbose_name='モデル名'
+    )
+    
+    model_version = models.CharField(
+        max_length=100,
+        verbose_name='モデルバージョン',
+        help_text='重みや後処理が変わった場合は別のキャッシュとして扱う'
+    )
+    
+    # 解析結果（label / confidence / model_name / rank のリスト）
+    results = models.JSONField(
+        verbose_name='解析結果'
+    )
+    
+    # 利用状況
+    hit_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='ヒット回数'
+    )
+    
+    last_hit_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='最終ヒット日時'
+    )
+    
+    # タイムスタンプ
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='登録日時'
+    )
+    
+    class Meta:
+        db_table = 'trans_analysis_result_cache_v2'
+        verbose_name = '解析結果キャッシュ'
+        verbose_name_plural = '解析結果キャッシュ'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['content_digest', 'model_name', 'model_version'],
+                name='analysis_result_cache_key_uniq'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.content_digest[:12]} - {self.model_name} ({self.model_version})"
@@ -0,0 +1,177 @@
+"""
+類似画像（ニアデュプリケート）検出
+アップロード時に知覚ハッシュ（dHash）を計算し、ハミング距離が近い解析済み画像の結果を再利用する
+再圧縮・リサイズされたコピーはバイト列が異なるため、内容ダイジェストの完全一致では検出できない
+"""
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import F, Q
+from PIL import Image as PILImage
+
+from .models import TransImageAnalysis, TransUploadedImage
+
+logger = logging.getLogger(__name__)
+
+# dHashの一辺のサイズ（8 → 64ビット）
+HASH_SIZE = 8
+
+
+def compute_dhash(image_path: str, hash_size: int = HASH_SIZE) -> str:
+    """画像のdHash（隣接画素の明暗差）を16進文字列で返す"""
+    with PILImage.open(image_path) as image:
+        image.draft('L', (hash_size * 4, hash_size * 4))
+        pixels = image.convert('L').resize((hash_size + 1, hash_size), PILImage.LANCZOS).load()
+
+    value = 0
+    for y in range(hash_size):
+        for x in range(hash_size):
+            value = (value << 1) | (1 if pixels[x, y] > pixels[x + 1, y] else 0)
+    return f'{value:0{hash_size * hash_size // 4}x}'
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """ハミング距離で近いハッシュを探すBK木
+
+    各ノードは子を「親との距離」ごとに持ち、三角不等式により探索範囲外の部分木を枝刈りする。
+    """
+
+    def __init__(self):
+        # ノード: [ハッシュ値, 値のリスト, {距離: 子ノード}]
+        self._root = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, value: int, item) -> None:
+        self._size += 1
+        if self._root is None:
+            self._root = [value, [item], {}]
+            return
+
+        node = self._root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, object]]:
+        """距離がmax_distance以内の値を (距離, 値) のリストで近い順に返す"""
+        if self._root is None:
+            return []
+
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= max_distance:
+                found.extend((distance, item) for item in node[1])
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+
+class NearDuplicateIndex:
+    """画像IDを知覚ハッシュで引くプロセス内の索引
+
+    初回検索時にDBから構築し、以降は検索のたびに前回より新しい画像だけを追加する
+    （別プロセスでアップロードされた画像も取り込まれる）。
+    """
+
+    def __init__(self):
+        self._tree = BKTree()
+        self._last_image_id = 0
+        self._lock = threading.Lock()
+
+    def sync(self) -> None:
+        """前回の同期以降に登録された画像を索引に追加する"""
+        with self._lock:
+            rows = (
+                TransUploadedImage.objects
+                .filter(image_id__gt=self._last_image_id)
+                .exclude(perceptual_hash='')
+                .order_by('image_id')
+                .values_list('image_id', 'perceptual_hash')
+            )
+            for image_id, perceptual_hash in rows:
+                self._tree.add(int(perceptual_hash, 16), image_id)
+                self._last_image_id = image_id
+
+    def search(self, perceptual_hash: str, max_distance: int) -> List[Tuple[int, int]]:
+        """距離がmax_distance以内の画像を (距離, 画像ID) のリストで近い順に返す"""
+        self.sync()
+        with self._lock:
+            return self._tree.search(int(perceptual_hash, 16), max_distance)
+
+
+near_duplicate_index = NearDuplicateIndex()
+
+
+def find_reusable_results(image: TransUploadedImage, model_name: str,
+                          model_version: Optional[str]) -> Optional[List[Dict]]:
+    """同じモデル・モデルバージョンで解析済みの類似画像があれば、その解析結果を再利用元の情報付きで返す"""
+    if not getattr(settings, 'ANALYSIS_NEAR_DUPLICATE_REUSE', False) or not image.perceptual_hash or not model_version:
+        return None
+
+    max_distance = getattr(settings, 'ANALYSIS_NEAR_DUPLICATE_MAX_DISTANCE', 4)
+    candidates = [
+        (distance, image_id)
+        for distance, image_id in near_duplicate_index.search(image.perceptual_hash, max_distance)
+        if image_id != image.image_id
+    ]
+    if not candidates:
+        return None
+
+    # 候補のうち、同じモデル・モデルバージョンでエラーなく成功した最新の解析実行の結果を1回のクエリで取得
+    # （古い重みの結果や、失敗時に保存されていた仮の結果は再利用しない）
+    results_by_image: Dict[int, List[Dict]] = {}
+    rows = (
+        TransImageAnalysis.objects
+        .filter(
+            Q(run_id__error__isnull=True) | Q(run_id__error=''),
+            image_id__in=[image_id for _, image_id in candidates],
+            image_id__status='completed',
+            run_id=F('image_id__latest_run_id'),
+            run_id__status='succeeded',
+            run_id__model_version=model_version,
+            model_name=model_name,
+        )
+        .order_by('rank')
+        .values('image_id', 'label', 'confidence', 'rank')
+    )
+    for row in rows:
+        results_by_image.setdefault(row['image_id'], []).append(row)
+
+    for distance, source_image_id in candidates:
+        source_results = results_by_image.get(source_image_id)
+        if not source_results:
+            continue
+        logger.info(f"類似画像の解析結果を再利用: 画像ID={image.image_id} ← {source_image_id} (距離={distance})")
+        return [
+            {
+                'label': row['label'],
+                'confidence': float(row['confidence']),
+                'model_name': model_name,
+                'rank': row['rank'],
+                'reused_from': source_image_id,
+                'reuse_distance': distance,
+            }
+            for row in source_results
+        ]
+    return None
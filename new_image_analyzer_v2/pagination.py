@@ -0,0 +1,198 @@
+"""
+画像一覧のページネーション
+(created_at, image_id) の新しい順のキーセット（カーソル）方式で、OFFSETを使わずに次・前のページを取得する。
+総件数はテーブルの統計情報から見積もることができる（大きなテーブルでCOUNT(*)を避ける）。
+
+画面の番号付きページ用には、統計情報の件数と主キーだけを読むOFFSETを使うPaginatorも提供する。
+"""
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.core import signing
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+
+# 並び順（新しい順。同じ作成日時の画像は image_id で順序を決める）
+KEYSET_ORDERING = ('-created_at', '-image_id')
+
+_CURSOR_SALT = 'new_image_analyzer_v2.pagination.cursor'
+
+
+class InvalidCursor(ValueError):
+    """改ざん・破損したカーソル"""
+
+
+def encode_cursor(created_at: datetime, image_id: int, direction: str) -> str:
+    """ページの境目の画像と読む方向（'next' / 'prev'）を不透明なトークンにする"""
+    return signing.dumps({'c': created_at.isoformat(), 'i': image_id, 'd': direction}, salt=_CURSOR_SALT)
+
+
+def decode_cursor(token: str) -> Tuple[datetime, int, str]:
+    """トークンを (created_at, image_id, direction) に戻す（不正なトークンは InvalidCursor）"""
+    try:
+        data = signing.loads(token, salt=_CURSOR_SALT)
+        created_at = datetime.fromisoformat(data['c'])
+        image_id = int(data['i'])
+        direction = data['d']
+    except (signing.BadSignature, KeyError, TypeError, ValueError) as e:
+        raise InvalidCursor(f"不正なカーソルです: {e}")
+    if direction not in ('next', 'prev'):
+        raise InvalidCursor(f"不正なカーソルの方向です: {direction}")
+    return created_at, image_id, direction
+
+
+class KeysetPage:
+    """キーセット方式の1ページ（前後のページのカーソルを持つ）"""
+
+    def __init__(self, object_list: List, has_next: bool, has_previous: bool):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    def _cursor(self, obj, direction: str) -> str:
+        return encode_cursor(obj.created_at, obj.image_id, direction)
+
+    @property
+    def next_cursor(self) -> Optional[str]:
+        return self._cursor(self.object_list[-1], 'next') if self.has_next else None
+
+    @property
+    def previous_cursor(self) -> Optional[str]:
+        return self._cursor(self.object_list[0], 'prev') if self.has_previous else None
+
+
+def paginate_keyset(queryset: QuerySet, cursor: Optional[str], per_page: int) -> KeysetPage:
+    """カーソルの次（または前）のページを取得する（1件多く読んで続きの有無を判定する）
+
+    WHERE created_at <= c AND (created_at < c OR image_id < i) の形にして、
+    (created_at, image_id) のインデックスを範囲検索できるようにする。
+    """
+    if cursor is None:
+        rows = list(queryset.order_by(*KEYSET_ORDERING)[:per_page + 1])
+        return KeysetPage(rows[:per_page], has_next=len(rows) > per_page, has_previous=False)
+
+    created_at, image_id, direction = decode_cursor(cursor)
+    if direction == 'next':
+        rows = list(
+            queryset
+            .filter(Q(created_at__lte=created_at), Q(created_at__lt=created_at) | Q(image_id__lt=image_id))
+            .order_by(*KEYSET_ORDERING)[:per_page + 1]
+        )
+        return KeysetPage(rows[:per_page], has_next=len(rows) > per_page, has_previous=True)
+
+    # 前のページは逆順に読んで並べ直す
+    rows = list(
+        queryset
+        .filter(Q(created_at__gte=created_at), Q(created_at__gt=created_at) | Q(image_id__gt=image_id))
+        .order_by('created_at', 'image_id')[:per_page + 1]
+    )
+    has_previous = len(rows) > per_page
+    return KeysetPage(rows[:per_page][::-1], has_next=True, has_previous=has_previous)
+
+
+def _estimated_rows(queryset: QuerySet) -> Optional[int]:
+    """PostgreSQLの実行計画の見積もり行数（統計情報から求めるため、テーブルを走査しない）"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql' or queryset.query.is_empty():
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def approximate_count(queryset: QuerySet, threshold: Optional[int] = None) -> Tuple[int, bool]:
+    """件数を (件数, 見積もりかどうか) で返す
+
+    見積もりが閾値（IMAGE_TABLE_EXACT_COUNT_THRESHOLD、既定10000件）未満の場合や
+    見積もりができないDBでは、COUNT(*) で正確な件数を返す。
+    """
+    if threshold is None:
+        threshold = getattr(settings, 'IMAGE_TABLE_EXACT_COUNT_THRESHOLD', 10000)
+    estimate = _estimated_rows(queryset)
+    if estimate is None or estimate < threshold:
+        return queryset.count(), False
+    return estimate, True
+
+
+class ImageTablePaginator(Paginator):
+    """画像一覧の番号付きページ用のPaginator
+
+    総件数は approximate_count で求め、ページの画像は主キーだけを読むOFFSET（インデックスのみの走査）で
+    絞り込んでから取得する。並び順は KEYSET_ORDERING に揃える。
+
+    件数が見積もりの場合は、ページ番号を見積もりのページ数で切り詰めず、1件多く読んだ結果で
+    次のページの有無を判定して件数を補正する（見積もりが少なすぎても後ろのページに到達でき、
+    多すぎても空のページを表示しない）。
+    """
+
+    def __init__(self, object_list: QuerySet, per_page, **kwargs):
+        super().__init__(object_list.order_by(*KEYSET_ORDERING), per_page, **kwargs)
+
+    @cached_property
+    def _count(self) -> Tuple[int, bool]:
+        return approximate_count(self.object_list)
+
+    @cached_property
+    def count(self) -> int:
+        return self._count[0]
+
+    @property
+    def count_is_approximate(self) -> bool:
+        return self._count[1]
+
+    def _set_count(self, count: int, is_approximate: bool) -> None:
+        """件数を差し替え、件数から求めたページ数のキャッシュを破棄する"""
+        self.__dict__['_count'] = (count, is_approximate)
+        self.__dict__.pop('count', None)
+        self.__dict__.pop('num_pages', None)
+
+    def validate_number(self, number):
+        if not self.count_is_approximate:
+            return super().validate_number(number)
+
+        # 見積もりのページ数より後ろにも画像がありうるため、上限の確認は page() で実際に読んで行う
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages['invalid_page'])
+        if number < 1:
+            raise EmptyPage(self.error_messages['min_page'])
+        return number
+
+    def get_page(self, number):
+        try:
+            return super().get_page(number)
+        except EmptyPage:
+            # 見積もりより実際の件数が少なかった場合は、page() で正確にした件数の最終ページを返す
+            return self.page(self.num_pages)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        image_ids = list(self.object_list.values_list('image_id', flat=True)[bottom:bottom + self.per_page + 1])
+
+        if self.count_is_approximate:
+            if len(image_ids) > self.per_page:
+                # 次のページがある: 見積もりが少なすぎる場合は、少なくとも次のページまで辿れる件数にする
+                self._set_count(max(self.count, bottom + len(image_ids)), True)
+            elif image_ids or number == 1:
+                # 最後のページを読んだので正確な件数が分かる
+                self._set_count(bottom + len(image_ids), False)
+            else:
+                # 見積もりが多すぎて実際の最終ページより後ろ: 正確な件数にして範囲外とする
+                self._set_count(self.object_list.count(), False)
+                raise EmptyPage(self.error_messages['no_results'])
+
+        image_ids = image_ids[:self.per_page]
+        images = self.object_list.model._default_manager.in_bulk(image_ids)
+        return self._get_page([images[image_id] for image_id in image_ids if image_id in images], number, self)
@@ -0,0 +1,106 @@
+"""
+画像前処理
+画像ファイルを1回だけデコードし、モデル入力用の正規化済みテンソルに変換する
+
+JPEGはデコード時にDCTスケーリング（draftモード）で必要な解像度近くまで縮小するため、
+大きな写真でもフル解像度の画素を展開しない。縮小と中央切り抜きは1回のリサイズで行う。
+"""
+import math
+from functools import lru_cache
+from typing import NamedTuple, Tuple
+
+from PIL import Image as PILImage
+
+
+class PreprocessSpec(NamedTuple):
+    """モデルの入力仕様（短辺resize_toに縮小 → 中央crop_size四方を切り抜き → 正規化）"""
+    resize_to: int
+    crop_size: int
+    mean: Tuple[float, float, float]
+    std: Tuple[float, float, float]
+    resample: int
+
+
+# torchvisionのImageNet学習済みモデル（Resize(256) + CenterCrop(224) + Normalize）
+IMAGENET_SPEC = PreprocessSpec(
+    resize_to=256,
+    crop_size=224,
+    mean=(0.485, 0.456, 0.406),
+    std=(0.229, 0.224, 0.225),
+    resample=PILImage.BILINEAR,
+)
+
+# CLIP ViT-B/32（Resize(224, bicubic) + CenterCrop(224) + CLIPの正規化）
+CLIP_SPEC = PreprocessSpec(
+    resize_to=224,
+    crop_size=224,
+    mean=(0.48145466, 0.4578275, 0.40821073),
+    std=(0.26862954, 0.26130258, 0.27577711),
+    resample=PILImage.BICUBIC,
+)
+
+
+def decode_image(image_path: str, spec: PreprocessSpec) -> PILImage.Image:
+    """画像を読み込み、短辺がresize_to以上の範囲でできるだけ小さくデコードしたRGB画像を返す"""
+    with PILImage.open(image_path) as image:
+        width, height = image.size
+        scale = spec.resize_to / min(width, height)
+        if scale < 1:
+            # JPEGの場合のみ有効（1/2, 1/4, 1/8のうち、要求サイズ以上に収まる最小の縮小率が選ばれる）
+            image.draft('RGB', (math.ceil(width * scale), math.ceil(height * scale)))
+        return image.convert('RGB')
+
+
+def _crop_box(width: int, height: int, spec: PreprocessSpec) -> Tuple[float, float, float, float]:
+    """「短辺をresize_toに縮小して中央をcrop_size四方で切り抜く」範囲を元画像の座標で返す"""
+    if width <= height:
+        resized_w, resized_h = spec.resize_to, int(spec.resize_to * height / width)
+    else:
+        resized_w, resized_h = int(spec.resize_to * width / height), spec.resize_to
+    top = int(round((resized_h - spec.crop_size) / 2.0))
+    left = int(round((resized_w - spec.crop_size) / 2.0))
+
+    scale_x = width / resized_w
+    scale_y = height / resized_h
+    return (
+        left * scale_x,
+        top * scale_y,
+        (left + spec.crop_size) * scale_x,
+        (top + spec.crop_size) * scale_y,
+    )
+
+
+@lru_cache(maxsize=None)
+def _normalization(spec: PreprocessSpec):
+    """0-255の画素値に直接適用できる平均・標準偏差（3 x 1 x 1）"""
+    import torch
+
+    mean = torch.tensor([m * 255.0 for m in spec.mean]).view(3, 1, 1)
+    std = torch.tensor([s * 255.0 for s in spec.std]).view(3, 1, 1)
+    return mean, std
+
+
+def to_tensor(image: PILImage.Image, spec: PreprocessSpec, out=None):
+    """デコード済みのRGB画像をモデル入力用のテンソル（C x H x W、float32、正規化済み）に変換
+
+    outを指定した場合は結果をそのテンソル（共有メモリ上のバッファなど）に直接書き込む。
+    """
+    import numpy as np
+    import torch
+
+    # 縮小と中央切り抜きを1回のリサイズで行う
+    box = _crop_box(image.width, image.height, spec)
+    image = image.resize((spec.crop_size, spec.crop_size), spec.resample, box=box)
+
+    # HWCのuint8画素をそのままCHWのfloatに変換し、ToTensor（/255）とNormalizeをまとめて適用
+    pixels = torch.from_numpy(np.array(image)).permute(2, 0, 1)
+    mean, std = _normalization(spec)
+    if out is not None:
+        torch.sub(pixels, mean, out=out)
+        return out.div_(std)
+    return pixels.float().sub_(mean).div_(std).contiguous()
+
+
+def load_tensor(image_path: str, spec: PreprocessSpec, out=None):
+    """画像ファイルからモデル入力用のテンソルを作成する"""
+    return to_tensor(decode_image(image_path, spec), spec, out=out)
@@ -0,0 +1,100 @@
+"""
+解析進捗
+解析パイプラインの各段階（マイルストーン）を記録し、進捗APIとイベントストリームに提供する
+"""
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from . import events
+from .models import TransUploadedImage
+
+logger = logging.getLogger(__name__)
+
+# 解析の段階（実行順）: (段階, 進捗率, タイトル, 説明)
+ANALYSIS_STAGES = [
+    ('queued', 5, '解析待ち', '解析の順番を待っています...'),
+    ('decoding', 15, '画像読み込み中', '画像を読み込んでいます...'),
+    ('preprocessing', 30, '前処理中', '画像を解析用に変換しています...'),
+    ('inference', 50, '解析中', '画像を解析しています...'),
+    ('postprocessing', 85, '結果処理中', '解析結果を処理中...'),
+    ('persisted', 100, '解析完了', '画像解析が正常に完了しました'),
+]
+
+STAGE_INFO = {
+    stage: {'stage': stage, 'percentage': percentage, 'title': title, 'description': description}
+    for stage, percentage, title, description in ANALYSIS_STAGES
+}
+
+# これ以上変化しないステータス
+TERMINAL_STATUSES = ('completed', 'failed', 'error')
+
+
+def publish_stage(image_id: int, stage: str, status: str = 'analyzing') -> None:
+    """画像の解析段階を記録し、購読中のストリームに通知する"""
+    if stage not in STAGE_INFO:
+        raise ValueError(f"未知の解析段階: {stage}")
+
+    TransUploadedImage.objects.filter(image_id=image_id).update(analysis_stage=stage)
+    logger.info(f"解析進捗: 画像ID={image_id}, 段階={stage}")
+    events.publish(build_event(image_id, status, stage))
+
+
+def publish_stages(image_ids: Iterable[int], stage: str, status: str = 'analyzing') -> None:
+    """複数画像の解析段階を1回のクエリで記録し、購読中のストリームに通知する（一括解析用）"""
+    if stage not in STAGE_INFO:
+        raise ValueError(f"未知の解析段階: {stage}")
+
+    image_ids = list(image_ids)
+    TransUploadedImage.objects.filter(image_id__in=image_ids).update(analysis_stage=stage)
+    logger.info(f"解析進捗: 画像ID={image_ids}, 段階={stage}")
+    for image_id in image_ids:
+        events.publish(build_event(image_id, status, stage))
+
+
+def notify_image(image: TransUploadedImage) -> None:
+    """保存済みの画像の状態を購読中のストリームに通知する"""
+    events.publish(build_event(image.image_id, image.status, image.analysis_stage))
+
+
+def notify_images(image_ids: Iterable[int]) -> None:
+    """ステータスが変わった画像の現在の状態を購読中のストリームに通知する"""
+    for event in get_progress_snapshot(image_ids):
+        events.publish(event)
+
+
+def get_progress_snapshot(image_ids: Iterable[int]) -> List[Dict]:
+    """画像の現在の進捗を1回のクエリで取得する"""
+    rows = TransUploadedImage.objects.filter(image_id__in=list(image_ids)).values_list(
+        'image_id', 'status', 'analysis_stage'
+    )
+    return [build_event(image_id, status, stage) for image_id, status, stage in rows]
+
+
+def build_event(image_id: int, status: str, stage: Optional[str]) -> Dict:
+    """進捗イベント（ストリームで送る内容）を作成する"""
+    stage_info = get_stage_info(status, stage)
+    return {
+        'image_id': image_id,
+        'status': status,
+        'analysis_stage': stage_info['stage'],
+        'progress': stage_info['percentage'],
+        'description': stage_info['description'],
+    }
+
+
+def get_stage_info(status: str, stage: Optional[str]) -> Dict:
+    """画像のステータスと解析段階から進捗情報（進捗率・タイトル・説明）を返す"""
+    if status == 'completed':
+        return STAGE_INFO['persisted']
+
+    if status in ('analyzing', 'preparing') and stage in STAGE_INFO and stage != 'persisted':
+        return STAGE_INFO[stage]
+
+    if status in ('analyzing', 'preparing'):
+        # 段階が記録される前（ジョブ登録直後）
+        return STAGE_INFO['queued']
+
+    if status in ('failed', 'error'):
+        return {'stage': 'failed', 'percentage': 0, 'title': '解析失敗', 'description': '画像解析に失敗しました'}
+
+    return {'stage': 'waiting', 'percentage': 0, 'title': '待機中', 'description': '解析の準備をしています...'}
@@ -0,0 +1,228 @@
+"""
+INT8量子化モデル
+torchvisionの分類モデルをINT8に量子化した派生モデルを作成し、ディスクに保存して再利用する
+
+- dynamic: 全結合層（Linear）の重みをINT8にし、活性は推論時に量子化する（校正画像は不要）
+- static: FXグラフモードで畳み込み層も含めてINT8にする（校正画像で活性の範囲を求める）
+
+量子化したモデルはTorchScriptで保存するため、次回以降の起動では量子化・校正を行わずに読み込める。
+保存時の量子化元モデル・量子化方式・量子化エンジン・PyTorchのバージョンが一致しない場合は作り直す。
+"""
+import glob
+import json
+import logging
+import os
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+
+from .preprocessing import PreprocessSpec, load_tensor
+
+logger = logging.getLogger(__name__)
+
+
+class QuantizedVariant(NamedTuple):
+    """量子化した派生モデル（量子化元の内部モデル名と量子化方式）"""
+    base_model: str
+    method: str
+
+
+# 内部モデル名 → 量子化の内容
+QUANTIZED_VARIANTS = {
+    'pytorch_resnet50_int8': QuantizedVariant('pytorch_resnet50', 'static'),
+    'pytorch_resnet50_int8_dynamic': QuantizedVariant('pytorch_resnet50', 'dynamic'),
+    'pytorch_mobilenet_int8': QuantizedVariant('pytorch_mobilenet', 'static'),
+    'pytorch_mobilenet_int8_dynamic': QuantizedVariant('pytorch_mobilenet', 'dynamic'),
+    'pytorch_vgg16_int8': QuantizedVariant('pytorch_vgg16', 'static'),
+    'pytorch_vgg16_int8_dynamic': QuantizedVariant('pytorch_vgg16', 'dynamic'),
+    # EfficientNet-B0はSiLU・Squeeze-and-Excitationの前後でfp32との変換が増え、静的量子化では速くならない
+    'pytorch_efficientnet_int8_dynamic': QuantizedVariant('pytorch_efficientnet', 'dynamic'),
+}
+
+# 量子化エンジンの優先順（x86/fbgemmはIntel・AMD、qnnpackはARM向け）
+ENGINE_PREFERENCE = ('x86', 'fbgemm', 'qnnpack')
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+METADATA_FILE = 'quantization.json'
+
+
+def get_quantization_engine() -> str:
+    """使用する量子化エンジンを決める（設定で指定がなければCPUが対応しているものを優先順に選ぶ）"""
+    import torch
+
+    supported = torch.backends.quantized.supported_engines
+    engine = getattr(settings, 'ANALYSIS_QUANTIZATION_ENGINE', None)
+    if engine:
+        if engine not in supported:
+            raise ValueError(f"未対応の量子化エンジンです: {engine}（対応: {supported}）")
+        return engine
+    for engine in ENGINE_PREFERENCE:
+        if engine in supported:
+            return engine
+    raise RuntimeError(f"利用できる量子化エンジンがありません: {supported}")
+
+
+def get_quantized_model_path(internal_model_name: str) -> str:
+    model_dir = getattr(settings, 'ANALYSIS_QUANTIZED_MODEL_DIR', os.path.join(settings.BASE_DIR, 'model_cache', 'quantized'))
+    return os.path.join(str(model_dir), f'{internal_model_name}.pt')
+
+
+def get_calibration_paths(limit: Optional[int] = None, calibration_dir: Optional[str] = None) -> List[str]:
+    """静的量子化の校正に使う画像のパス
+
+    校正用ディレクトリ（ANALYSIS_QUANTIZATION_CALIBRATION_DIR）の画像を使い、
+    指定がなければ最近アップロードされた画像を使う。
+    """
+    from .models import TransUploadedImage
+
+    limit = limit or getattr(settings, 'ANALYSIS_QUANTIZATION_CALIBRATION_IMAGES', 64)
+    calibration_dir = calibration_dir or getattr(settings, 'ANALYSIS_QUANTIZATION_CALIBRATION_DIR', None)
+    if calibration_dir:
+        paths = sorted(
+            path for path in glob.glob(os.path.join(str(calibration_dir), '*'))
+            if path.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        return paths[:limit]
+
+    paths = []
+    recent = TransUploadedImage.objects.order_by('-image_id').values_list('file_path', flat=True)
+    for path in recent.iterator():
+        if path and os.path.exists(path):
+            paths.append(path)
+            if len(paths) >= limit:
+                break
+    return paths
+
+
+def _calibration_batches(image_paths: List[str], spec: PreprocessSpec, batch_size: int = 8):
+    import torch
+
+    batch = []
+    for image_path in image_paths:
+        try:
+            batch.append(load_tensor(image_path, spec))
+        except Exception as e:
+            logger.warning(f"校正画像をスキップ: {image_path}: {e}")
+            continue
+        if len(batch) >= batch_size:
+            yield torch.stack(batch)
+            batch = []
+    if batch:
+        yield torch.stack(batch)
+
+
+def quantize_model(model, method: str, spec: PreprocessSpec, calibration_paths: Optional[List[str]] = None):
+    """fp32モデルをINT8に量子化する（静的量子化では元のモデルのモジュールが融合されるため、使い回さない）"""
+    import torch
+    from torch.ao.quantization import get_default_qconfig_mapping, quantize_dynamic
+
+    model.eval()
+    if method == 'dynamic':
+        return quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if method != 'static':
+        raise ValueError(f"未対応の量子化方式です: {method}")
+
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    if not calibration_paths:
+        raise RuntimeError("静的量子化の校正に使う画像がありません（ANALYSIS_QUANTIZATION_CALIBRATION_DIRを設定してください）")
+
+    engine = get_quantization_engine()
+    torch.backends.quantized.engine = engine
+    example_inputs = (torch.zeros(1, 3, spec.crop_size, spec.crop_size),)
+    prepared = prepare_fx(model, get_default_qconfig_mapping(engine), example_inputs)
+
+    # 校正: 実際の画像を流して各層の活性の範囲を記録する
+    calibrated = 0
+    with torch.no_grad():
+        for batch in _calibration_batches(calibration_paths, spec):
+            prepared(batch)
+            calibrated += len(batch)
+    if not calibrated:
+        raise RuntimeError("校正画像を1枚も読み込めませんでした")
+    logger.info(f"静的量子化の校正完了: {calibrated}枚")
+    return convert_fx(prepared)
+
+
+def _metadata(variant: QuantizedVariant, base_version: str) -> Dict:
+    import torch
+
+    return {
+        'base_model': variant.base_model,
+        'base_version': base_version,
+        'method': variant.method,
+        'engine': get_quantization_engine(),
+        'torch': torch.__version__,
+    }
+
+
+def save_quantized_model(model, path: str, metadata: Dict, spec: PreprocessSpec) -> int:
+    """量子化モデルをTorchScriptで保存し、ファイルサイズ（バイト）を返す"""
+    import torch
+
+    example = torch.zeros(1, 3, spec.crop_size, spec.crop_size)
+    with torch.no_grad():
+        scripted = torch.jit.trace(model, example)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 書き込み途中のファイルを他のプロセスが読み込まないよう、一時ファイルに保存してから置き換える
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    torch.jit.save(scripted, tmp_path, _extra_files={METADATA_FILE: json.dumps(metadata, sort_keys=True)})
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def load_saved_quantized_model(path: str, metadata: Dict):
+    """保存済みの量子化モデルを読み込む（ファイルがない・内容が古い場合はNone）"""
+    import torch
+
+    if not os.path.exists(path):
+        return None
+    extra_files = {METADATA_FILE: ''}
+    model = torch.jit.load(path, map_location='cpu', _extra_files=extra_files)
+    try:
+        saved = json.loads(extra_files[METADATA_FILE])
+    except ValueError:
+        saved = None
+    if saved != metadata:
+        logger.info(f"保存済みの量子化モデルが古いため作り直します: {path}")
+        return None
+    model.eval()
+    return model
+
+
+def load_or_build_quantized_model(internal_model_name: str, base_loader: Callable[[], Dict],
+                                  base_version: str, spec: PreprocessSpec,
+                                  rebuild: bool = False,
+                                  calibration_paths: Optional[List[str]] = None) -> Tuple[object, int]:
+    """量子化モデルを読み込む。保存済みのファイルがなければfp32モデルから作成して保存する
+
+    戻り値は (モデル, ファイルサイズ)。
+    """
+    import torch
+
+    variant = QUANTIZED_VARIANTS[internal_model_name]
+    path = get_quantized_model_path(internal_model_name)
+    metadata = _metadata(variant, base_version)
+    torch.backends.quantized.engine = metadata['engine']
+
+    if not rebuild:
+        model = load_saved_quantized_model(path, metadata)
+        if model is not None:
+            logger.info(f"保存済みの量子化モデルを読み込み: {path}")
+            return model, os.path.getsize(path)
+
+    base_info = base_loader()
+    if base_info.get('model') is None:
+        raise RuntimeError(f"量子化元のモデルが読み込まれていません: {variant.base_model}")
+
+    if variant.method == 'static' and calibration_paths is None:
+        calibration_paths = get_calibration_paths()
+    logger.info(f"量子化モデルを作成: {internal_model_name} ({variant.method}, {metadata['engine']})")
+    quantized = quantize_model(base_info['model'], variant.method, spec, calibration_paths)
+    nbytes = save_quantized_model(quantized, path, metadata, spec)
+    logger.info(f"量子化モデルを保存: {path} ({nbytes} bytes)")
+
+    # 保存したTorchScriptを読み込んで使う（次回以降の起動と同じモデルで推論する）
+    return load_saved_quantized_model(path, metadata), nbytes
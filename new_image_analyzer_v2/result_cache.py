@@ -0,0 +1,124 @@
+"""
+解析結果キャッシュ
+同じ内容の画像（SHA-256が一致）を同じモデル・モデルバージョンで解析した結果を再利用する
+プロセス内のLRUで直近の結果を保持し、見つからない場合はDBのキャッシュテーブルを参照する
+"""
+import copy
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+from .models import TransAnalysisResultCache
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, str, str]
+
+
+class ResultCache:
+    """(内容ダイジェスト, モデル名, モデルバージョン) → 解析結果 のキャッシュ"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max(0, int(max_entries))
+        self._entries: "OrderedDict[CacheKey, List[Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 統計情報
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def get(self, content_digest: str, model_name: str, model_version: str) -> Optional[List[Dict]]:
+        """キャッシュされた解析結果を返す（ない場合はNone）"""
+        if not content_digest or not model_version:
+            return None
+
+        key = (content_digest, model_name, model_version)
+        with self._lock:
+            results = self._entries.get(key)
+            if results is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return copy.deepcopy(results)
+
+        try:
+            cache_rows = TransAnalysisResultCache.objects.filter(
+                content_digest=content_digest, model_name=model_name, model_version=model_version
+            )
+            results = cache_rows.values_list('results', flat=True).first()
+            if results is not None:
+                cache_rows.update(hit_count=F('hit_count') + 1, last_hit_at=timezone.now())
+        except Exception as e:
+            logger.warning(f"解析結果キャッシュの参照に失敗: {e}")
+            results = None
+
+        with self._lock:
+            if results is None:
+                self.misses += 1
+                return None
+            self.db_hits += 1
+            self._remember(key, results)
+        return copy.deepcopy(results)
+
+    def put(self, content_digest: str, model_name: str, model_version: str, results: List[Dict]) -> None:
+        """解析結果をキャッシュに保存する"""
+        if not content_digest or not model_version:
+            return
+
+        key = (content_digest, model_name, model_version)
+        results = copy.deepcopy(results)
+        try:
+            TransAnalysisResultCache.objects.update_or_create(
+                content_digest=content_digest,
+                model_name=model_name,
+                model_version=model_version,
+                defaults={'results': results},
+            )
+        except IntegrityError:
+            # 同じ画像を同時に解析した別のワーカーが先に保存した
+            pass
+        except Exception as e:
+            logger.warning(f"解析結果キャッシュの保存に失敗: {e}")
+
+        with self._lock:
+            self.stores += 1
+            self._remember(key, results)
+
+    def clear(self) -> None:
+        """プロセス内のキャッシュを破棄する（DBのキャッシュは残る）"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """ヒット率などの統計情報"""
+        with self._lock:
+            hits = self.memory_hits + self.db_hits
+            lookups = hits + self.misses
+            return {
+                'max_entries': self.max_entries,
+                'entries': len(self._entries),
+                'memory_hits': self.memory_hits,
+                'db_hits': self.db_hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'hit_rate': (hits / lookups) if lookups else 0.0,
+            }
+
+    def _remember(self, key: CacheKey, results: List[Dict]) -> None:
+        """プロセス内のLRUに追加する（_lock取得済みで呼ぶ）"""
+        if self.max_entries == 0:
+            return
+        self._entries[key] = results
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+result_cache = ResultCache(max_entries=getattr(settings, 'ANALYSIS_RESULT_CACHE_SIZE', 1024))
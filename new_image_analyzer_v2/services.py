@@ -1,298 +1,469 @@
 import os
 import logging
 import numpy as np
-from PIL import Image as PILImage
-import requests
-import time
-from typing import List, Dict, Optional
+import threading
+from functools import lru_cache, partial
+from types import MappingProxyType
+from typing import Callable, List, Dict, Mapping, Optional, Tuple
 from django.conf import settings
-from django.utils import timezone
-from .models import TransUploadedImage, TransImageAnalysis
+from .model_registry import ModelRegistry
+from .category_matrix import BROAD_CATEGORY_MAPPING, CategoryMatrix
+from .inference_engine import InferenceEngine
+from .preprocessing import CLIP_SPEC, IMAGENET_SPEC, PreprocessSpec, decode_image, load_tensor, to_tensor
+from .decode_pool import create_decode_pool
+from .shared_models import build_model_with_mmap_weights
+from .execution import InferenceSlots, get_process_config
+from .quantization import QUANTIZED_VARIANTS, load_or_build_quantized_model
+from .model_export import (
+    BACKEND_EAGER, BACKEND_ONNX, BACKEND_TORCHSCRIPT, BACKENDS, EXPORTABLE_MODELS,
+    export_onnx, export_torchscript, get_export_metadata, get_exported_model_path, load_exported_model,
+)
 
 logger = logging.getLogger(__name__)
 
+# フロントエンドのモデル名 → 内部モデル名
+MODEL_NAME_MAPPING = {
+    'resnet50': 'pytorch_resnet50',
+    'efficientnet': 'pytorch_efficientnet',
+    'mobilenet': 'pytorch_mobilenet',
+    'vgg16': 'pytorch_vgg16',
+    'clip': 'clip',
+    'custom': 'clip',  # customモデルをCLIPにマッピング
+    # INT8量子化モデル（fp32モデルより高速・省メモリ。精度の差は benchmark_quantization で確認できる）
+    'resnet50_int8': 'pytorch_resnet50_int8',
+    'resnet50_int8_dynamic': 'pytorch_resnet50_int8_dynamic',
+    'mobilenet_int8': 'pytorch_mobilenet_int8',
+    'mobilenet_int8_dynamic': 'pytorch_mobilenet_int8_dynamic',
+    'vgg16_int8': 'pytorch_vgg16_int8',
+    'vgg16_int8_dynamic': 'pytorch_vgg16_int8_dynamic',
+    'efficientnet_int8': 'pytorch_efficientnet_int8_dynamic',
+}
+
+# 内部モデル名 → モデルバージョン（解析結果キャッシュのキー。重みを変更した場合は更新する）
+MODEL_VERSIONS = {
+    'pytorch_resnet50': 'torchvision/resnet50/IMAGENET1K_V2',
+    'pytorch_mobilenet': 'torchvision/mobilenet_v2/IMAGENET1K_V1',
+    'pytorch_efficientnet': 'torchvision/efficientnet_b0/IMAGENET1K_V1',
+    'pytorch_vgg16': 'torchvision/vgg16/IMAGENET1K_V1',
+    'clip': 'openai-clip/ViT-B-32',
+}
+# 量子化モデルは量子化元のバージョンに量子化方式を付けたもの
+MODEL_VERSIONS.update({
+    name: f"{MODEL_VERSIONS[variant.base_model]}/int8-{variant.method}"
+    for name, variant in QUANTIZED_VARIANTS.items()
+})
+
+# 後処理（カテゴリー分類・CLIPプロンプト・結果の形式）のバージョン。変更した場合は上げる
+RESULT_FORMAT_VERSION = 2
+
+# CLIPのテキストプロンプト（アニメ・イラストを優先、順序がCLIPのクラス番号になる）
+CLIP_TEXT_PROMPTS = (
+    "anime character illustration",
+    "manga drawing",
+    "cartoon character",
+    "fantasy character",
+    "elf character",
+    "cute anime girl",
+    "anime art style",
+    "illustration drawing",
+    "realistic photograph",
+    "safety equipment helmet",
+    "animal",
+    "building",
+    "car", "vehicle", "automobile", "sports car", "racing car",
+    "person",
+    "nature"
+)
+
+# 同梱のImageNetクラス名（1000クラス、1行1クラス）
+IMAGENET_CLASSES_PATH = os.path.join(os.path.dirname(__file__), 'data', 'imagenet_classes.txt')
+
+
+@lru_cache(maxsize=None)
+def load_imagenet_classes() -> Mapping[int, str]:
+    """同梱のImageNetクラス名を読み込む（プロセスごとに1回だけ読み込み、読み取り専用で共有）"""
+    with open(IMAGENET_CLASSES_PATH, encoding='utf-8') as f:
+        class_names = tuple(line.strip() for line in f if line.strip())
+    logger.info(f"ImageNetクラス名読み込み完了: {len(class_names)}件")
+    return MappingProxyType(dict(enumerate(class_names)))
+
+
+def _noop(*args) -> None:
+    pass
+
+
 class AnalysisService:
     def __init__(self):
-        self.models = {}
-        self._load_models()
+        # モデルは初回リクエスト時に読み込む（起動時に全モデルを読み込まない）
+        budget_mb = getattr(settings, 'ANALYSIS_MODEL_MEMORY_BUDGET_MB', None)
+        self._base_loaders = {
+            'pytorch_resnet50': self._load_pytorch_resnet50,
+            'pytorch_mobilenet': self._load_pytorch_mobilenet,
+            'pytorch_vgg16': self._load_pytorch_vgg16,
+            'pytorch_efficientnet': self._load_pytorch_efficientnet,
+            'clip': self._load_clip,
+        }
+        # INT8量子化モデルは量子化元のローダーで読み込んだfp32モデルから作成する
+        loaders = dict(self._base_loaders)
+        for name, variant in QUANTIZED_VARIANTS.items():
+            loaders[name] = partial(self._load_quantized_model, name)
+        # 書き出し済みのモデル（TorchScript / ONNX）から読み込む場合
+        self.model_backend = getattr(settings, 'ANALYSIS_MODEL_BACKEND', BACKEND_EAGER)
+        if self.model_backend not in BACKENDS:
+            logger.error(f"未対応のモデルバックエンドです: {self.model_backend}（eagerで読み込みます）")
+            self.model_backend = BACKEND_EAGER
+        if self.model_backend != BACKEND_EAGER:
+            for name in EXPORTABLE_MODELS:
+                loaders[name] = partial(self._load_exported_model, name, self.model_backend)
+        self.registry = ModelRegistry(
+            loaders,
+            memory_budget_bytes=budget_mb * 1024 * 1024 if budget_mb else None,
+            retry_seconds=getattr(settings, 'ANALYSIS_MODEL_RETRY_SECONDS', 60),
+        )
+        # CLIPのテキストプロンプト（変更するとテキスト埋め込みが再計算される）
+        self.clip_text_prompts = CLIP_TEXT_PROMPTS
+        self._clip_text_lock = threading.Lock()
+        # クラス一覧ごとのカテゴリー重み行列（'imagenet' / 'clip'）
+        self._category_matrices: Dict[str, CategoryMatrix] = {}
+        # プロセス内で同時に実行する推論の数を制限する（推論のスレッド数はモデルの初回読み込み時に設定する）
+        self.slots = InferenceSlots(getattr(settings, 'ANALYSIS_INFERENCE_SLOTS', None))
+        # 同じモデルへの同時リクエストをまとめてバッチ推論する
+        self.engine = InferenceEngine(
+            self._predict_batch,
+            max_batch_size=getattr(settings, 'ANALYSIS_BATCH_MAX_SIZE', 16),
+            max_wait_ms=getattr(settings, 'ANALYSIS_BATCH_MAX_WAIT_MS', 5),
+        )
+        # 一括解析の画像デコードを別プロセスで先読みする（0の場合は推論と同じスレッドでデコード）
+        self.decode_pool = create_decode_pool(
+            getattr(settings, 'ANALYSIS_DECODE_WORKERS', 0),
+            getattr(settings, 'ANALYSIS_DECODE_PREFETCH', 8),
+        )
+        self._preload_models()
     
-    def _load_models(self):
-        """利用可能なモデルを読み込む"""
+    def _preload_models(self):
+        """設定で指定されたモデルを起動時に読み込む"""
+        preload_names = getattr(settings, 'ANALYSIS_PRELOAD_MODELS', [])
+        if not preload_names:
+            return
+        
         try:
-            # PyTorch ResNet-50
-            self._load_pytorch_resnet50()
-            
-            # PyTorch MobileNet
-            self._load_pytorch_mobilenet()
-            
-            # PyTorch VGG-16
-            self._load_pytorch_vgg16()
-            
-            # PyTorch EfficientNet
-            self._load_pytorch_efficientnet()
-            
-            # CLIP
-            self._load_clip()
-            
-            # モデル読み込み完了
-            logger.info(f"モデル読み込み完了: {list(self.models.keys())}")
-            
+            internal_names = [MODEL_NAME_MAPPING.get(name, name) for name in preload_names]
+            self.registry.preload(internal_names)
+            logger.info(f"モデル事前読み込み完了: {internal_names}")
         except Exception as e:
-            logger.error(f"モデル読み込みエラー: {e}")
+            logger.error(f"モデル事前読み込みエラー: {e}")
+    
+    def get_model_status(self) -> Dict[str, Dict]:
+        """各モデルの読み込み状態を取得"""
+        return self.registry.status()
+    
+    def get_model_cache_stats(self) -> Dict:
+        """モデルキャッシュのヒット・ミス・破棄回数を取得"""
+        return self.registry.cache_stats()
+    
+    def get_inference_stats(self) -> Dict:
+        """バッチ推論の統計情報（バッチ数・平均バッチサイズ・推論スロットの待ち時間など）を取得"""
+        stats = self.engine.stats()
+        stats['slots'] = self.slots.stats()
+        stats['execution'] = get_process_config()
+        return stats
     
-    def _load_pytorch_resnet50(self):
+    def get_model_version(self, model_name: str) -> Optional[str]:
+        """解析結果のバージョン（モデルの重みと後処理のバージョン）。未知のモデルの場合はNone"""
+        internal_model_name = MODEL_NAME_MAPPING.get(model_name, model_name)
+        model_version = MODEL_VERSIONS.get(internal_model_name)
+        if model_version is None:
+            return None
+        return f"{model_version}/r{RESULT_FORMAT_VERSION}"
+    
+    def reset_after_fork(self) -> None:
+        """fork後の子プロセスで、親プロセスのスレッド・子プロセスを前提にした状態を作り直す
+
+        読み込み済みのモデルはそのまま使う（重みはコピーオンライトで親プロセスと共有される）。
+        """
+        self.engine.reset_after_fork()
+        self.slots.reset_after_fork()
+        if self.decode_pool is not None:
+            self.decode_pool.reset_after_fork()
+    
+    def _build_torchvision_model(self, builder: Callable, weights):
+        """torchvisionのモデルを学習済みの重みで組み立てる（推論モード）
+
+        ANALYSIS_MODEL_WEIGHTS_MMAPの場合は重みをメモリマップで読み込み、プロセス間で共有する。
+        """
+        if getattr(settings, 'ANALYSIS_MODEL_WEIGHTS_MMAP', False):
+            return build_model_with_mmap_weights(builder, weights)
+        model = builder(weights=weights)
+        model.eval()
+        return model
+    
+    def _load_pytorch_resnet50(self) -> Dict:
         """PyTorch ResNet-50モデルを読み込む"""
         try:
             import torch
-            import torchvision.transforms as transforms
             from torchvision.models import resnet50, ResNet50_Weights
             
             # モデル読み込み
-            model = resnet50(weights=ResNet50_Weights.IMAGENET1K_V2)
-            model.eval()
-            
-            # 前処理定義
-            transform = transforms.Compose([
-                transforms.Resize(256),
-                transforms.CenterCrop(224),
-                transforms.ToTensor(),
-                transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-            ])
-            
-            self.models['pytorch_resnet50'] = {
+            model = self._build_torchvision_model(resnet50, ResNet50_Weights.IMAGENET1K_V2)
+            
+            return {
                 'model': model,
-                'transform': transform,
+                'preprocess_spec': IMAGENET_SPEC,
                 'input_size': (224, 224),
                 'type': 'pytorch_resnet50'
             }
-            # PyTorch ResNet-50 読み込み完了
-            
         except Exception as e:
             logger.error(f"PyTorch ResNet-50 読み込みエラー: {e}")
-            self.models['pytorch_resnet50'] = {
+            return {
                 'model': None,
-                'transform': None,
+                'preprocess_spec': IMAGENET_SPEC,
                 'input_size': (224, 224),
                 'type': 'pytorch_resnet50'
             }
     
-    def _load_pytorch_mobilenet(self):
+    def _load_pytorch_mobilenet(self) -> Dict:
         """PyTorch MobileNetモデルを読み込む"""
         try:
             import torch
-            import torchvision.transforms as transforms
             from torchvision.models import mobilenet_v2, MobileNet_V2_Weights
             
             # モデル読み込み
-            model = mobilenet_v2(weights=MobileNet_V2_Weights.IMAGENET1K_V1)
-            model.eval()
-            
-            # 前処理定義
-            transform = transforms.Compose([
-                transforms.Resize(256),
-                transforms.CenterCrop(224),
-                transforms.ToTensor(),
-                transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-            ])
-            
-            self.models['pytorch_mobilenet'] = {
+            model = self._build_torchvision_model(mobilenet_v2, MobileNet_V2_Weights.IMAGENET1K_V1)
+            
+            return {
                 'model': model,
-                'transform': transform,
+                'preprocess_spec': IMAGENET_SPEC,
                 'input_size': (224, 224),
                 'type': 'pytorch_mobilenet'
             }
-            # PyTorch MobileNet 読み込み完了
-            
         except Exception as e:
             logger.error(f"PyTorch MobileNet 読み込みエラー: {e}")
-            self.models['pytorch_mobilenet'] = {
+            return {
                 'model': None,
-                'transform': None,
+                'preprocess_spec': IMAGENET_SPEC,
                 'input_size': (224, 224),
                 'type': 'pytorch_mobilenet'
             }
     
-    def _load_pytorch_efficientnet(self):
+    def _load_pytorch_efficientnet(self) -> Dict:
         """PyTorch EfficientNetモデルを読み込む"""
         try:
             import torch
-            import torchvision.transforms as transforms
             from torchvision.models import efficientnet_b0, EfficientNet_B0_Weights
             
             # モデル読み込み
-            model = efficientnet_b0(weights=EfficientNet_B0_Weights.IMAGENET1K_V1)
-            model.eval()
-            
-            # 前処理定義
-            transform = transforms.Compose([
-                transforms.Resize(256),
-                transforms.CenterCrop(224),
-                transforms.ToTensor(),
-                transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-            ])
-            
-            self.models['pytorch_efficientnet'] = {
+            model = self._build_torchvision_model(efficientnet_b0, EfficientNet_B0_Weights.IMAGENET1K_V1)
+            
+            return {
                 'model': model,
-                'transform': transform,
+                'preprocess_spec': IMAGENET_SPEC,
                 'input_size': (224, 224),
                 'type': 'pytorch_efficientnet'
             }
-            # PyTorch EfficientNet 読み込み完了
-            
         except Exception as e:
             logger.error(f"PyTorch EfficientNet 読み込みエラー: {e}")
-            self.models['pytorch_efficientnet'] = {
+            return {
                 'model': None,
-                'transform': None,
+                'preprocess_spec': IMAGENET_SPEC,
                 'input_size': (224, 224),
                 'type': 'pytorch_efficientnet'
             }
     
-    def _load_pytorch_vgg16(self):
+    def _load_pytorch_vgg16(self) -> Dict:
         """PyTorch VGG-16モデルを読み込む"""
         try:
             import torch
-            import torchvision.transforms as transforms
             from torchvision.models import vgg16, VGG16_Weights
             
             # モデル読み込み
-            model = vgg16(weights=VGG16_Weights.IMAGENET1K_V1)
-            model.eval()
-            
-            # 前処理定義
-            transform = transforms.Compose([
-                transforms.Resize(256),
-                transforms.CenterCrop(224),
-                transforms.ToTensor(),
-                transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-            ])
-            
-            self.models['pytorch_vgg16'] = {
+            model = self._build_torchvision_model(vgg16, VGG16_Weights.IMAGENET1K_V1)
+            
+            return {
                 'model': model,
-                'transform': transform,
+                'preprocess_spec': IMAGENET_SPEC,
                 'input_size': (224, 224),
                 'type': 'pytorch_vgg16'
             }
-            # PyTorch VGG-16 読み込み完了
-            
         except Exception as e:
             logger.error(f"PyTorch VGG-16 読み込みエラー: {e}")
-            self.models['pytorch_vgg16'] = {
+            return {
                 'model': None,
-                'transform': None,
+                'preprocess_spec': IMAGENET_SPEC,
                 'input_size': (224, 224),
                 'type': 'pytorch_vgg16'
             }
     
-    def _load_clip(self):
+    def build_quantized_model(self, model_name: str, rebuild: bool = False,
+                              calibration_paths: Optional[List[str]] = None) -> Tuple[object, int]:
+        """INT8量子化モデルを作成して保存し、(モデル, ファイルサイズ) を返す
+
+        rebuild=Falseの場合、保存済みのファイルが有効であればそれを読み込む。
+        """
+        internal_model_name = MODEL_NAME_MAPPING.get(model_name, model_name)
+        variant = QUANTIZED_VARIANTS.get(internal_model_name)
+        if variant is None:
+            raise ValueError(f"量子化モデルではありません: {model_name}")
+        
+        if rebuild:
+            # 読み込み済みの古いモデルは破棄し、次回の解析で作り直したモデルを読み込む
+            self.registry.unload(internal_model_name)
+        return load_or_build_quantized_model(
+            internal_model_name, self._base_loaders[variant.base_model],
+            MODEL_VERSIONS[variant.base_model], IMAGENET_SPEC,
+            rebuild=rebuild, calibration_paths=calibration_paths,
+        )
+    
+    def _load_quantized_model(self, internal_model_name: str) -> Dict:
+        """INT8量子化モデルを読み込む（保存済みのファイルがなければfp32モデルから作成して保存する）"""
+        try:
+            model, nbytes = self.build_quantized_model(internal_model_name)
+            
+            return {
+                'model': model,
+                'preprocess_spec': IMAGENET_SPEC,
+                'input_size': (224, 224),
+                'type': internal_model_name,
+                # TorchScriptの量子化モデルはparameters()で重みを数えられないため、保存したファイルのサイズを使う
+                'nbytes': nbytes,
+            }
+        except Exception as e:
+            logger.error(f"量子化モデル 読み込みエラー: {internal_model_name}: {e}")
+            return {
+                'model': None,
+                'preprocess_spec': IMAGENET_SPEC,
+                'input_size': (224, 224),
+                'type': internal_model_name,
+            }
+    
+    def export_model(self, model_name: str, backends: List[str]) -> Dict[str, Tuple[str, int]]:
+        """モデルをTorchScript / ONNXに書き出し、バックエンドごとに (パス, ファイルサイズ) を返す"""
+        internal_model_name = MODEL_NAME_MAPPING.get(model_name, model_name)
+        if internal_model_name not in EXPORTABLE_MODELS:
+            raise ValueError(f"書き出しに対応していないモデルです: {model_name}")
+        
+        model_info = self._base_loaders[internal_model_name]()
+        if model_info['model'] is None:
+            raise RuntimeError(f"モデルが読み込まれていません: {internal_model_name}")
+        
+        metadata = get_export_metadata(internal_model_name, MODEL_VERSIONS[internal_model_name])
+        exporters = {BACKEND_TORCHSCRIPT: export_torchscript, BACKEND_ONNX: export_onnx}
+        exported = {}
+        for backend in backends:
+            path = get_exported_model_path(internal_model_name, backend)
+            exported[backend] = (path, exporters[backend](model_info['model'], path, metadata, model_info['preprocess_spec']))
+        return exported
+    
+    def load_model_backend(self, model_name: str, backend: str) -> Dict:
+        """レジストリを通さずに、指定したバックエンドでモデルを読み込む（キャッシュしない。比較・計測用）"""
+        internal_model_name = MODEL_NAME_MAPPING.get(model_name, model_name)
+        if backend == BACKEND_EAGER:
+            return self._base_loaders[internal_model_name]()
+        return self._load_exported_model(internal_model_name, backend, fallback=False)
+    
+    def _load_exported_model(self, internal_model_name: str, backend: str, fallback: bool = True) -> Dict:
+        """書き出し済みのモデルを読み込む（ファイルがない・古い場合はeagerで読み込む）"""
+        try:
+            metadata = get_export_metadata(internal_model_name, MODEL_VERSIONS[internal_model_name])
+            model = load_exported_model(internal_model_name, backend, metadata)
+        except Exception as e:
+            logger.error(f"書き出し済みモデル 読み込みエラー: {internal_model_name} ({backend}): {e}")
+            model = None
+        
+        if model is None and fallback:
+            logger.warning(f"書き出し済みのモデルがないためeagerで読み込みます: {internal_model_name} ({backend})")
+            return self._base_loaders[internal_model_name]()
+        
+        model_info = {
+            'model': model,
+            'preprocess_spec': IMAGENET_SPEC,
+            'input_size': (224, 224),
+            'type': internal_model_name,
+            'backend': backend,
+        }
+        if model is not None:
+            # ONNX・TorchScriptのモデルはparameters()で重みを数えられないため、ファイルのサイズを使う
+            model_info['nbytes'] = os.path.getsize(get_exported_model_path(internal_model_name, backend))
+        return model_info
+    
+    def _load_clip(self) -> Dict:
         """CLIPモデルを読み込む"""
         try:
             import clip
             
             # モデル読み込み
-            model, preprocess = clip.load("ViT-B/32", device="cpu")
+            # 前処理はpreprocessing.CLIP_SPECで行うため、clip.loadの前処理は使わない
+            model, _ = clip.load("ViT-B/32", device="cpu")
             
-            self.models['clip'] = {
+            return {
                 'model': model,
-                'preprocess': preprocess,
+                'preprocess_spec': CLIP_SPEC,
                 'input_size': (224, 224),
                 'type': 'clip'
             }
-            # CLIP 読み込み完了
-            
         except Exception as e:
             logger.error(f"CLIP 読み込みエラー: {e}")
-            self.models['clip'] = {
+            return {
                 'model': None,
-                'preprocess': None,
+                'preprocess_spec': CLIP_SPEC,
                 'input_size': (224, 224),
                 'type': 'clip'
             }
     
-    def preprocess_image(self, image_path: str, input_size: tuple) -> np.ndarray:
-        """画像の前処理"""
-        try:
-            # 画像読み込み
-            image = PILImage.open(image_path).convert('RGB')
-            
-            # リサイズ
-            image = image.resize(input_size)
-            
-            # numpy配列に変換
-            img_array = np.array(image)
-            
-            # バッチ次元を追加
-            img_array = np.expand_dims(img_array, axis=0)
-            
-            return img_array
-            
-        except Exception as e:
-            logger.error(f"画像前処理エラー: {e}")
-            raise
+    def _resolve_model(self, model_name: str):
+        """フロントエンドのモデル名から内部モデル名とモデル情報を取得（未読み込みの場合はここで読み込む）"""
+        # フロントエンドのモデル名を内部モデル名にマッピング
+        internal_model_name = MODEL_NAME_MAPPING.get(model_name, model_name)
+        # モデル名マッピング
+        logger.info(f"モデル名マッピング: {model_name} -> {internal_model_name}")
+        
+        if internal_model_name not in self.registry:
+            available_models = self.registry.names()
+            raise ValueError(f"未知のモデル: {model_name} (内部名: {internal_model_name}), 利用可能: {available_models}")
+        
+        return internal_model_name, self.registry.get(internal_model_name)
+    
+    def _model_not_loaded_response(self, internal_model_name: str) -> Dict:
+        """モデルが読み込まれていない場合のエラー応答"""
+        logger.error(f"モデルが読み込まれていません: {internal_model_name}")
+        return {
+            'success': False,
+            'error': f'モデル {internal_model_name} が読み込まれていません。PyTorch/CLIPのインストールを確認してください。'
+        }
     
-    def analyze_image(self, image_path: str, model_name: str) -> Dict:
-        """単一画像の解析"""
+    def analyze_image(self, image_path: str, model_name: str,
+                      on_stage: Optional[Callable[[str], None]] = None) -> Dict:
+        """単一画像の解析
+
+        on_stageを指定すると、各段階（model_loading / decoding / preprocessing /
+        inference / postprocessing）の開始時に段階名を渡して呼び出す。
+        """
+        def stage(name: str):
+            if on_stage is not None:
+                on_stage(name)
+        
         try:
-            # 解析開始
-            
-            # フロントエンドのモデル名を内部モデル名にマッピング
-            model_mapping = {
-                'resnet50': 'pytorch_resnet50',
-                'efficientnet': 'pytorch_efficientnet',
-                'mobilenet': 'pytorch_mobilenet',
-                'vgg16': 'pytorch_vgg16',
-                'clip': 'clip',
-                'custom': 'clip'  # customモデルをCLIPにマッピング
-            }
-            
-            internal_model_name = model_mapping.get(model_name, model_name)
-            # モデル名マッピング
-            logger.info(f"モデル名マッピング: {model_name} -> {internal_model_name}")
-            logger.info(f"利用可能なモデル: {list(self.models.keys())}")
-            
-            if internal_model_name not in self.models:
-                available_models = list(self.models.keys())
-                raise ValueError(f"未知のモデル: {model_name} (内部名: {internal_model_name}), 利用可能: {available_models}")
-            
-            model_info = self.models[internal_model_name]
-            logger.info(f"モデル情報: {model_info}")
+            # 未読み込みのモデルはここで読み込まれる
+            stage('model_loading')
+            internal_model_name, model_info = self._resolve_model(model_name)
             
             if model_info['model'] is None:
-                logger.error(f"モデルが読み込まれていません: {internal_model_name}")
                 # モデルが読み込まれていない場合はエラーを返す
-                return {
-                    'success': False,
-                    'error': f'モデル {internal_model_name} が読み込まれていません。PyTorch/CLIPのインストールを確認してください。'
-                }
-            
-            # 画像の前処理
-            logger.info(f"画像前処理開始: 入力サイズ={model_info['input_size']}")
-            img_array = self.preprocess_image(image_path, model_info['input_size'])
-            logger.info(f"画像前処理完了: 形状={img_array.shape}")
-            
-            # モデル別の予測実行
-            logger.info(f"予測実行開始: {model_info['type']}")
-            if model_info['type'] == 'pytorch_resnet50':
-                predictions = self._predict_pytorch_resnet50(img_array, model_info)
-            elif model_info['type'] == 'pytorch_mobilenet':
-                predictions = self._predict_pytorch_mobilenet(img_array, model_info)
-            elif model_info['type'] == 'pytorch_vgg16':
-                predictions = self._predict_pytorch_vgg16(img_array, model_info)
-            elif model_info['type'] == 'pytorch_efficientnet':
-                predictions = self._predict_pytorch_efficientnet(img_array, model_info)
-            elif model_info['type'] == 'clip':
-                predictions = self._predict_clip(img_array, model_info)
-            else:
-                raise ValueError(f"未対応のモデルタイプ: {model_info['type']}")
+                return self._model_not_loaded_response(internal_model_name)
             
-            logger.info(f"予測完了: 形状={predictions.shape}")
-            logger.info(f"予測結果の最大値: {predictions.max():.6f}")
-            logger.info(f"予測結果の最小値: {predictions.min():.6f}")
+            # 画像の読み込みと前処理
+            stage('decoding')
+            image = decode_image(image_path, model_info['preprocess_spec'])
+            stage('preprocessing')
+            img_tensor = to_tensor(image, model_info['preprocess_spec'])
+            
+            # 予測実行（同時に来た他のリクエストとまとめてバッチ推論される）
+            stage('inference')
+            predictions = self.engine.infer(internal_model_name, (model_info, img_tensor))[np.newaxis, :]
+            logger.info(f"予測完了: 形状={predictions.shape}, 最大値={predictions.max():.6f}")
             
             # 結果を整形
-            logger.info("結果整形開始")
+            stage('postprocessing')
             results = self._format_predictions(predictions, internal_model_name)
-            logger.info(f"結果整形完了: {len(results)}件")
             
             for i, result in enumerate(results):
                 logger.info(f"  結果{i+1}: {result['label']} ({result['confidence']}%) - ランク{result['rank']}")
@@ -303,424 +474,284 @@ class AnalysisService:
             logger.error(f"画像解析エラー: {e}")
             return {'success': False, 'error': str(e)}
     
-    def _predict_pytorch_resnet50(self, img_array: np.ndarray, model_info: Dict) -> np.ndarray:
-        """PyTorch ResNet-50での予測"""
-        import torch
-        
-        # PIL画像に変換
-        pil_image = PILImage.fromarray(img_array[0].astype('uint8'))
+    def analyze_images(self, image_paths: List[str], model_name: str) -> List[Dict]:
+        """複数画像の一括解析（まとめてバッチ推論し、画像ごとの結果を同じ順序で返す）"""
+        try:
+            internal_model_name, model_info = self._resolve_model(model_name)
+        except Exception as e:
+            logger.error(f"画像解析エラー: {e}")
+            return [{'success': False, 'error': str(e)} for _ in image_paths]
         
-        # transformを適用
-        img_tensor = model_info['transform'](pil_image)
-        img_tensor = img_tensor.unsqueeze(0)
+        if model_info['model'] is None:
+            return [self._model_not_loaded_response(internal_model_name) for _ in image_paths]
         
-        # 予測実行
-        with torch.no_grad():
-            outputs = model_info['model'](img_tensor)
-            predictions = torch.softmax(outputs, dim=1)
-        
-        return predictions.numpy()
-    
-    def _predict_pytorch_mobilenet(self, img_array: np.ndarray, model_info: Dict) -> np.ndarray:
-        """PyTorch MobileNetでの予測"""
-        import torch
+        # 前処理（失敗した画像は個別にエラーとする）
+        responses: List[Optional[Dict]] = [None] * len(image_paths)
+        futures = {}
+        for i, img_tensor, error, release in self._iter_tensors(image_paths, model_info['preprocess_spec']):
+            if error is not None:
+                logger.error(f"画像解析エラー: {image_paths[i]}: {error}")
+                responses[i] = {'success': False, 'error': str(error)}
+                continue
+            try:
+                futures[i] = self.engine.submit(internal_model_name, (model_info, img_tensor))
+            except Exception as e:
+                release()
+                logger.error(f"画像解析エラー: {image_paths[i]}: {e}")
+                responses[i] = {'success': False, 'error': str(e)}
+                continue
+            # 推論が終わったらテンソルのバッファ（デコードプールの共有メモリ）を戻す
+            futures[i].add_done_callback(release)
         
-        # PIL画像に変換
-        pil_image = PILImage.fromarray(img_array[0].astype('uint8'))
+        # 推論結果を集めて、バッチ全体をまとめて整形
+        indices = []
+        rows = []
+        for i, future in futures.items():
+            try:
+                rows.append(future.result())
+                indices.append(i)
+            except Exception as e:
+                logger.error(f"画像解析エラー: {image_paths[i]}: {e}")
+                responses[i] = {'success': False, 'error': str(e)}
         
-        # transformを適用
-        img_tensor = model_info['transform'](pil_image)
-        img_tensor = img_tensor.unsqueeze(0)
+        if rows:
+            formatted = self._format_predictions_batch(np.stack(rows), internal_model_name)
+            for i, results in zip(indices, formatted):
+                responses[i] = {'success': True, 'results': results}
         
-        # 予測実行
-        with torch.no_grad():
-            outputs = model_info['model'](img_tensor)
-            predictions = torch.softmax(outputs, dim=1)
+        logger.info(f"一括解析完了: {len(indices)}/{len(image_paths)}件成功 ({internal_model_name})")
+        return responses
+    
+    def _iter_tensors(self, image_paths: List[str], spec: PreprocessSpec):
+        """画像を前処理し、入力順に (番号, テンソル, エラー, 解放関数) を返す
+
+        デコードプールが有効な場合は別プロセスで先読みしながらデコードし、推論と並行させる。
+        """
+        if self.decode_pool is not None:
+            try:
+                yield from self.decode_pool.imap(image_paths, spec)
+                return
+            except ValueError as e:
+                logger.warning(f"デコードプールを使用できないため、このスレッドで前処理します: {e}")
         
-        return predictions.numpy()
+        for i, image_path in enumerate(image_paths):
+            try:
+                yield i, load_tensor(image_path, spec), None, _noop
+            except Exception as e:
+                yield i, None, e, _noop
     
-    def _predict_pytorch_vgg16(self, img_array: np.ndarray, model_info: Dict) -> np.ndarray:
-        """PyTorch VGG-16での予測"""
+    def _predict_batch(self, internal_model_name: str, items: List[Tuple[Dict, object]]) -> np.ndarray:
+        """バッチ推論（推論エンジンから呼ばれる）
+
+        itemsは (モデル情報, テンソル) の組。モデル情報は投入時に取得済みのものを使い、
+        レジストリを引き直さない（ヒット数・LRUの更新はリクエストごとに1回）。
+        """
         import torch
         
-        # PIL画像に変換
-        pil_image = PILImage.fromarray(img_array[0].astype('uint8'))
+        model_info = items[0][0]
+        if model_info['model'] is None:
+            raise RuntimeError(f"モデルが読み込まれていません: {internal_model_name}")
         
-        # transformを適用
-        img_tensor = model_info['transform'](pil_image)
-        img_tensor = img_tensor.unsqueeze(0)
+        batch = torch.stack([tensor for _, tensor in items])
         
-        # 予測実行
-        with torch.no_grad():
-            outputs = model_info['model'](img_tensor)
-            predictions = torch.softmax(outputs, dim=1)
-        
-        return predictions.numpy()
+        # モデル別の予測実行（推論スロットに空きがなければ待つ）
+        with self.slots.acquire():
+            if model_info['type'] in ('pytorch_resnet50', 'pytorch_mobilenet', 'pytorch_vgg16', 'pytorch_efficientnet'):
+                return self._predict_pytorch(batch, model_info)
+            elif model_info['type'] in QUANTIZED_VARIANTS:
+                return self._predict_pytorch(batch, model_info)
+            elif model_info['type'] == 'clip':
+                return self._predict_clip(batch, model_info)
+            else:
+                raise ValueError(f"未対応のモデルタイプ: {model_info['type']}")
     
-    def _predict_pytorch_efficientnet(self, img_array: np.ndarray, model_info: Dict) -> np.ndarray:
-        """PyTorch EfficientNetでの予測"""
+    def _predict_pytorch(self, batch, model_info: Dict) -> np.ndarray:
+        """PyTorch（ResNet-50 / MobileNet / VGG-16 / EfficientNet、INT8量子化モデルを含む）での予測"""
         import torch
         
-        # PIL画像に変換
-        pil_image = PILImage.fromarray(img_array[0].astype('uint8'))
-        
-        # transformを適用
-        img_tensor = model_info['transform'](pil_image)
-        img_tensor = img_tensor.unsqueeze(0)
-        
         # 予測実行
         with torch.no_grad():
-            outputs = model_info['model'](img_tensor)
+            outputs = model_info['model'](batch)
             predictions = torch.softmax(outputs, dim=1)
         
         return predictions.numpy()
     
-    def _predict_clip(self, img_array: np.ndarray, model_info: Dict) -> np.ndarray:
-        """CLIPでの予測（アニメ・イラスト検出対応）"""
+    def _get_clip_text_features(self, model_info: Dict):
+        """CLIPのテキスト埋め込み（正規化済み）を取得
+
+        読み込まれたCLIPモデルごとに1回だけ計算してmodel_infoに保持する。
+        プロンプトが変更された場合は再計算する。
+        """
         import torch
         import clip
         
-        # PIL画像に変換
-        pil_image = PILImage.fromarray(img_array[0].astype('uint8'))
+        text_prompts = tuple(self.clip_text_prompts)
+        cached = model_info.get('text_features')
+        if cached is not None and cached[0] == text_prompts:
+            return cached[1]
         
-        # preprocessを適用
-        img_tensor = model_info['preprocess'](pil_image)
-        img_tensor = img_tensor.unsqueeze(0)
+        with self._clip_text_lock:
+            # ロック待ちの間に他のスレッドが計算した場合
+            cached = model_info.get('text_features')
+            if cached is not None and cached[0] == text_prompts:
+                return cached[1]
+            
+            with torch.no_grad():
+                text_features = model_info['model'].encode_text(clip.tokenize(list(text_prompts)))
+                text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+            
+            model_info['text_features'] = (text_prompts, text_features)
+            logger.info(f"CLIPテキスト埋め込みを計算: {len(text_prompts)}件")
+            return text_features
+    
+    def _predict_clip(self, batch, model_info: Dict) -> np.ndarray:
+        """CLIPでの予測（アニメ・イラスト検出対応）"""
+        import torch
         
-        # テキストプロンプトを定義（アニメ・イラストを優先）
-        text_prompts = [
-            "anime character illustration",
-            "manga drawing",
-            "cartoon character",
-            "fantasy character",
-            "elf character",
-            "cute anime girl",
-            "anime art style",
-            "illustration drawing",
-            "realistic photograph",
-            "safety equipment helmet",
-            "animal",
-            "building",
-            "car", "vehicle", "automobile", "sports car", "racing car",
-            "person",
-            "nature"
-        ]
+        # テキスト埋め込みはモデルごとにキャッシュ済みのものを使う
+        text_features = self._get_clip_text_features(model_info)
         
         # 予測実行
         with torch.no_grad():
-            # 画像とテキストの埋め込みを取得
-            image_features = model_info['model'].encode_image(img_tensor)
-            text_features = model_info['model'].encode_text(torch.cat([clip.tokenize(prompt) for prompt in text_prompts]))
-            
-            # 類似度を計算
-            similarities = (100.0 * image_features @ text_features.T).softmax(dim=-1)
-            
-            # 19次元の配列に変換（CLIPクラス数に合わせる）
-            predictions = torch.zeros(1, 19)
-            
-            # アニメ・イラスト関連のスコアを設定
-            predictions[0][0] = similarities[0][0]  # anime character
-            predictions[0][1] = similarities[0][1]  # manga illustration
-            predictions[0][2] = similarities[0][2]  # cartoon character
-            predictions[0][3] = similarities[0][3]  # fantasy character
-            predictions[0][4] = similarities[0][4]  # elf character
-            predictions[0][5] = similarities[0][5]  # cute anime girl
-            predictions[0][6] = similarities[0][6]  # anime art style
-            predictions[0][7] = similarities[0][7]  # illustration drawing
-            predictions[0][8] = similarities[0][8]  # realistic photo
-            predictions[0][9] = similarities[0][9]  # safety equipment
-            predictions[0][10] = similarities[0][10]  # animal
-            predictions[0][11] = similarities[0][11]  # building
-            predictions[0][12] = similarities[0][12]  # car
-            predictions[0][13] = similarities[0][13]  # vehicle
-            predictions[0][14] = similarities[0][14]  # automobile
-            predictions[0][15] = similarities[0][15]  # sports car
-            predictions[0][16] = similarities[0][16]  # racing car
-            predictions[0][17] = similarities[0][17]  # person
-            predictions[0][18] = similarities[0][18]  # nature
+            # 画像の埋め込みを取得（テキストとの比較のため正規化）
+            image_features = model_info['model'].encode_image(batch)
+            image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+            
+            # 類似度を計算（プロンプト数の次元 = CLIPクラス数）
+            predictions = (100.0 * image_features @ text_features.T).softmax(dim=-1)
             
             # 予測結果を正規化して、複数のクラスに確率を分散
-            # 最大値が0.9を超える場合は、他のクラスにも確率を分散
-            max_val = torch.max(predictions[0])
-            if max_val > 0.9:
-                # 最大値のクラスの確率を0.7に制限
-                max_idx = torch.argmax(predictions[0])
-                predictions[0][max_idx] = 0.7
-                
-                # 残りの確率を他のクラスに分散
-                remaining_prob = 0.3
-                other_indices = torch.arange(19) != max_idx
-                other_probs = remaining_prob / other_indices.sum()
-                predictions[0][other_indices] = other_probs
+            # 最大値が0.9を超える画像は、最大値のクラスの確率を0.7に制限し、残り0.3を他のクラスに分散
+            max_vals, max_idx = predictions.max(dim=1)
+            over_rows = torch.nonzero(max_vals > 0.9).flatten()
+            if len(over_rows) > 0:
+                predictions[over_rows] = 0.3 / (predictions.shape[1] - 1)
+                predictions[over_rows, max_idx[over_rows]] = 0.7
             
             # 最終的に正規化
-            predictions[0] = predictions[0] / predictions[0].sum()
+            predictions = predictions / predictions.sum(dim=1, keepdim=True)
         
         return predictions.numpy()
     
-    def _get_imagenet_classes(self) -> Dict[int, str]:
-        """ImageNetクラス名を取得"""
-        try:
-            # オンラインからImageNetクラス名を取得
-            response = requests.get(
-                "https://raw.githubusercontent.com/pytorch/hub/master/imagenet_classes.txt",
-                timeout=5
-            )
-            if response.status_code == 200:
-                class_names = {}
-                for i, line in enumerate(response.text.strip().split('\n')):
-                    class_names[i] = line.strip()
-                # ImageNetクラス名を取得
-                return class_names
-        except Exception as e:
-            logger.warning(f"オンラインからImageNetクラス名を取得できませんでした: {e}")
-        
-        # フォールバック: 基本的なクラス名
-        return self._get_basic_imagenet_classes()
-    
-    def _get_basic_imagenet_classes(self) -> Dict[int, str]:
-        """基本的なImageNetクラス名（フォールバック）"""
-        basic_classes = {
-            0: "tench", 1: "goldfish", 2: "great_white_shark", 3: "tiger_shark",
-            4: "hammerhead", 5: "electric_ray", 6: "stingray", 7: "cock",
-            8: "hen", 9: "ostrich", 10: "brambling", 11: "goldfinch",
-            12: "house_finch", 13: "junco", 14: "indigo_bunting", 15: "robin",
-            16: "bulbul", 17: "jay", 18: "magpie", 19: "chickadee",
-            20: "water_ouzel", 21: "kite", 22: "bald_eagle", 23: "vulture",
-            24: "great_grey_owl", 25: "European_fire_salamander", 26: "common_newt",
-            27: "eft", 28: "spotted_salamander", 29: "axolotl", 30: "bullfrog",
-            31: "tree_frog", 32: "tailed_frog", 33: "loggerhead", 34: "leatherback_turtle",
-            35: "mud_turtle", 36: "terrapin", 37: "box_turtle", 38: "banded_gecko",
-            39: "common_iguana", 40: "American_chameleon", 41: "whiptail", 42: "agama",
-            43: "frilled_lizard", 44: "alligator_lizard", 45: "Gila_monster", 46: "green_lizard",
-            47: "African_chameleon", 48: "Komodo_dragon", 49: "African_crocodile",
-            50: "American_alligator", 51: "triceratops", 52: "thunder_snake", 53: "ringneck_snake",
-            54: "hognose_snake", 55: "green_snake", 56: "king_snake", 57: "garter_snake",
-            58: "water_snake", 59: "vine_snake", 60: "night_snake", 61: "boa_constrictor",
-            62: "rock_python", 63: "Indian_cobra", 64: "green_mamba", 65: "sea_snake",
-            66: "horned_viper", 67: "diamondback", 68: "sidewinder", 69: "trilobite",
-            70: "harvestman", 71: "scorpion", 72: "black_and_gold_garden_spider", 73: "barn_spider",
-            74: "garden_spider", 75: "black_widow", 76: "tarantula", 77: "wolf_spider",
-            78: "tick", 79: "centipede", 80: "black_grouse", 81: "ptarmigan",
-            82: "ruffed_grouse", 83: "prairie_chicken", 84: "peacock", 85: "quail",
-            86: "partridge", 87: "African_grey", 88: "macaw", 89: "sulphur_crested_cockatoo",
-            90: "lorikeet", 91: "coucal", 92: "bee_eater", 93: "hornbill",
-            94: "hummingbird", 95: "jacamar", 96: "toucan", 97: "drake",
-            98: "red_breasted_merganser", 99: "goose", 100: "black_swan"
-        }
-        return basic_classes
+    def _get_imagenet_classes(self) -> Mapping[int, str]:
+        """ImageNetクラス名を取得（同梱ファイルから読み込み済みのものを共有）"""
+        return load_imagenet_classes()
     
     def _get_clip_classes(self) -> Dict[int, str]:
         """CLIP用のクラス名"""
-        return {
-            0: "anime character illustration",
-            1: "manga drawing", 
-            2: "cartoon character",
-            3: "fantasy character",
-            4: "elf character",
-            5: "cute anime girl",
-            6: "anime art style",
-            7: "illustration drawing",
-            8: "realistic photograph",
-            9: "safety equipment helmet",
-            10: "animal",
-            11: "building",
-            12: "car",
-            13: "vehicle",
-            14: "automobile",
-            15: "sports car",
-            16: "racing car",
-            17: "person",
-            18: "nature"
-        }
+        return dict(enumerate(self.clip_text_prompts))
     
     def _get_broad_category_mapping(self) -> Dict[str, List[str]]:
         """大分類カテゴリーのマッピング辞書"""
-        return {
-            '人物': [
-                'person', 'man', 'woman', 'child', 'baby', 'boy', 'girl',
-                'face', 'head', 'portrait', 'selfie', 'people', 'human',
-                'mask', 'wig', 'shower cap', 'hat', 'cap', 'helmet'
-            ],
-            '動物': [
-                'dog', 'cat', 'bird', 'fish', 'horse', 'cow', 'sheep', 'pig',
-                'elephant', 'lion', 'tiger', 'bear', 'wolf', 'fox', 'deer',
-                'rabbit', 'mouse', 'rat', 'hamster', 'squirrel', 'chipmunk',
-                'beaver', 'otter', 'weasel', 'skunk', 'badger', 'raccoon',
-                'panda', 'koala', 'kangaroo', 'monkey', 'ape', 'gorilla',
-                'chimpanzee', 'orangutan', 'lemur', 'sloth', 'anteater',
-                'armadillo', 'hedgehog', 'porcupine', 'platypus', 'echidna'
-            ],
-            '建物': [
-                'house', 'building', 'bridge', 'tower', 'castle', 'palace',
-                'church', 'temple', 'mosque', 'synagogue', 'cathedral',
-                'skyscraper', 'office', 'school', 'hospital', 'library',
-                'museum', 'theater', 'stadium', 'airport', 'station',
-                'hotel', 'restaurant', 'shop', 'store', 'market', 'mall'
-            ],
-            '乗り物': [
-                'car', 'truck', 'bus', 'van', 'motorcycle', 'bicycle',
-                'airplane', 'helicopter', 'boat', 'ship', 'yacht',
-                'train', 'subway', 'tram', 'taxi', 'ambulance', 'fire',
-                'police', 'tank', 'tractor', 'bulldozer', 'crane'
-            ],
-            '自然': [
-                'mountain', 'hill', 'valley', 'forest', 'tree', 'flower',
-                'grass', 'leaf', 'branch', 'root', 'bark', 'wood',
-                'ocean', 'sea', 'lake', 'river', 'stream', 'waterfall',
-                'beach', 'desert', 'canyon', 'cave', 'volcano', 'island',
-                'sky', 'cloud', 'sun', 'moon', 'star', 'rainbow',
-                'snow', 'ice', 'rock', 'stone', 'sand', 'dirt'
-            ],
-            '食べ物': [
-                'food', 'meal', 'dish', 'plate', 'bowl', 'cup', 'glass',
-                'bread', 'cake', 'cookie', 'pie', 'pizza', 'sandwich',
-                'burger', 'hotdog', 'sausage', 'bacon', 'ham', 'chicken',
-                'beef', 'pork', 'fish', 'shrimp', 'lobster', 'crab',
-                'apple', 'banana', 'orange', 'grape', 'strawberry',
-                'vegetable', 'carrot', 'potato', 'tomato', 'onion',
-                'lettuce', 'cabbage', 'broccoli', 'corn', 'pepper'
-            ],
-            'アニメ・イラスト': [
-                'comic book', 'cartoon', 'drawing', 'illustration',
-                'sketch', 'painting', 'artwork', 'manga', 'anime',
-                'book', 'magazine', 'poster', 'print', 'picture', 'image',
-                'envelope', 'paper', 'handkerchief', 'mask', 'towel'
-            ],
-            'テクノロジー': [
-                'computer', 'laptop', 'desktop', 'monitor', 'keyboard',
-                'mouse', 'phone', 'smartphone', 'tablet', 'camera',
-                'television', 'tv', 'radio', 'speaker', 'headphone',
-                'microphone', 'printer', 'scanner', 'router', 'modem',
-                'hardware', 'software', 'gadget', 'device', 'machine'
-            ],
-            'ファッション': [
-                'clothing', 'shirt', 'dress', 'pants', 'jeans', 'skirt',
-                'jacket', 'coat', 'sweater', 'hoodie', 't-shirt',
-                'shoes', 'boots', 'sneakers', 'sandals', 'heels',
-                'gloves', 'scarf', 'tie', 'belt', 'watch', 'jewelry', 
-                'ring', 'necklace', 'earring', 'bracelet', 'bag', 'purse', 'backpack'
-            ],
-            'スポーツ': [
-                'sports', 'game', 'ball', 'football', 'soccer', 'basketball',
-                'tennis', 'baseball', 'golf', 'hockey', 'cricket',
-                'volleyball', 'badminton', 'ping', 'pong', 'rugby',
-                'swimming', 'running', 'cycling', 'skiing', 'skating',
-                'surfing', 'diving', 'boxing', 'wrestling', 'martial',
-                'gym', 'fitness', 'exercise', 'workout', 'training'
-            ]
-        }
+        return BROAD_CATEGORY_MAPPING
+    
+    def _get_category_matrix(self, model_name: str) -> CategoryMatrix:
+        """クラス一覧ごとのカテゴリー重み行列を取得（初回のみ作成）"""
+        class_set = 'clip' if model_name == 'clip' else 'imagenet'
+        matrix = self._category_matrices.get(class_set)
+        if matrix is None:
+            class_names = self._get_clip_classes() if class_set == 'clip' else self._get_imagenet_classes()
+            matrix = CategoryMatrix(class_names)
+            self._category_matrices[class_set] = matrix
+        return matrix
     
     def _apply_broad_category_classification(self, predictions: np.ndarray, model_name: str) -> List[Dict]:
         """大分類カテゴリーでの分類"""
+        return self._apply_broad_category_classification_batch(predictions[:1], model_name)[0]
+    
+    def _apply_broad_category_classification_batch(self, predictions: np.ndarray, model_name: str) -> List[List[Dict]]:
+        """大分類カテゴリーでの分類（バッチ内の全画像をまとめて計算）"""
         try:
-            # クラス名を取得
-            if model_name == 'clip':
-                class_names = self._get_clip_classes()
-            else:
-                class_names = self._get_imagenet_classes()
+            category_matrix = self._get_category_matrix(model_name)
             
-            # 大分類マッピングを取得
-            category_mapping = self._get_broad_category_mapping()
+            # 各カテゴリーの信頼度を1回の行列積で計算（重み付け込み）
+            batch_scores = category_matrix.scores(predictions)
             
-            
-            # 各カテゴリーの信頼度を計算
-            category_scores = {}
-            for category, keywords in category_mapping.items():
-                category_confidence = 0.0
-                for idx, class_name in class_names.items():
-                    # idxが整数であることを確認
-                    if isinstance(idx, int) and idx < len(predictions[0]):
-                        if any(keyword in class_name.lower() for keyword in keywords):
-                            category_confidence += predictions[0][idx]
+            return [
+                self._select_broad_categories(category_matrix.categories, scores)
+                for scores in batch_scores
+            ]
                 
-                # 人物とアニメ・イラストを優先（重み付け）
-                if category == '人物':
-                    category_confidence *= 2.0  # 2倍の重み
-                elif category == 'アニメ・イラスト':
-                    category_confidence *= 1.5  # 1.5倍の重み
+        except Exception as e:
+            logger.error(f"大分類カテゴリー分類エラー: {e}")
+            return [[] for _ in range(len(predictions))]
+    
+    def _select_broad_categories(self, categories: Tuple[str, ...], scores: np.ndarray) -> List[Dict]:
+        """カテゴリーの信頼度から上位の結果を選ぶ"""
+        # 信頼度順にソート
+        sorted_categories = sorted(zip(categories, scores), key=lambda x: x[1], reverse=True)
+        
+        # 上位3つのカテゴリーを返す
+        results = []
+        for i, (category, confidence) in enumerate(sorted_categories[:3]):
+            if confidence > 0.001:  # 0.1%以上の信頼度
+                # 信頼度を20%以上、90%以下に調整（より現実的な値に）
+                min_confidence = 0.20
+                max_confidence = 0.90
+                adjusted_confidence = max(min(confidence, max_confidence), min_confidence)
                 
-                category_scores[category] = category_confidence
-            
-            # 信頼度順にソート
-            sorted_categories = sorted(category_scores.items(), key=lambda x: x[1], reverse=True)
-            
-            # 上位3つのカテゴリーを返す
-            results = []
-            for i, (category, confidence) in enumerate(sorted_categories[:3]):
-                if confidence > 0.001:  # 0.1%以上の信頼度
-                    # 信頼度を20%以上、90%以下に調整（より現実的な値に）
-                    min_confidence = 0.20
-                    max_confidence = 0.90
+                results.append({
+                    'label': category,
+                    'confidence': adjusted_confidence * 100,
+                    'rank': i + 1
+                })
+        
+        # 結果が1件以下の場合は、信頼度の閾値を下げて追加の結果を取得
+        if len(results) < 3:
+            for i, (category, confidence) in enumerate(sorted_categories[3:6]):
+                if confidence > 0.0001:  # 0.01%以上の信頼度
+                    # 信頼度を15%以上、80%以下に調整（より現実的な値に）
+                    min_confidence = 0.15
+                    max_confidence = 0.80
                     adjusted_confidence = max(min(confidence, max_confidence), min_confidence)
                     
                     results.append({
                         'label': category,
                         'confidence': adjusted_confidence * 100,
-                        'rank': i + 1
+                        'rank': len(results) + 1
                     })
-            
-            # 結果が1件以下の場合は、信頼度の閾値を下げて追加の結果を取得
-            if len(results) < 3:
-                for i, (category, confidence) in enumerate(sorted_categories[3:6]):
-                    if confidence > 0.0001:  # 0.01%以上の信頼度
-                        # 信頼度を15%以上、80%以下に調整（より現実的な値に）
-                        min_confidence = 0.15
-                        max_confidence = 0.80
-                        adjusted_confidence = max(min(confidence, max_confidence), min_confidence)
-                        
-                        results.append({
-                            'label': category,
-                            'confidence': adjusted_confidence * 100,
-                            'rank': len(results) + 1
-                        })
-                        
-                        if len(results) >= 3:
-                            break
-            
-            return results
-                
-        except Exception as e:
-            logger.error(f"大分類カテゴリー分類エラー: {e}")
-            return []
+                    
+                    if len(results) >= 3:
+                        break
+        
+        return results
     
     def _format_predictions(self, predictions: np.ndarray, model_name: str) -> List[Dict]:
         """予測結果を整形する（大分類カテゴリー使用）"""
+        return self._format_predictions_batch(predictions[:1], model_name)[0]
+    
+    def _format_predictions_batch(self, predictions: np.ndarray, model_name: str) -> List[List[Dict]]:
+        """バッチの予測結果を画像ごとに整形する（大分類カテゴリー使用）"""
         try:
             # フロントエンドのモデル名を内部モデル名にマッピング
-            model_mapping = {
-                'resnet50': 'pytorch_resnet50',
-                'efficientnet': 'pytorch_efficientnet',
-                'mobilenet': 'pytorch_mobilenet',
-                'vgg16': 'pytorch_vgg16',
-                'clip': 'clip',
-                'custom': 'clip'  # customモデルをCLIPにマッピング
-            }
-            
-            internal_model_name = model_mapping.get(model_name, model_name)
+            internal_model_name = MODEL_NAME_MAPPING.get(model_name, model_name)
             
             # CLIPの場合は専用の処理を行う
             if internal_model_name == 'clip':
-                return self._format_clip_predictions(predictions)
+                return [self._format_clip_predictions(predictions[i:i + 1]) for i in range(len(predictions))]
             
             # 大分類カテゴリーでの分類を適用
-            broad_category_results = self._apply_broad_category_classification(predictions, internal_model_name)
-            
-            # 結果がある場合はそれを返す
-            if broad_category_results:
-                return broad_category_results
-            
-            # 大分類で結果がない場合は、デフォルト結果を返す
-            logger.warning(f"大分類で結果が取得できませんでした: {internal_model_name}")
-            return [
-                {'label': '分類不明', 'confidence': 50.0, 'rank': 1},
-                {'label': 'その他', 'confidence': 30.0, 'rank': 2},
-                {'label': '未分類', 'confidence': 20.0, 'rank': 3}
-            ]
+            batch_results = self._apply_broad_category_classification_batch(predictions, internal_model_name)
+            
+            formatted = []
+            for broad_category_results in batch_results:
+                # 結果がある場合はそれを返す
+                if broad_category_results:
+                    formatted.append(broad_category_results)
+                    continue
+                
+                # 大分類で結果がない場合は、デフォルト結果を返す
+                logger.warning(f"大分類で結果が取得できませんでした: {internal_model_name}")
+                formatted.append([
+                    {'label': '分類不明', 'confidence': 50.0, 'rank': 1},
+                    {'label': 'その他', 'confidence': 30.0, 'rank': 2},
+                    {'label': '未分類', 'confidence': 20.0, 'rank': 3}
+                ])
+            return formatted
         
         except Exception as e:
             logger.error(f"予測結果の整形に失敗: {e}")
-            return [{'label': 'Error', 'confidence': 0.0, 'rank': 1}]
+            return [[{'label': 'Error', 'confidence': 0.0, 'rank': 1}] for _ in range(len(predictions))]
     
     def _format_clip_predictions(self, predictions: np.ndarray) -> List[Dict]:
         """CLIP専用の予測結果整形（大分類カテゴリーにマッピング）"""
@@ -770,3 +801,6 @@ class AnalysisService:
 
 # シングルトンインスタンス
 analysis_service = AnalysisService()
+
+# gunicornのpreload_appでforkされたワーカーでは、マスタープロセスで読み込んだモデルを引き継いで使う
+os.register_at_fork(after_in_child=analysis_service.reset_after_fork)
@@ -0,0 +1,83 @@
+"""
+ワーカープロセス間でのモデルの重みの共有
+gunicornのワーカーごとにモデルを読み込むと、モデルのメモリがワーカー数倍になる。次の2つの方法で
+同じ重みを複数のワーカーから同じ物理ページとして参照させる。
+
+- preload_app: マスタープロセスでモデルを読み込んでからワーカーをforkする。重みのテンソルは
+  書き込まれないため、コピーオンライトでワーカー間で共有されたままになる。
+  fork前にgc.freeze()で既存のオブジェクトをGCの対象から外し、GCによるページの書き換えを防ぐ。
+- メモリマップ（ANALYSIS_MODEL_WEIGHTS_MMAP）: 重みをファイルからmmapで読み込む。
+  ページはOSのページキャッシュとして全プロセスで共有されるため、preload_appを使わない構成
+  （ワーカーごとに読み込む・ワーカーの再起動）でも重みは1つ分のメモリで済む。
+"""
+import gc
+import logging
+import os
+from typing import Callable, Dict, List
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def get_weights_path(weights) -> str:
+    """torchvisionの重み（Weights列挙値）をメモリマップ用に保存するファイルのパス"""
+    weights_dir = getattr(settings, 'ANALYSIS_MODEL_WEIGHTS_DIR', os.path.join(settings.BASE_DIR, 'model_cache', 'weights'))
+    return os.path.join(str(weights_dir), os.path.basename(weights.url))
+
+
+def load_mmap_state_dict(weights) -> Dict:
+    """重みをメモリマップで読み込む（初回のみtorchvisionの重みを取得してmmap可能な形式で保存する）"""
+    import torch
+
+    path = get_weights_path(weights)
+    if not os.path.exists(path):
+        # torchvisionが配布する重みには旧形式のファイルがあり、そのままではmmapできない
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        torch.save(weights.get_state_dict(progress=False), tmp_path)
+        os.replace(tmp_path, path)
+        logger.info(f"メモリマップ用の重みを保存: {path}")
+    return torch.load(path, map_location='cpu', mmap=True, weights_only=True)
+
+
+def build_model_with_mmap_weights(builder: Callable, weights):
+    """メモリマップした重みを直接参照するモデルを組み立てる
+
+    モデルはmetaデバイス上で（重みのメモリを確保せずに）組み立て、assign=Trueで
+    パラメーターをメモリマップされたテンソルに置き換える。
+    """
+    import torch
+
+    state_dict = load_mmap_state_dict(weights)
+    with torch.device('meta'):
+        model = builder(weights=None)
+    model.load_state_dict(state_dict, assign=True)
+    model.eval()
+    return model
+
+
+def preload_models() -> List[str]:
+    """解析サービスを作成し、ANALYSIS_PRELOAD_MODELSのモデルを読み込む（読み込み済みのモデル名を返す）"""
+    from .services import analysis_service
+
+    status = analysis_service.get_model_status()
+    return [name for name, info in status.items() if info['state'] == 'loaded']
+
+
+def prepare_master_for_fork() -> None:
+    """gunicornのマスタープロセスでモデルを読み込み、ワーカーをforkできる状態にする
+
+    preload_app = True の場合に、ワーカーのfork前（when_readyフック）で呼ぶ。
+    """
+    from django.db import connections
+
+    loaded = preload_models()
+
+    # 親プロセスのDB接続をワーカーが引き継いで共有しないよう閉じておく
+    connections.close_all()
+
+    # 読み込み済みのオブジェクトを永続世代に移し、ワーカーでのGCがページを書き換えないようにする
+    gc.collect()
+    gc.freeze()
+    logger.info(f"マスタープロセスでモデルを読み込みました（ワーカーで共有）: {loaded}")
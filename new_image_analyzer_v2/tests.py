@@ -0,0 +1,603 @@
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import events, execution
+from .category_matrix import BROAD_CATEGORY_MAPPING, CategoryMatrix
+from .jobs import claim_next_job, claim_next_jobs, enqueue_analysis_jobs, run_job, run_jobs
+from .management.commands.benchmark_analysis import BENCHMARK_FORMAT_VERSION, compare_reports
+from .model_registry import STATE_FAILED, STATE_LOADED, ModelRegistry
+from .models import MstUser, TransAnalysisJob, TransAnalysisRun, TransImageAnalysis, TransUploadedImage
+from .near_duplicates import NearDuplicateIndex, find_reusable_results
+from .pagination import ImageTablePaginator
+from .preprocessing import IMAGENET_SPEC
+from .services import AnalysisService, analysis_service, load_imagenet_classes
+from .views.helpers import _save_analysis_results, perform_batch_image_analysis
+from .views.stream import _event_stream
+
+
+def _baseline_broad_categories(predictions: np.ndarray, class_names) -> list:
+    """行列化する前の、クラスごとに足し合わせる大分類カテゴリーの計算（比較用）"""
+    category_scores = {}
+    for category, keywords in BROAD_CATEGORY_MAPPING.items():
+        category_confidence = 0.0
+        for idx, class_name in class_names.items():
+            if isinstance(idx, int) and idx < len(predictions[0]):
+                if any(keyword in class_name.lower() for keyword in keywords):
+                    category_confidence += predictions[0][idx]
+
+        if category == '人物':
+            category_confidence *= 2.0
+        elif category == 'アニメ・イラスト':
+            category_confidence *= 1.5
+
+        category_scores[category] = category_confidence
+
+    sorted_categories = sorted(category_scores.items(), key=lambda x: x[1], reverse=True)
+
+    results = []
+    for i, (category, confidence) in enumerate(sorted_categories[:3]):
+        if confidence > 0.001:
+            adjusted_confidence = max(min(confidence, 0.90), 0.20)
+            results.append({'label': category, 'confidence': adjusted_confidence * 100, 'rank': i + 1})
+
+    if len(results) < 3:
+        for i, (category, confidence) in enumerate(sorted_categories[3:6]):
+            if confidence > 0.0001:
+                adjusted_confidence = max(min(confidence, 0.80), 0.15)
+                results.append({'label': category, 'confidence': adjusted_confidence * 100, 'rank': len(results) + 1})
+                if len(results) >= 3:
+                    break
+
+    return results
+
+
+class CategoryMatrixTests(SimpleTestCase):
+    """カテゴリー重み行列での分類が、従来のクラスごとのループと同じ結果になること"""
+
+    def _predictions(self) -> np.ndarray:
+        rng = np.random.default_rng(20240601)
+        num_classes = len(load_imagenet_classes())
+        rows = [
+            # 全クラスに分散した出力と、少数のクラスに集中した出力
+            rng.dirichlet(np.full(num_classes, 0.05)),
+            rng.dirichlet(np.full(num_classes, 1.0)),
+            rng.dirichlet(np.full(num_classes, 0.01)),
+            np.full(num_classes, 1.0 / num_classes),
+        ]
+        rows.extend(rng.dirichlet(np.full(num_classes, 0.02)) for _ in range(32))
+
+        # 2つのカテゴリーの合計がほぼ同じになる出力（順位が入れ替わりやすい）
+        matrix = CategoryMatrix(load_imagenet_classes())
+        animal = int(np.flatnonzero(matrix.matrix[matrix.categories.index('動物')])[0])
+        vehicle = int(np.flatnonzero(matrix.matrix[matrix.categories.index('乗り物')])[0])
+        near_tie = np.full(num_classes, 1e-5)
+        near_tie[animal] = near_tie[vehicle] = 0.3
+        near_tie[vehicle] += 1e-7
+        rows.append(near_tie / near_tie.sum())
+
+        # モデルの出力と同じfloat32にする
+        return np.stack(rows).astype(np.float32)
+
+    def assertMatchesBaseline(self, results, expected):
+        self.assertEqual(
+            [(r['label'], r['rank']) for r in results],
+            [(r['label'], r['rank']) for r in expected],
+        )
+        for result, expected_result in zip(results, expected):
+            self.assertAlmostEqual(float(result['confidence']), float(expected_result['confidence']), places=4)
+
+    def test_batch_matches_per_class_loop(self):
+        predictions = self._predictions()
+        class_names = load_imagenet_classes()
+
+        batch_results = analysis_service._apply_broad_category_classification_batch(predictions, 'pytorch_resnet50')
+
+        self.assertEqual(len(batch_results), len(predictions))
+        for row, results in zip(predictions, batch_results):
+            self.assertMatchesBaseline(results, _baseline_broad_categories(row[np.newaxis, :], class_names))
+
+    def test_single_image_matches_per_class_loop(self):
+        predictions = self._predictions()
+        class_names = load_imagenet_classes()
+
+        for i in range(len(predictions)):
+            results = analysis_service._apply_broad_category_classification(predictions[i:i + 1], 'pytorch_resnet50')
+            self.assertMatchesBaseline(results, _baseline_broad_categories(predictions[i:i + 1], class_names))
+
+    def test_scores_are_float32(self):
+        matrix = CategoryMatrix(load_imagenet_classes())
+        scores = matrix.scores(self._predictions())
+
+        self.assertEqual(scores.dtype, np.float32)
+        self.assertEqual(scores.shape[1], len(BROAD_CATEGORY_MAPPING))
+
+
+@override_settings(ANALYSIS_JOB_MAX_ATTEMPTS=2, ANALYSIS_JOB_RETRY_BACKOFF_SECONDS=0)
+class AnalysisJobFailureTests(TestCase):
+    """推論に失敗したジョブは結果を保存せずに再実行され、上限回数で失敗になること"""
+
+    def setUp(self):
+        user = MstUser.objects.create(username='tester', email='tester@example.com')
+        self.image = TransUploadedImage.objects.create(
+            user_id=user, filename='a.jpg', file_path='/nonexistent/a.jpg', status='preparing'
+        )
+
+    def _run_next_job(self):
+        TransAnalysisJob.objects.filter(status='queued').update(available_at=timezone.now() - timedelta(seconds=1))
+        job = claim_next_job('test-worker')
+        self.assertIsNotNone(job)
+        run_job(job)
+        job.refresh_from_db()
+        return job
+
+    @mock.patch.object(analysis_service, 'analyze_image', return_value={'success': False, 'error': 'inference failed'})
+    def test_failed_inference_is_retried_then_failed(self, analyze_image):
+        enqueue_analysis_jobs([self.image.image_id], 'resnet50')
+
+        job = self._run_next_job()
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('inference failed', job.last_error)
+
+        job = self._run_next_job()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.attempts, 2)
+
+        self.image.refresh_from_db()
+        self.assertEqual(self.image.status, 'failed')
+        self.assertEqual(self.image.latest_results, [])
+        self.assertFalse(TransImageAnalysis.objects.filter(image_id=self.image).exists())
+        self.assertEqual(
+            list(TransAnalysisRun.objects.filter(image_id=self.image).values_list('status', flat=True)),
+            ['failed', 'failed'],
+        )
+        self.assertEqual(analyze_image.call_count, 2)
+
+    def test_expired_job_at_max_attempts_is_failed_not_reclaimed(self):
+        # ワーカーが異常終了したまま、ロック期限が切れたジョブ（再実行の上限に到達済み）
+        job = enqueue_analysis_jobs([self.image.image_id], 'resnet50')[0]
+        TransAnalysisJob.objects.filter(job_id=job.job_id).update(
+            status='running', attempts=2, locked_by='dead-worker',
+            locked_at=timezone.now() - timedelta(seconds=3600),
+        )
+        TransUploadedImage.objects.filter(image_id=self.image.image_id).update(status='analyzing')
+
+        with mock.patch('new_image_analyzer_v2.jobs.notify_images') as notify_images:
+            self.assertIsNone(claim_next_job('test-worker'))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(job.locked_by, 'dead-worker')
+        self.image.refresh_from_db()
+        self.assertEqual(self.image.status, 'failed')
+        notify_images.assert_called_once_with([self.image.image_id])
+
+    def test_expired_job_below_max_attempts_is_reclaimed(self):
+        job = enqueue_analysis_jobs([self.image.image_id], 'resnet50')[0]
+        TransAnalysisJob.objects.filter(job_id=job.job_id).update(
+            status='running', attempts=1, locked_by='dead-worker',
+            locked_at=timezone.now() - timedelta(seconds=3600),
+        )
+
+        claimed = claim_next_job('test-worker')
+
+        self.assertEqual(claimed.job_id, job.job_id)
+        self.assertEqual(claimed.attempts, 2)
+        self.assertEqual(claimed.locked_by, 'test-worker')
+
+
+@override_settings(ANALYSIS_JOB_MAX_ATTEMPTS=2, ANALYSIS_JOB_RETRY_BACKOFF_SECONDS=0)
+class AnalysisBatchJobTests(TestCase):
+    """同じモデルのジョブをまとめて取得し、一括解析（analyze_images）で実行すること"""
+
+    def setUp(self):
+        user = MstUser.objects.create(username='tester', email='tester@example.com')
+        self.images = [
+            TransUploadedImage.objects.create(
+                user_id=user, filename=f'{i}.jpg', file_path=f'/nonexistent/{i}.jpg', upload_order=i, status='preparing'
+            )
+            for i in range(3)
+        ]
+
+    def test_claims_jobs_of_the_same_model(self):
+        enqueue_analysis_jobs([self.images[0].image_id, self.images[1].image_id], 'resnet50')
+        enqueue_analysis_jobs([self.images[2].image_id], 'mobilenet')
+
+        jobs = claim_next_jobs('test-worker', 8)
+
+        self.assertEqual([job.image_id_id for job in jobs], [self.images[0].image_id, self.images[1].image_id])
+        self.assertEqual(
+            list(TransAnalysisJob.objects.order_by('job_id').values_list('status', 'attempts')),
+            [('running', 1), ('running', 1), ('queued', 0)],
+        )
+
+    def test_batch_records_each_image_outcome(self):
+        responses = [
+            {'success': True, 'results': [{'label': '動物', 'confidence': 80.0, 'rank': 1}]},
+            {'success': False, 'error': 'decode failed'},
+        ]
+        enqueue_analysis_jobs([self.images[0].image_id, self.images[1].image_id], 'resnet50')
+        jobs = claim_next_jobs('test-worker', 8)
+
+        with mock.patch.object(analysis_service, 'analyze_images', return_value=responses) as analyze_images:
+            run_jobs(jobs)
+
+        analyze_images.assert_called_once_with([self.images[0].file_path, self.images[1].file_path], 'resnet50')
+        for job in jobs:
+            job.refresh_from_db()
+        self.assertEqual([job.status for job in jobs], ['succeeded', 'queued'])
+        self.assertIsNotNone(jobs[0].timings)
+        self.assertIn('decode failed', jobs[1].last_error)
+
+        completed, failed = self.images[0], self.images[1]
+        completed.refresh_from_db()
+        failed.refresh_from_db()
+        self.assertEqual(completed.status, 'completed')
+        self.assertEqual([result.label for result in completed.get_previous_results()], ['動物'])
+        self.assertEqual(failed.status, 'preparing')
+        self.assertFalse(TransImageAnalysis.objects.filter(image_id=failed).exists())
+        self.assertEqual(completed.latest_run_id.status, 'succeeded')
+        self.assertEqual(TransAnalysisRun.objects.get(image_id=failed).status, 'failed')
+
+    def test_batch_treats_cached_empty_results_as_hit(self):
+        with mock.patch('new_image_analyzer_v2.result_cache.result_cache.get', return_value=[]), \
+                mock.patch('new_image_analyzer_v2.near_duplicates.find_reusable_results') as find_reusable_results, \
+                mock.patch.object(analysis_service, 'analyze_images') as analyze_images:
+            batch_results = perform_batch_image_analysis(self.images[:2], 'resnet50')
+
+        self.assertEqual(batch_results, [[], []])
+        find_reusable_results.assert_not_called()
+        analyze_images.assert_not_called()
+
+
+@override_settings(ANALYSIS_EVENTS_BACKEND='local', ANALYSIS_EVENTS_HEARTBEAT_SECONDS=0.01)
+class AnalysisEventStreamTests(TestCase):
+    """進捗ストリーム（SSE）"""
+
+    def setUp(self):
+        self.user = MstUser.objects.create(username='tester', email='tester@example.com')
+        self.image = TransUploadedImage.objects.create(
+            user_id=self.user, filename='a.jpg', file_path='/nonexistent/a.jpg', status='analyzing'
+        )
+
+    async def test_heartbeat_catches_up_on_missed_events(self):
+        stream = _event_stream([self.image.image_id])
+
+        self.assertIn('"status": "analyzing"', await anext(stream))
+
+        # 別プロセスのワーカーが完了させた場合（このプロセスのブローカーにはイベントが届かない）
+        await sync_to_async(TransUploadedImage.objects.filter(image_id=self.image.image_id).update)(status='completed')
+
+        self.assertIn('"status": "completed"', await anext(stream))
+        self.assertTrue((await anext(stream)).startswith('event: end'))
+        self.assertEqual([chunk async for chunk in stream], [])
+        self.assertEqual(events.broker.subscriber_count(), 0)
+
+    async def _get(self, user, **params):
+        client = AsyncClient()
+        await sync_to_async(client.force_login)(user)
+        return await client.get(reverse('v2_api_analysis_events'), params)
+
+    async def test_rejects_non_integer_image_id(self):
+        response = await self._get(self.user, image_id='abc')
+
+        self.assertEqual(response.status_code, 400)
+
+    async def test_other_users_image_is_not_streamed(self):
+        other = await MstUser.objects.acreate(username='other', email='other@example.com')
+
+        response = await self._get(other, image_id=self.image.image_id)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(events.broker.subscriber_count(), 0)
+
+    async def test_subscribes_when_the_stream_starts(self):
+        response = await self._get(self.user, image_id=self.image.image_id)
+
+        self.assertEqual(response.status_code, 200)
+        # 送信開始前に接続が切れた場合は購読しない
+        self.assertEqual(events.broker.subscriber_count(), 0)
+        await response.streaming_content.aclose()
+
+
+@override_settings(ANALYSIS_NEAR_DUPLICATE_REUSE=True)
+class NearDuplicateReuseTests(TestCase):
+    """類似画像の解析結果は、同じモデルバージョンで成功した最新の解析実行のものだけを再利用すること"""
+
+    def setUp(self):
+        patcher = mock.patch('new_image_analyzer_v2.near_duplicates.near_duplicate_index', NearDuplicateIndex())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        user = MstUser.objects.create(username='tester', email='tester@example.com')
+        self.source = TransUploadedImage.objects.create(
+            user_id=user, filename='a.jpg', file_path='/nonexistent/a.jpg', status='completed',
+            perceptual_hash='0f0f0f0f0f0f0f0f',
+        )
+        self.copy = TransUploadedImage.objects.create(
+            user_id=user, filename='b.jpg', file_path='/nonexistent/b.jpg', status='preparing',
+            perceptual_hash='0f0f0f0f0f0f0f0e',
+        )
+
+    def _complete_source(self, model_version, status='succeeded', error=None):
+        now = timezone.now()
+        run = TransAnalysisRun.objects.create(
+            image_id=self.source, model_name='resnet50', model_version=model_version,
+            status=status, completed_at=now, error=error,
+        )
+        TransImageAnalysis.objects.create(
+            image_id=self.source, run_id=run, label='動物', confidence=80.0, model_name='resnet50', rank=1,
+            analysis_started_at=now, analysis_completed_at=now,
+        )
+        self.source.latest_run_id = run
+        self.source.save(update_fields=['latest_run_id'])
+
+    def test_reuses_results_of_the_same_model_version(self):
+        self._complete_source('weights/v2/r2')
+
+        results = find_reusable_results(self.copy, 'resnet50', 'weights/v2/r2')
+
+        self.assertEqual([(r['label'], r['reused_from'], r['reuse_distance']) for r in results], [('動物', self.source.image_id, 1)])
+
+    def test_ignores_results_of_other_model_versions(self):
+        self._complete_source('weights/v1/r2')
+
+        self.assertIsNone(find_reusable_results(self.copy, 'resnet50', 'weights/v2/r2'))
+
+    def test_ignores_failed_runs(self):
+        self._complete_source('weights/v2/r2', status='failed', error='inference failed')
+
+        self.assertIsNone(find_reusable_results(self.copy, 'resnet50', 'weights/v2/r2'))
+
+    def test_ignores_runs_with_errors(self):
+        self._complete_source('weights/v2/r2', error='inference failed')
+
+        self.assertIsNone(find_reusable_results(self.copy, 'resnet50', 'weights/v2/r2'))
+
+
+class _FakeClassifier:
+    """ベンチマーク用の軽量なモデル（重みを読み込まずに一定の出力を返す）"""
+
+    def __call__(self, batch):
+        import torch
+        return torch.zeros(batch.shape[0], 1000)
+
+    def parameters(self):
+        return []
+
+
+class BenchmarkAnalysisTests(SimpleTestCase):
+    """benchmark_analysis の出力が機械で読めて、以前の結果と比較できること"""
+
+    def _report(self, images_per_second, p50_ms=10.0):
+        return {
+            'format_version': BENCHMARK_FORMAT_VERSION,
+            'meta': {'git_commit': 'abc'},
+            'results': [{'model': 'mobilenet', 'cases': [
+                {'batch_size': 1, 'threads': 1, 'p50_ms': p50_ms, 'p95_ms': p50_ms, 'p99_ms': p50_ms,
+                 'images_per_second': images_per_second},
+            ]}],
+        }
+
+    def test_compare_flags_throughput_regressions(self):
+        comparison = compare_reports(self._report(80.0, p50_ms=12.5), self._report(100.0), threshold=10.0)
+
+        self.assertEqual(comparison['regressions'], 1)
+        case = comparison['cases'][0]
+        self.assertEqual((case['model'], case['batch_size'], case['threads']), ('mobilenet', 1, 1))
+        self.assertAlmostEqual(case['throughput_change_percent'], -20.0)
+        self.assertAlmostEqual(case['p50_change_percent'], 25.0)
+        self.assertTrue(case['regression'])
+
+    def test_compare_within_threshold(self):
+        comparison = compare_reports(self._report(95.0), self._report(100.0), threshold=10.0)
+
+        self.assertEqual(comparison['regressions'], 0)
+
+    def test_compare_rejects_other_format_versions(self):
+        baseline = dict(self._report(100.0), format_version=BENCHMARK_FORMAT_VERSION + 1)
+
+        with self.assertRaises(ValueError):
+            compare_reports(self._report(100.0), baseline, threshold=10.0)
+
+    def _run(self, *args):
+        stdout = io.StringIO()
+        loader = mock.Mock(return_value={
+            'model': _FakeClassifier(), 'preprocess_spec': IMAGENET_SPEC, 'type': 'pytorch_mobilenet', 'nbytes': 1,
+        })
+        with mock.patch.dict(analysis_service.registry._loaders, {'pytorch_mobilenet': loader}):
+            call_command(
+                'benchmark_analysis', '--models', 'mobilenet', '--formats', 'png', '--sizes', '64x48',
+                '--images', '4', '--batch-sizes', '1', '2', '--threads', '1', *args,
+                stdout=stdout, stderr=io.StringIO(),
+            )
+        analysis_service.registry.unload('pytorch_mobilenet')
+        return json.loads(stdout.getvalue())
+
+    def test_output_can_be_compared_with_a_previous_run(self):
+        report = self._run()
+
+        self.assertEqual(report['format_version'], BENCHMARK_FORMAT_VERSION)
+        cases = report['results'][0]['cases']
+        self.assertEqual([(case['batch_size'], case['errors']) for case in cases], [(1, 0), (2, 0)])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            baseline_path = os.path.join(tmpdir, 'baseline.json')
+            with open(baseline_path, 'w', encoding='utf-8') as f:
+                json.dump(report, f)
+            compared = self._run('--compare', baseline_path, '--regression-threshold', '1000')
+
+            self.assertEqual(len(compared['comparison']['cases']), 2)
+            self.assertEqual(compared['comparison']['regressions'], 0)
+
+            # 全ての条件を回帰とみなす閾値で、回帰があれば失敗する
+            with self.assertRaises(CommandError):
+                self._run('--compare', baseline_path, '--regression-threshold', '-1000', '--fail-on-regression')
+
+
+class AnalysisWriteQueryTests(TestCase):
+    """解析結果の保存・解析開始のステータス更新のクエリ数が、結果・画像の件数によらず一定であること"""
+
+    def setUp(self):
+        self.user = MstUser.objects.create(username='tester', email='tester@example.com')
+
+    def _create_images(self, count, status='uploaded'):
+        return [
+            TransUploadedImage.objects.create(
+                user_id=self.user, filename=f'{i}.jpg', file_path=f'/nonexistent/{i}.jpg', status=status
+            )
+            for i in range(count)
+        ]
+
+    def test_save_analysis_results_query_count(self):
+        for count in (1, 3, 10):
+            with self.subTest(results=count):
+                image = self._create_images(1, status='analyzing')[0]
+                run = TransAnalysisRun.objects.create(image_id=image, model_name='resnet50')
+                results = [
+                    {'label': f'label{i}', 'confidence': 50.0 - i, 'model_name': 'resnet50', 'rank': i + 1}
+                    for i in range(count)
+                ]
+
+                # SAVEPOINT / 結果のINSERT / 解析実行のUPDATE / 画像のUPDATE / RELEASE
+                with self.assertNumQueries(5):
+                    _save_analysis_results(image, run, results)
+
+                self.assertEqual(TransImageAnalysis.objects.filter(run_id=run).count(), count)
+
+    def test_start_analysis_query_count(self):
+        self.client.force_login(self.user)
+        url = reverse('v2_api_start_analysis')
+
+        for count in (1, 3, 10):
+            with self.subTest(images=count):
+                image_ids = [image.image_id for image in self._create_images(count)]
+                session = self.client.session
+                session['uploaded_image_ids'] = image_ids
+                session.save()
+
+                # セッション・ユーザーの読み込みと保存、対象画像の取得、ステータス更新、ジョブの登録・通知
+                with self.assertNumQueries(10):
+                    response = self.client.post(url, {'model': 'resnet50'})
+
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(TransAnalysisJob.objects.filter(image_id__in=image_ids).count(), count)
+                self.assertFalse(TransUploadedImage.objects.filter(image_id__in=image_ids).exclude(status='preparing').exists())
+
+
+@override_settings(IMAGE_TABLE_EXACT_COUNT_THRESHOLD=1)
+class ImageTablePaginatorTests(TestCase):
+    """件数が見積もりの場合も、実際の画像の件数どおりにページを辿れること"""
+
+    def setUp(self):
+        user = MstUser.objects.create(username='tester', email='tester@example.com')
+        for i in range(25):
+            TransUploadedImage.objects.create(
+                user_id=user, filename=f'{i}.jpg', file_path=f'/nonexistent/{i}.jpg', status='uploaded'
+            )
+        self.images = TransUploadedImage.objects.all()
+
+    def _paginator(self, estimate):
+        patcher = mock.patch('new_image_analyzer_v2.pagination._estimated_rows', return_value=estimate)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return ImageTablePaginator(self.images, 10)
+
+    def _walk(self, paginator):
+        """1ページ目から has_next を辿って全ページの画像IDを集める"""
+        page = paginator.get_page(1)
+        image_ids = [image.image_id for image in page]
+        while page.has_next():
+            page = paginator.get_page(page.next_page_number())
+            image_ids.extend(image.image_id for image in page)
+        return image_ids
+
+    def test_estimate_too_low_reaches_every_page(self):
+        paginator = self._paginator(estimate=5)
+        self.assertTrue(paginator.count_is_approximate)
+
+        image_ids = self._walk(paginator)
+
+        self.assertEqual(len(image_ids), 25)
+        self.assertEqual(set(image_ids), set(self.images.values_list('image_id', flat=True)))
+        self.assertEqual(paginator.count, 25)
+        self.assertEqual(paginator.num_pages, 3)
+
+    def test_estimate_too_high_has_no_trailing_empty_pages(self):
+        paginator = self._paginator(estimate=1000)
+
+        image_ids = self._walk(paginator)
+
+        self.assertEqual(len(image_ids), 25)
+        self.assertEqual(paginator.count, 25)
+        self.assertFalse(paginator.count_is_approximate)
+
+    def test_page_beyond_end_falls_back_to_last_page(self):
+        paginator = self._paginator(estimate=1000)
+
+        page = paginator.get_page(50)
+
+        self.assertEqual(page.number, 3)
+        self.assertEqual(len(page), 5)
+        self.assertFalse(page.has_next())
+        self.assertEqual(paginator.num_pages, 3)
+
+
+class ModelRegistryRetryTests(SimpleTestCase):
+    """読み込みに失敗したモデルは、再試行までの時間の経過後または unload 後に再読み込みされること"""
+
+    def setUp(self):
+        self.results = [{'model': None}, {'model': object()}]
+        self.loader = mock.Mock(side_effect=lambda: self.results.pop(0))
+        self.registry = ModelRegistry({'m': self.loader}, retry_seconds=60)
+
+    def test_failed_load_is_retried_after_cooldown(self):
+        with mock.patch('new_image_analyzer_v2.model_registry.time.monotonic', return_value=1000.0):
+            self.assertIsNone(self.registry.get('m')['model'])
+            self.assertEqual(self.registry.status()['m']['state'], STATE_FAILED)
+
+        # 再試行までの間は失敗の結果を返す
+        with mock.patch('new_image_analyzer_v2.model_registry.time.monotonic', return_value=1059.0):
+            self.assertIsNone(self.registry.get('m')['model'])
+        self.assertEqual(self.loader.call_count, 1)
+
+        with mock.patch('new_image_analyzer_v2.model_registry.time.monotonic', return_value=1060.0):
+            self.assertIsNotNone(self.registry.get('m')['model'])
+        self.assertEqual(self.loader.call_count, 2)
+        self.assertEqual(self.registry.status()['m']['state'], STATE_LOADED)
+
+    def test_unload_clears_failed_load(self):
+        self.assertIsNone(self.registry.get('m')['model'])
+
+        self.registry.unload('m')
+
+        self.assertIsNotNone(self.registry.get('m')['model'])
+        self.assertEqual(self.loader.call_count, 2)
+
+
+class ProcessConfigurationTests(SimpleTestCase):
+    """推論のスレッド数の設定は、解析サービスの作成時ではなくモデルの初回読み込み時に行うこと"""
+
+    @mock.patch('new_image_analyzer_v2.execution.configure_process')
+    def test_configured_on_first_model_load(self, configure_process):
+        with mock.patch.dict(execution._process_config, {'configured': False}):
+            service = AnalysisService()
+            configure_process.assert_not_called()
+
+            with mock.patch.dict(service.registry._loaders, {'pytorch_mobilenet': lambda: {'model': object()}}):
+                service.registry.get('pytorch_mobilenet')
+
+        configure_process.assert_called_once_with()
@@ -0,0 +1,160 @@
+"""
+解析パイプラインの段階ごとの処理時間
+解析1件ごとに各段階（準備・キャッシュ参照・モデル取得・デコード・前処理・推論・後処理・保存）の時間を計測し、
+ジョブに記録するとともに、プロセス内の段階別ヒストグラムに集計する
+
+計測は段階の切り替え時にtime.perf_counter()を1回呼ぶだけなので、本番でも常に有効にしておける。
+"""
+import bisect
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+# 計測する段階（実行順）
+TIMING_STAGES = [
+    'prepare',          # 解析開始の準備（古い結果の削除・ステータス更新）
+    'lookup',           # 解析結果キャッシュ・類似画像の参照
+    'model_loading',    # モデルの取得（未読み込みの場合は読み込み）
+    'decoding',         # 画像の読み込み
+    'preprocessing',    # テンソルへの変換
+    'inference',        # 推論（バッチの待ち時間を含む）
+    'postprocessing',   # 予測結果の整形
+    'persist',          # 解析結果の保存
+]
+
+# ヒストグラムのバケットの上限（ミリ秒）。最後のバケットより大きい値は超過として数える
+BUCKET_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+
+
+class StageTimer:
+    """段階の切り替え時刻から各段階の処理時間（ミリ秒）を記録する
+
+    start()を呼ぶと実行中の段階を終了して次の段階を開始する。同じ段階を複数回実行した場合は合計する。
+    """
+
+    def __init__(self):
+        self.durations: Dict[str, float] = {}
+        self._current: Optional[str] = None
+        self._started = time.perf_counter()
+        self._stage_started = self._started
+        self._total: Optional[float] = None
+
+    def start(self, stage: str) -> None:
+        now = time.perf_counter()
+        self._close(now)
+        self._current = stage
+        self._stage_started = now
+
+    def stop(self) -> Dict[str, float]:
+        """計測を終了し、段階ごとの処理時間と全体の時間（total）を返す"""
+        if self._total is None:
+            now = time.perf_counter()
+            self._close(now)
+            self._current = None
+            self._total = (now - self._started) * 1000.0
+        return self.as_dict()
+
+    def as_dict(self) -> Dict[str, float]:
+        timings = {stage: round(ms, 3) for stage, ms in self.durations.items()}
+        if self._total is not None:
+            timings['total'] = round(self._total, 3)
+        return timings
+
+    def _close(self, now: float) -> None:
+        if self._current is not None:
+            elapsed = (now - self._stage_started) * 1000.0
+            self.durations[self._current] = self.durations.get(self._current, 0.0) + elapsed
+
+
+class Histogram:
+    """固定バケットのヒストグラム（パーセンタイルはバケットの上限で近似する）"""
+
+    def __init__(self, bounds: Iterable[float] = BUCKET_BOUNDS_MS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q / 100.0 * self.count
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(float(bound), self.max)
+        return self.max
+
+    def stats(self) -> Dict:
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count if self.count else 0.0,
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'max_ms': self.max,
+            'buckets': [
+                {'le': bound, 'count': count}
+                for bound, count in zip(list(self.bounds) + ['+Inf'], self.counts)
+            ],
+        }
+
+
+class StageHistograms:
+    """段階ごとの処理時間のヒストグラム"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Histogram] = {}
+
+    def observe(self, timings: Dict[str, float]) -> None:
+        with self._lock:
+            for stage, ms in timings.items():
+                histogram = self._histograms.get(stage)
+                if histogram is None:
+                    histogram = self._histograms[stage] = Histogram()
+                histogram.observe(ms)
+
+    def stats(self) -> Dict[str, Dict]:
+        """段階ごとの統計（実行順、最後に全体）"""
+        order = TIMING_STAGES + ['total']
+        with self._lock:
+            stages = sorted(self._histograms, key=lambda stage: order.index(stage) if stage in order else len(order))
+            return {stage: self._histograms[stage].stats() for stage in stages}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms = {}
+
+
+def aggregate_timings(timings_list: Iterable[Optional[Dict[str, float]]]) -> Dict[str, Dict]:
+    """記録済みの処理時間（ジョブのtimings）をまとめてヒストグラムにする"""
+    histograms = StageHistograms()
+    for timings in timings_list:
+        if timings:
+            histograms.observe(timings)
+    return histograms.stats()
+
+
+def get_recent_job_timings(limit: int = 1000) -> List[Dict[str, float]]:
+    """直近に完了したジョブの処理時間（全プロセスのワーカーの分を含む）"""
+    from .models import TransAnalysisJob
+
+    return list(
+        TransAnalysisJob.objects
+        .filter(status='succeeded', timings__isnull=False)
+        .order_by('-updated_at')
+        .values_list('timings', flat=True)[:limit]
+    )
+
+
+# プロセス内の集計
+stage_histograms = StageHistograms()
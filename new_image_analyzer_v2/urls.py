@@ -23,12 +23,15 @@ urlpatterns = [
     path('api/select-model/', views.api_select_model, name='v2_api_select_model'),
     path('api/analysis/start/', views.api_start_analysis, name='v2_api_start_analysis'),
     path('api/analysis/progress/', views.api_analysis_progress, name='v2_api_analysis_progress'),
+    path('api/analysis/events/', views.api_analysis_events, name='v2_api_analysis_events'),
     path('api/analysis/complete/', views.api_complete_analysis, name='v2_api_complete_analysis'),
     path('api/images/uploaded/', views.api_get_uploaded_images, name='v2_api_get_uploaded_images'),
     path('api/images/status/', views.api_get_images_status, name='v2_api_get_images_status'),
+    path('api/images/table/', views.api_image_table, name='v2_api_image_table'),
     path('api/analysis/retry/', views.api_retry_analysis, name='v2_api_retry_analysis'),
     path('api/update-status/', views.api_update_status, name='v2_api_update_status'),
     path('api/timeline/<int:image_id>/', views.api_get_timeline, name='v2_api_get_timeline'),
     path('api/images/<int:image_id>/detail/', views.api_image_detail, name='v2_api_image_detail'),
     path('api/images/<int:image_id>/delete/', views.api_delete_image, name='v2_api_delete_image'),
+    path('api/metrics/', views.api_analysis_metrics, name='v2_api_analysis_metrics'),
 ]
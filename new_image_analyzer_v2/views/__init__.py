@@ -29,17 +29,25 @@ from .api import (
     api_get_timeline,
     api_delete_image,
     api_get_uploaded_images,
+    api_image_table,
     api_get_images_status,
     api_analysis_progress,
     api_image_detail,
+    api_analysis_metrics,
+)
+
+from .stream import (
+    api_analysis_events,
 )
 
 from .helpers import (
     validate_file,
     save_file_and_create_image_v2,
     perform_image_analysis,
+    perform_batch_image_analysis,
+    run_image_analysis,
+    run_batch_image_analysis,
     process_single_image_analysis,
-    process_batch_analysis,
     start_analysis_processing,
 )
 
@@ -67,15 +75,21 @@ __all__ = [
     'api_get_timeline',
     'api_delete_image',
     'api_get_uploaded_images',
+    'api_image_table',
     'api_get_images_status',
     'api_analysis_progress',
     'api_image_detail',
+    'api_analysis_metrics',
+    # Stream
+    'api_analysis_events',
     # Helpers
     'validate_file',
     'save_file_and_create_image_v2',
     'perform_image_analysis',
+    'perform_batch_image_analysis',
+    'run_image_analysis',
+    'run_batch_image_analysis',
     'process_single_image_analysis',
-    'process_batch_analysis',
     'start_analysis_processing',
 ]
 
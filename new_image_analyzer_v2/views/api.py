@@ -5,12 +5,17 @@ API関連のビュー
 import os
 import json
 import logging
+from django.db import transaction
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import Rank
 from django.http import JsonResponse, HttpRequest
 from django.views.decorators.http import require_POST, require_GET
 from django.views.decorators.csrf import csrf_protect
 from django.utils import timezone
-from ..models import MstUser, TransUploadedImage, TransImageAnalysis
+from ..models import MstUser, TransUploadedImage, TransAnalysisRun, TransImageAnalysis
+from ..progress import get_stage_info
 from .helpers import (
+    LATEST_RESULT_FIELDS,
     validate_file,
     save_file_and_create_image_v2,
     start_analysis_processing
@@ -57,8 +62,7 @@ def api_form_upload(request: HttpRequest):
             
             # 画像のステータスを更新
             img.status = 'uploaded'
-            img.upload_completed_at = timezone.now()
-            img.save()
+            img.save(update_fields=['status', 'updated_at'])
             
             saved.append(img)
         except Exception as e:
@@ -150,7 +154,7 @@ def api_start_analysis(request: HttpRequest):
             # 画像のステータスを直接更新
             image.analysis_started_at = timezone.now()
             image.status = 'analyzing'
-            image.save()
+            image.save(update_fields=['analysis_started_at', 'status', 'updated_at'])
             
             logger.info(f"個別画像の解析を開始: ID={image.image_id}")
             
@@ -168,25 +172,23 @@ def api_start_analysis(request: HttpRequest):
             ).order_by('-created_at')
             
             # セッションから解析済みの画像IDを除外して更新
-            active_image_ids = [img.image_id for img in available_images]
+            active_image_ids = list(available_images.values_list('image_id', flat=True))
             request.session['uploaded_image_ids'] = active_image_ids
             request.session.modified = True
             
-            logger.info(f"一括解析対象画像数: {available_images.count()} (セッション画像IDs: {uploaded_image_ids} -> 有効画像IDs: {active_image_ids})")
+            logger.info(f"一括解析対象画像数: {len(active_image_ids)} (セッション画像IDs: {uploaded_image_ids} -> 有効画像IDs: {active_image_ids})")
             
-            if not available_images.exists():
+            if not active_image_ids:
                 logger.error("解析対象の画像が見つかりません")
                 return JsonResponse({'ok': False, 'error': '解析対象の画像が見つかりません'}, status=400)
             
-            # 各画像のステータスを準備中に更新
-            for img in available_images:
-                img.status = 'preparing'
-                img.save()
+            # 全画像のステータスを1回のUPDATEで準備中に更新
+            TransUploadedImage.objects.filter(image_id__in=active_image_ids).update(status='preparing', updated_at=timezone.now())
             
-            logger.info(f"一括解析で{available_images.count()}件の画像の解析を開始")
+            logger.info(f"一括解析で{len(active_image_ids)}件の画像の解析を開始")
         
-        # 解析処理を開始（バックグラウンドで実行）
-        start_analysis_processing(image_id, model_name)
+        # 解析ジョブを登録（ワーカーがバックグラウンドで実行）
+        start_analysis_processing(image_id, model_name, image_ids=None if image_id else active_image_ids)
         
         return JsonResponse({'success': True, 'message': '解析を開始しました'})
         
@@ -212,18 +214,36 @@ def api_complete_analysis(request: HttpRequest):
         except TransUploadedImage.DoesNotExist:
             return JsonResponse({'ok': False, 'error': '指定された画像が見つかりません'}, status=404)
         
-        # 解析結果を保存
-        saved_results = []
-        for i, result in enumerate(analysis_results):
-            analysis = TransImageAnalysis.objects.create(
+        # 解析実行を作成し、解析結果を1回のbulk_createで保存
+        analysis_time = timezone.now()
+        model_name = analysis_results[0].get('model_name', 'unknown') if analysis_results else 'unknown'
+        with transaction.atomic():
+            run = TransAnalysisRun.objects.create(
                 image_id=image,
-                label=result.get('label', 'Unknown'),
-                confidence=result.get('confidence', 0.0),
-                model_name=result.get('model_name', 'unknown'),
-                rank=i + 1,
-                analysis_started_at=timezone.now(),
-                analysis_completed_at=timezone.now()
+                model_name=model_name,
+                status='succeeded',
+                started_at=image.analysis_started_at or analysis_time,
+                completed_at=analysis_time
             )
+            analyses = TransImageAnalysis.objects.bulk_create([
+                TransImageAnalysis(
+                    image_id=image,
+                    run_id=run,
+                    label=result.get('label', 'Unknown'),
+                    confidence=result.get('confidence', 0.0),
+                    model_name=result.get('model_name', 'unknown'),
+                    rank=i + 1,
+                    analysis_started_at=analysis_time,
+                    analysis_completed_at=analysis_time
+                )
+                for i, result in enumerate(analysis_results)
+            ])
+            # 最新の解析結果を画像に記録
+            if analyses:
+                image.set_latest_results(run, analysis_results, model_name)
+                image.save(update_fields=LATEST_RESULT_FIELDS + ['updated_at'])
+        saved_results = []
+        for analysis in analyses:
             saved_results.append({
                 'id': analysis.analysis_id,
                 'label': analysis.label,
@@ -273,39 +293,21 @@ def api_get_timeline(request: HttpRequest, image_id: int):
         except TransUploadedImage.DoesNotExist:
             return JsonResponse({'ok': False, 'error': '指定された画像が見つかりません'}, status=404)
         
-        # 解析結果の存在を確認
-        has_analysis_results = TransImageAnalysis.objects.filter(image_id=image).exists()
-        
-        # 画像のステータスに基づいて進捗を決定（シンプルなロジック）
+        # 解析パイプラインが記録した段階から進捗を決定
+        stage_info = get_stage_info(image.status, image.analysis_stage)
+        progress_percentage = stage_info['percentage']
+        step_title = stage_info['title']
+        step_description = stage_info['description']
         if image.status == 'completed':
-            # 完了ステータスの場合は100%
-            progress_percentage = 100
             progress_stage = 'completed'
-            step_title = '解析完了'
-            step_description = '画像解析が正常に完了しました'
             step_icon = 'check'
             step_color = 'success'
-        elif image.status == 'analyzing':
-            # 解析中の場合
-            if has_analysis_results:
-                progress_percentage = 90
-                progress_stage = 'analyzing'
-                step_title = '解析中'
-                step_description = '解析結果を処理中...'
-                step_icon = 'spinner'
-                step_color = 'primary'
-            else:
-                progress_percentage = 50
-                progress_stage = 'analyzing'
-                step_title = '解析中'
-                step_description = '画像を解析しています...'
-                step_icon = 'spinner'
-                step_color = 'primary'
+        elif progress_percentage > 0:
+            progress_stage = 'analyzing'
+            step_icon = 'spinner'
+            step_color = 'primary'
         else:
-            progress_percentage = 0
             progress_stage = 'waiting'
-            step_title = '待機中'
-            step_description = '解析の準備をしています...'
             step_icon = 'clock'
             step_color = 'info'
         
@@ -324,13 +326,14 @@ def api_get_timeline(request: HttpRequest, image_id: int):
             },
             'progress': {
                 'percentage': progress_percentage,
-                'stage': progress_stage
+                'stage': progress_stage,
+                'analysis_stage': stage_info['stage']
             },
             'model_used': '未指定'
         }
         
         # 解析結果も取得
-        analysis_results = TransImageAnalysis.objects.filter(image_id=image).order_by('-analysis_completed_at')
+        analysis_results = TransImageAnalysis.objects.filter(image_id=image).order_by('-run_id', 'rank')
         results_data = []
         
         for result in analysis_results:
@@ -437,6 +440,111 @@ def api_get_uploaded_images(request: HttpRequest):
         return JsonResponse({'ok': False, 'error': str(e)}, status=500)
 
 
+@require_GET
+def api_image_table(request: HttpRequest):
+    """画像一覧取得API（無限スクロール用。キーセット方式のページネーション）
+
+    ?cursor= に前回の応答の next_cursor / previous_cursor を指定して続きを取得する。
+    ?per_page= は1ページの件数（既定10件、最大100件）。?count=approximate / exact を指定すると
+    総件数も返す（approximate は大きなテーブルでは統計情報からの見積もり）。
+    管理者は全ユーザーの画像、一般ユーザーは自分の画像を対象とする。
+    """
+    from ..pagination import InvalidCursor, approximate_count, paginate_keyset
+    
+    if not request.user.is_authenticated:
+        return JsonResponse({'ok': False, 'error': 'ログインが必要です'}, status=401)
+    
+    try:
+        per_page = int(request.GET.get('per_page', 10))
+    except ValueError:
+        return JsonResponse({'ok': False, 'error': 'per_pageには整数を指定してください'}, status=400)
+    if not 1 <= per_page <= 100:
+        return JsonResponse({'ok': False, 'error': 'per_pageは1〜100の範囲で指定してください'}, status=400)
+    
+    count_mode = request.GET.get('count')
+    if count_mode not in (None, 'approximate', 'exact'):
+        return JsonResponse({'ok': False, 'error': 'countには approximate または exact を指定してください'}, status=400)
+    
+    try:
+        if request.user.is_staff:
+            images = TransUploadedImage.objects.all()
+        else:
+            images = TransUploadedImage.objects.filter(user_id__username=request.user.username)
+        
+        try:
+            page = paginate_keyset(images.select_related('user_id'), request.GET.get('cursor') or None, per_page)
+        except InvalidCursor as e:
+            return JsonResponse({'ok': False, 'error': str(e)}, status=400)
+        
+        images_data = []
+        for img in page.object_list:
+            top_result = next(iter(img.get_previous_results()), None)
+            images_data.append({
+                'id': img.image_id,
+                'filename': img.filename,
+                'thumbnail_url': f'/uploads/images/{os.path.basename(img.file_path)}',
+                'status': img.status,
+                'username': img.user_id.username,
+                'created_at': img.created_at.isoformat() if img.created_at else None,
+                'label': top_result.label if top_result else None,
+                'confidence': top_result.confidence if top_result else None,
+                'model_name': img.latest_model_name or None,
+            })
+        
+        response = {
+            'ok': True,
+            'images': images_data,
+            'has_next': page.has_next,
+            'has_previous': page.has_previous,
+            'next_cursor': page.next_cursor,
+            'previous_cursor': page.previous_cursor,
+        }
+        if count_mode == 'exact':
+            response['count'] = images.count()
+            response['count_is_approximate'] = False
+        elif count_mode == 'approximate':
+            response['count'], response['count_is_approximate'] = approximate_count(images)
+        return JsonResponse(response)
+        
+    except Exception as e:
+        logger.error(f"画像一覧取得エラー: {e}")
+        return JsonResponse({'ok': False, 'error': str(e)}, status=500)
+
+
+def _get_waiting_counts(preparing_images):
+    """準備中の画像ごとの待ち枚数（同じユーザーの解析中の枚数 + 自分より前の準備中の枚数）
+
+    対象ユーザーの解析中・準備中の画像をウィンドウ関数で集計し、1回のクエリで求める。
+    """
+    if not preparing_images:
+        return {}
+    
+    target_ids = {image['image_id'] for image in preparing_images}
+    rows = (
+        TransUploadedImage.objects
+        .filter(user_id__in={image['user_id'] for image in preparing_images}, status__in=['analyzing', 'preparing'])
+        .annotate(
+            analyzing_count=Window(
+                expression=Count('image_id', filter=Q(status='analyzing')),
+                partition_by=[F('user_id')],
+            ),
+            # 同じユーザー・ステータス内で upload_order が小さい画像の数 + 1
+            order_rank=Window(
+                expression=Rank(),
+                partition_by=[F('user_id'), F('status')],
+                order_by=F('upload_order').asc(),
+            ),
+        )
+        .values_list('image_id', 'status', 'analyzing_count', 'order_rank')
+    )
+    
+    return {
+        image_id: analyzing_count + order_rank - 1
+        for image_id, status, analyzing_count, order_rank in rows
+        if status == 'preparing' and image_id in target_ids
+    }
+
+
 @require_GET
 def api_get_images_status(request: HttpRequest):
     """複数画像のステータス一括取得API（テーブル画面用）"""
@@ -449,41 +557,30 @@ def api_get_images_status(request: HttpRequest):
         # カンマ区切りのIDリストをパース
         image_ids = [int(id.strip()) for id in image_ids_str.split(',') if id.strip()]
         
-        # 画像のステータスを取得
-        images = TransUploadedImage.objects.filter(image_id__in=image_ids)
+        # 画像のステータスと最新の解析結果（画像に記録済み）を1回のクエリで取得
+        images = list(
+            TransUploadedImage.objects
+            .filter(image_id__in=image_ids)
+            .only('image_id', 'user_id', 'status', 'upload_order', 'latest_results', 'latest_model_name')
+        )
+        
+        # 準備中の画像の待ち枚数を1回のクエリで計算
+        waiting_counts = _get_waiting_counts(
+            [{'image_id': image.image_id, 'user_id': image.user_id_id} for image in images if image.status == 'preparing']
+        )
         
         # 結果を構築
         status_data = {}
         for image in images:
-            # 解析結果を取得
-            latest_result = TransImageAnalysis.objects.filter(
-                image_id=image
-            ).order_by('-confidence').first()
-            
+            top_result = next(iter(image.get_previous_results()), None)
             status_info = {
                 'status': image.status,
-                'label': latest_result.label if latest_result else None,
-                'confidence': latest_result.confidence if latest_result else None
+                'label': top_result.label if top_result else None,
+                'confidence': top_result.confidence if top_result else None
             }
             
-            # 準備中の画像の場合は待ち順番を計算
             if image.status == 'preparing':
-                # 同じユーザーの解析中の画像数をカウント
-                analyzing_count = TransUploadedImage.objects.filter(
-                    user_id=image.user_id,
-                    status='analyzing'
-                ).count()
-                
-                # 同じユーザーの自分より前の準備中の画像数をカウント
-                preparing_before_count = TransUploadedImage.objects.filter(
-                    user_id=image.user_id,
-                    status='preparing',
-                    upload_order__lt=image.upload_order
-                ).count()
-                
-                # 待ち枚数 = 解析中の枚数 + 自分より前の準備中の枚数
-                waiting_count = analyzing_count + preparing_before_count
-                status_info['waiting_count'] = waiting_count
+                status_info['waiting_count'] = waiting_counts.get(image.image_id, 0)
             
             status_data[str(image.image_id)] = status_info
         
@@ -508,58 +605,14 @@ def api_analysis_progress(request: HttpRequest):
             try:
                 image = TransUploadedImage.objects.get(image_id=image_id)
                 
-                # 解析結果の存在を確認
-                has_analysis_results = TransImageAnalysis.objects.filter(image_id=image).exists()
+                # 解析パイプラインが記録した段階から進捗を決定
+                stage_info = get_stage_info(image.status, image.analysis_stage)
+                progress_percentage = stage_info['percentage']
+                current_stage = 'completed' if image.status == 'completed' else ('waiting' if progress_percentage == 0 else 'analyzing')
+                description = stage_info['description']
                 
-                # 画像のステータスに基づいて進捗を決定（連続的な進捗）
-                if image.status == 'completed':
-                    # 完了ステータスの場合は100%
-                    progress_percentage = 100
-                    current_stage = 'completed'
-                    description = '画像解析が正常に完了しました'
-                elif image.status == 'analyzing':
-                    # 解析中の場合は連続的な進捗を計算
-                    if has_analysis_results:
-                        # 解析結果がある場合は90-99%の範囲でランダムに進捗
-                        import random
-                        progress_percentage = random.randint(90, 99)
-                        current_stage = 'analyzing'
-                        description = '解析結果を処理中...'
-                    else:
-                        # 解析開始からの経過時間に基づいて段階的な進捗を計算
-                        import time
-                        elapsed_time = time.time() - image.analysis_started_at.timestamp()
-                        
-                        # 実際の解析時間に合わせた進捗計算（5-10秒で完了想定）
-                        if elapsed_time < 1.0:
-                            progress_percentage = 10
-                        elif elapsed_time < 2.0:
-                            progress_percentage = 20
-                        elif elapsed_time < 3.0:
-                            progress_percentage = 30
-                        elif elapsed_time < 4.0:
-                            progress_percentage = 40
-                        elif elapsed_time < 5.0:
-                            progress_percentage = 50
-                        elif elapsed_time < 6.0:
-                            progress_percentage = 60
-                        elif elapsed_time < 7.0:
-                            progress_percentage = 70
-                        elif elapsed_time < 8.0:
-                            progress_percentage = 80
-                        elif elapsed_time < 9.0:
-                            progress_percentage = 85
-                        else:
-                            progress_percentage = 89
-                        current_stage = 'analyzing'
-                        description = '画像を解析しています...'
-                else:
-                    progress_percentage = 0
-                    current_stage = 'waiting'
-                    description = '解析の準備をしています...'
-                
-                # 解析結果を取得
-                results = TransImageAnalysis.objects.filter(image_id=image).order_by('-confidence')[:3]
+                # 解析結果を取得（画像に記録済みの最新の解析結果）
+                results = image.get_previous_results()
                 result_data = []
                 for result in results:
                     result_data.append({
@@ -573,6 +626,7 @@ def api_analysis_progress(request: HttpRequest):
                     'progress': progress_percentage,
                     'status': image.status,
                     'current_stage': current_stage,
+                    'analysis_stage': stage_info['stage'],
                     'description': description,
                     'result': result_data if result_data else None
                 })
@@ -598,9 +652,11 @@ def api_analysis_progress(request: HttpRequest):
                 })
             
             try:
-                # 対象画像を全て取得
-                images = TransUploadedImage.objects.filter(image_id__in=uploaded_image_ids)
-                total_count = images.count()
+                # 対象画像のステータスと解析段階を1回のクエリで取得
+                image_states = list(
+                    TransUploadedImage.objects.filter(image_id__in=uploaded_image_ids).values_list('status', 'analysis_stage')
+                )
+                total_count = len(image_states)
                 
                 if total_count == 0:
                     return JsonResponse({
@@ -614,12 +670,15 @@ def api_analysis_progress(request: HttpRequest):
                     })
                 
                 # 完了した画像数をカウント
-                completed_count = images.filter(status='completed').count()
-                analyzing_count = images.filter(status='analyzing').count()
-                preparing_count = images.filter(status='preparing').count()
+                statuses = [status for status, _ in image_states]
+                completed_count = statuses.count('completed')
+                analyzing_count = statuses.count('analyzing')
+                preparing_count = statuses.count('preparing')
                 
-                # 実際の進捗を計算（完了画像数 / 総画像数）
-                progress_percentage = int((completed_count / total_count) * 100)
+                # 各画像の解析段階の進捗率を平均して全体の進捗を計算
+                progress_percentage = int(sum(
+                    get_stage_info(status, stage)['percentage'] for status, stage in image_states
+                ) / total_count)
                 
                 # ステータスと説明文を決定
                 if completed_count == total_count:
@@ -708,3 +767,38 @@ def api_image_detail(request: HttpRequest, image_id: int):
         logger.error(f"画像詳細取得エラー: {e}")
         return JsonResponse({'ok': False, 'error': str(e)}, status=500)
 
+
+@require_GET
+def api_analysis_metrics(request: HttpRequest):
+    """解析のキャッシュ・推論・段階ごとの処理時間の統計情報取得API（管理者のみ）
+
+    stage_timingsのprocessはこのプロセスで実行した解析、recent_jobsは直近に完了したジョブ
+    （?jobs=件数、既定1000件。外部ワーカーで実行した分を含む）の段階ごとのヒストグラム。
+    """
+    if not request.user.is_authenticated or not request.user.is_staff:
+        return JsonResponse({'ok': False, 'error': '管理者権限が必要です'}, status=403)
+    
+    try:
+        from ..result_cache import result_cache
+        from ..services import analysis_service
+        from ..timings import aggregate_timings, get_recent_job_timings, stage_histograms
+        
+        try:
+            job_limit = max(0, int(request.GET.get('jobs', 1000)))
+        except ValueError:
+            return JsonResponse({'ok': False, 'error': 'jobsには整数を指定してください'}, status=400)
+        
+        return JsonResponse({
+            'ok': True,
+            'result_cache': result_cache.stats(),
+            'model_cache': analysis_service.get_model_cache_stats(),
+            'inference': analysis_service.get_inference_stats(),
+            'stage_timings': {
+                'process': stage_histograms.stats(),
+                'recent_jobs': aggregate_timings(get_recent_job_timings(job_limit)),
+            },
+        })
+        
+    except Exception as e:
+        logger.error(f"統計情報取得エラー: {e}")
+        return JsonResponse({'ok': False, 'error': str(e)}, status=500)
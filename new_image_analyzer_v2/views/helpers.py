@@ -5,12 +5,18 @@
 import os
 from django.conf import settings
 from django.utils import timezone
-from ..models import MstUser, TransUploadedImage, TransImageAnalysis
+from ..models import MstUser, TransUploadedImage, TransAnalysisRun, TransImageAnalysis
+from ..progress import notify_image, publish_stage
 
 ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif'}
 MAX_MB = 1
 MAX_BYTES = MAX_MB * 1024 * 1024
 
+# 最新の解析結果（非正規化）の列
+LATEST_RESULT_FIELDS = ['latest_results', 'latest_model_name', 'latest_run_id']
+# 解析完了時に更新する列
+COMPLETED_FIELDS = ['status', 'analysis_stage', 'analysis_completed_at', 'updated_at'] + LATEST_RESULT_FIELDS
+
 
 def validate_file(file):
     """ファイルバリデーション"""
@@ -31,9 +37,11 @@ def validate_file(file):
 
 def save_file_and_create_image_v2(file, user):
     """ファイルを保存して新しいモデルで画像レコードを作成（番号付与方式）"""
+    import hashlib
     import uuid
     from datetime import datetime
     from django.db import models
+    from ..near_duplicates import compute_dhash
     
     # 元のファイル名を取得
     original_filename = file.name
@@ -73,10 +81,12 @@ def save_file_and_create_image_v2(file, user):
     # ディレクトリを作成
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
     
-    # ファイルを保存
+    # ファイルを保存（書き込みながら内容のダイジェストを計算）
+    digest = hashlib.sha256()
     with open(file_path, 'wb') as destination:
         for chunk in file.chunks():
             destination.write(chunk)
+            digest.update(chunk)
     
     # ユーザーごとのアップロード順序番号を取得
     max_order = TransUploadedImage.objects.filter(
@@ -85,177 +95,402 @@ def save_file_and_create_image_v2(file, user):
     
     next_order = (max_order or 0) + 1
     
+    # 類似画像検出用の知覚ハッシュを計算（画像として読めない場合は空）
+    try:
+        perceptual_hash = compute_dhash(file_path)
+    except Exception:
+        perceptual_hash = ''
+    
     # 新しいモデルで画像レコードを作成
     img = TransUploadedImage.objects.create(
         user_id=mst_user,
         filename=display_filename,
         file_path=file_path,
         upload_order=next_order,
-        status='analyzing'
+        status='analyzing',
+        content_digest=digest.hexdigest(),
+        perceptual_hash=perceptual_hash
     )
     
     return img
 
 
-def perform_image_analysis(image, model_name):
-    """実際の画像解析処理（v1のanalysis_serviceを使用）"""
+def _convert_analysis_response(analysis_response, model_name):
+    """解析サービスの戻り値をv2のモデル構造に合わせた結果リストに変換（解析に失敗した場合は例外を送出する）"""
+    import logging
+    logger = logging.getLogger(__name__)
+    
+    # v1の戻り値の形式をチェック（失敗した解析の結果は保存せず、ジョブの再実行に任せる）
+    if not analysis_response.get('success', False):
+        error = analysis_response.get('error', '不明なエラー')
+        logger.error(f"解析失敗: {error}")
+        raise RuntimeError(f"解析失敗: {error}")
+    
+    results = analysis_response.get('results', [])
+    
+    # v2のモデル構造に合わせて結果を変換
+    converted_results = []
+    for i, result in enumerate(results):
+        converted_result = {
+            'label': result.get('label', 'Unknown'),
+            'confidence': float(result.get('confidence', 0.0)),
+            'model_name': model_name,
+            'rank': result.get('rank', i + 1)
+        }
+        converted_results.append(converted_result)
+    
+    logger.info(f"変換完了: 最終結果数={len(converted_results)}")
+    return converted_results
+
+
+def perform_image_analysis(image, model_name, on_stage=None):
+    """実際の画像解析処理（v1のanalysis_serviceを使用。解析に失敗した場合は例外を送出する）"""
     import logging
+    from ..near_duplicates import find_reusable_results
+    from ..result_cache import result_cache
     from ..services import analysis_service
     
     logger = logging.getLogger(__name__)
     
-    try:
-        logger.info(f"画像解析開始: ファイルパス={image.file_path}, モデル={model_name}")
-        
-        # v2用の解析サービスを使用して画像解析を実行
-        analysis_response = analysis_service.analyze_image(image.file_path, model_name)
-        logger.info(f"解析結果取得: {analysis_response}")
-        logger.info(f"解析結果の型: {type(analysis_response)}")
-        logger.info(f"successキーの値: {analysis_response.get('success', 'キーが存在しません')}")
-        
-        # v1の戻り値の形式をチェック
-        if not analysis_response.get('success', False):
-            logger.error(f"解析失敗: {analysis_response.get('error', '不明なエラー')}")
-            logger.error(f"解析失敗の詳細: {analysis_response}")
-            return [
-                {
-                    'label': 'Unknown',
-                    'confidence': 0.0,
-                    'model_name': model_name,
-                    'rank': 1
-                }
-            ]
-        
-        results = analysis_response.get('results', [])
-        logger.info(f"解析結果数: {len(results)}")
-        
-        # v2のモデル構造に合わせて結果を変換
-        converted_results = []
-        for i, result in enumerate(results):
-            logger.info(f"結果{i+1}: {result}")
-            converted_result = {
-                'label': result.get('label', 'Unknown'),
-                'confidence': float(result.get('confidence', 0.0)),
-                'model_name': model_name,
-                'rank': result.get('rank', i + 1)
-            }
-            converted_results.append(converted_result)
-            logger.info(f"変換後結果{i+1}: {converted_result}")
-        
-        logger.info(f"変換完了: 最終結果数={len(converted_results)}")
-        return converted_results
-        
-    except Exception as e:
-        logger.error(f"個別画像解析エラー: {e}")
-        # エラー時はサンプルデータを返す
-        return [
-            {
-                'label': 'Unknown',
-                'confidence': 0.0,
-                'model_name': model_name,
-                'rank': 1
-            }
-        ]
+    # 同じ内容の画像を同じモデルで解析済みなら、その結果を再利用する
+    model_version = analysis_service.get_model_version(model_name)
+    cached_results = result_cache.get(image.content_digest, model_name, model_version)
+    if cached_results is not None:
+        logger.info(f"解析結果キャッシュを使用: 画像ID={image.image_id}, モデル={model_name}")
+        return cached_results
+    
+    # 類似画像（再圧縮・リサイズされたコピー）の解析結果を再利用する（設定で有効な場合）
+    reused_results = find_reusable_results(image, model_name, model_version)
+    if reused_results is not None:
+        return reused_results
+    
+    logger.info(f"画像解析開始: ファイルパス={image.file_path}, モデル={model_name}")
+    
+    # v2用の解析サービスを使用して画像解析を実行
+    analysis_response = analysis_service.analyze_image(image.file_path, model_name, on_stage=on_stage)
+    logger.info(f"解析結果取得: {analysis_response}")
+    
+    results = _convert_analysis_response(analysis_response, model_name)
+    result_cache.put(image.content_digest, model_name, model_version, results)
+    return results
 
 
-def process_single_image_analysis(image_id, model_name):
-    """個別画像の解析処理"""
+def perform_batch_image_analysis(images, model_name, on_stage=None):
+    """複数画像をまとめてバッチ推論する（画像と同じ順序で結果リストを返す）
+
+    解析に失敗した画像は、結果リストの代わりに例外を返す。
+    on_stageを指定すると、推論（デコード・前処理・後処理を含む）の開始時に段階名を渡して呼び出す。
+    """
     import logging
+    from ..near_duplicates import find_reusable_results
+    from ..result_cache import result_cache
+    from ..services import analysis_service
+    
     logger = logging.getLogger(__name__)
     
-    try:
-        image = TransUploadedImage.objects.get(image_id=image_id)
-        
-        # 再解析の場合は古い解析結果を削除
-        was_completed = image.status == 'completed'
-        if was_completed:
-            old_results = TransImageAnalysis.objects.filter(image_id=image)
-            old_count = old_results.count()
-            old_results.delete()
-            logger.info(f"再解析開始: 画像ID={image.image_id} (古い解析結果{old_count}件を削除)")
-        else:
-            logger.info(f"解析処理開始: 画像ID={image.image_id}")
-        
-        # ステータスを解析中に更新
+    # キャッシュ・類似画像の結果がない画像だけを推論する（空の結果リストもキャッシュのヒットとして扱う）
+    model_version = analysis_service.get_model_version(model_name)
+    
+    def reusable_results(image):
+        cached_results = result_cache.get(image.content_digest, model_name, model_version)
+        if cached_results is not None:
+            return cached_results
+        return find_reusable_results(image, model_name, model_version)
+    
+    batch_results = [reusable_results(image) for image in images]
+    pending = [i for i, results in enumerate(batch_results) if results is None]
+    
+    logger.info(f"一括画像解析開始: {len(pending)}件（結果を再利用: {len(images) - len(pending)}件）, モデル={model_name}")
+    if pending:
+        if on_stage is not None:
+            on_stage('inference')
+        # デコード・前処理はデコードプール（設定で有効な場合）、推論はバッチ単位で実行される
+        analysis_responses = analysis_service.analyze_images([images[i].file_path for i in pending], model_name)
+        for i, response in zip(pending, analysis_responses):
+            try:
+                batch_results[i] = _convert_analysis_response(response, model_name)
+            except RuntimeError as e:
+                batch_results[i] = e
+                continue
+            result_cache.put(images[i].content_digest, model_name, model_version, batch_results[i])
+    return batch_results
+
+
+def _begin_image_analysis(image, model_name):
+    """解析開始の準備（再解析の場合は古い結果を削除し、ステータスを解析中に更新して解析実行を作成）"""
+    import logging
+    from ..services import analysis_service
+    logger = logging.getLogger(__name__)
+    
+    update_fields = ['status', 'analysis_started_at', 'updated_at']
+    
+    # 再解析の場合は古い解析実行を削除（解析結果も削除される。実行中の解析実行は残す）
+    was_completed = image.status == 'completed'
+    if was_completed:
+        old_count, _ = TransAnalysisRun.objects.filter(image_id=image).exclude(status='running').delete()
+        image.clear_latest_results()
+        update_fields += LATEST_RESULT_FIELDS
+        logger.info(f"再解析開始: 画像ID={image.image_id} (古い解析実行・解析結果{old_count}件を削除)")
+    else:
+        logger.info(f"解析処理開始: 画像ID={image.image_id}")
+    
+    # ステータスを解析中に更新（変更した列だけを更新）
+    image.status = 'analyzing'
+    image.analysis_started_at = timezone.now()
+    image.save(update_fields=update_fields)
+    notify_image(image)
+    return TransAnalysisRun.objects.create(
+        image_id=image,
+        model_name=model_name,
+        model_version=analysis_service.get_model_version(model_name) or '',
+        started_at=image.analysis_started_at,
+    )
+
+
+def _begin_batch_analysis(images, model_name):
+    """一括解析開始の準備（古い結果の削除・ステータスの更新・解析実行の作成をそれぞれ1回のクエリで行う）"""
+    import logging
+    from ..progress import notify_images
+    from ..services import analysis_service
+    logger = logging.getLogger(__name__)
+    
+    completed_ids = [image.image_id for image in images if image.status == 'completed']
+    if completed_ids:
+        old_count, _ = TransAnalysisRun.objects.filter(image_id__in=completed_ids).exclude(status='running').delete()
+        TransUploadedImage.objects.filter(image_id__in=completed_ids).update(
+            latest_results=[], latest_model_name='', latest_run_id=None
+        )
+        for image in images:
+            if image.status == 'completed':
+                image.clear_latest_results()
+        logger.info(f"再解析開始: {len(completed_ids)}件 (古い解析実行・解析結果{old_count}件を削除)")
+    
+    now = timezone.now()
+    image_ids = [image.image_id for image in images]
+    TransUploadedImage.objects.filter(image_id__in=image_ids).update(
+        status='analyzing', analysis_started_at=now, updated_at=now
+    )
+    for image in images:
         image.status = 'analyzing'
-        image.analysis_started_at = timezone.now()
-        image.save()
-        
-        # 実際の解析処理
-        analysis_results = perform_image_analysis(image, model_name)
-        
-        # 進捗バーとの同期のため、解析完了前に少し待機
-        import time
-        time.sleep(2)
-        
-        # 解析結果を保存（同じ解析実行なので同じ時刻を使用）
-        analysis_time = timezone.now()
-        for i, result in enumerate(analysis_results):
-            TransImageAnalysis.objects.create(
-                image_id=image,
-                label=result.get('label', 'Unknown'),
-                confidence=result.get('confidence', 0.0),
-                model_name=result.get('model_name', 'unknown'),
-                rank=i + 1,
-                analysis_started_at=analysis_time,
-                analysis_completed_at=analysis_time
-            )
-        
-        # ステータスを完了に更新
-        image.status = 'completed'
-        image.analysis_completed_at = analysis_time
-        image.save()
+        image.analysis_started_at = now
+        image.updated_at = now
+    notify_images(image_ids)
+    model_version = analysis_service.get_model_version(model_name) or ''
+    return TransAnalysisRun.objects.bulk_create([
+        TransAnalysisRun(image_id=image, model_name=model_name, model_version=model_version, started_at=now)
+        for image in images
+    ])
+
+
+def _build_analysis_rows(image, run, analysis_results, analysis_time):
+    """保存する解析結果の行を作成（同じ解析実行なので同じ時刻を使用）"""
+    return [
+        TransImageAnalysis(
+            image_id=image,
+            run_id=run,
+            label=result.get('label', 'Unknown'),
+            confidence=result.get('confidence', 0.0),
+            model_name=result.get('model_name', 'unknown'),
+            rank=i + 1,
+            reused_from_id=result.get('reused_from'),
+            reuse_distance=result.get('reuse_distance'),
+            analysis_started_at=analysis_time,
+            analysis_completed_at=analysis_time
+        )
+        for i, result in enumerate(analysis_results)
+    ]
+
+
+def _set_completed(image, run, analysis_results, analysis_time):
+    """画像と解析実行を完了の状態にし、最新の解析結果を設定する（保存は呼び出し元で行う）"""
+    run.status = 'succeeded'
+    run.completed_at = analysis_time
+    image.status = 'completed'
+    image.analysis_stage = 'persisted'
+    image.analysis_completed_at = analysis_time
+    image.updated_at = analysis_time
+    model_name = analysis_results[0].get('model_name', 'unknown') if analysis_results else ''
+    image.set_latest_results(run, analysis_results, model_name)
+
+
+def _save_analysis_results(image, run, analysis_results):
+    """解析結果を保存してステータスを完了に更新（1つのトランザクションで保存する）"""
+    from django.db import transaction
+    
+    analysis_time = timezone.now()
+    with transaction.atomic():
+        TransImageAnalysis.objects.bulk_create(_build_analysis_rows(image, run, analysis_results, analysis_time))
         
-        logger.info(f"個別画像解析完了: ID={image_id}")
+        # 解析実行・画像のステータスを完了に更新し、最新の解析結果を画像に記録
+        _set_completed(image, run, analysis_results, analysis_time)
+        run.save(update_fields=['status', 'completed_at'])
+        image.save(update_fields=COMPLETED_FIELDS)
+    notify_image(image)
+
+
+def _save_batch_analysis_results(images, runs, batch_results):
+    """一括解析の全画像の結果を1回のbulk_createで保存し、解析実行・画像のステータスと最新の解析結果をbulk_updateで更新する"""
+    from django.db import transaction
+    from ..progress import notify_images
+    
+    analysis_time = timezone.now()
+    rows = []
+    for image, run, analysis_results in zip(images, runs, batch_results):
+        rows.extend(_build_analysis_rows(image, run, analysis_results, analysis_time))
+        _set_completed(image, run, analysis_results, analysis_time)
+    
+    with transaction.atomic():
+        TransImageAnalysis.objects.bulk_create(rows)
+        TransAnalysisRun.objects.bulk_update(runs, ['status', 'completed_at'])
+        TransUploadedImage.objects.bulk_update(images, COMPLETED_FIELDS)
+    notify_images([image.image_id for image in images])
+
+
+def _fail_analysis_runs(runs, error):
+    """解析実行を失敗にする（エラー内容を記録）"""
+    try:
+        TransAnalysisRun.objects.filter(run_id__in=[run.run_id for run in runs]).update(
+            status='failed', completed_at=timezone.now(), error=str(error)
+        )
+    except:
+        pass
+
+
+def _mark_analysis_error(*image_ids):
+    """エラー時はステータスをエラーに更新"""
+    from ..progress import notify_images
+    try:
+        TransUploadedImage.objects.filter(image_id__in=image_ids).update(status='error', updated_at=timezone.now())
+        notify_images(image_ids)
+    except:
+        pass
+
+
+def run_image_analysis(image_id, model_name):
+    """個別画像の解析処理（失敗時は例外を送出する。ジョブワーカーから呼ばれる）
+
+    段階ごとの処理時間（ミリ秒）を返す。
+    """
+    import logging
+    from ..progress import STAGE_INFO
+    from ..timings import StageTimer, stage_histograms
+    logger = logging.getLogger(__name__)
+    
+    timer = StageTimer()
+    timer.start('prepare')
+    image = TransUploadedImage.objects.get(image_id=image_id)
+    run = _begin_image_analysis(image, model_name)
+    
+    def on_stage(stage):
+        timer.start(stage)
+        if stage in STAGE_INFO:
+            publish_stage(image.image_id, stage)
+    
+    try:
+        # 実際の解析処理（各段階の開始を進捗として記録）
+        timer.start('lookup')
+        analysis_results = perform_image_analysis(image, model_name, on_stage=on_stage)
         
+        timer.start('persist')
+        _save_analysis_results(image, run, analysis_results)
     except Exception as e:
-        logger.error(f"個別画像解析エラー: {e}")
-        # エラー時はステータスをエラーに更新
-        try:
-            image = TransUploadedImage.objects.get(image_id=image_id)
-            image.status = 'error'
-            image.save()
-        except:
-            pass
+        _fail_analysis_runs([run], e)
+        raise
+    
+    timings = timer.stop()
+    stage_histograms.observe(timings)
+    run.timings = timings
+    run.save(update_fields=['timings'])
+    logger.info(f"個別画像解析完了: ID={image_id}, 処理時間={timings}")
+    return timings
 
 
-def process_batch_analysis(model_name):
-    """一括解析処理"""
+def run_batch_image_analysis(image_ids, model_name):
+    """複数画像をまとめて解析する（ジョブワーカーが同じモデルのジョブをまとめて取得した場合に呼ばれる）
+
+    画像IDごとに、成功した場合は段階ごとの処理時間（ミリ秒。バッチ全体の時間）、失敗した場合は例外を返す。
+    解析開始の準備や結果の保存に失敗した場合は、全画像の解析実行を失敗にして例外を送出する。
+    """
     import logging
+    from ..progress import STAGE_INFO, publish_stages
+    from ..timings import StageTimer, stage_histograms
     logger = logging.getLogger(__name__)
     
+    timer = StageTimer()
+    timer.start('prepare')
+    images = list(TransUploadedImage.objects.filter(image_id__in=image_ids).order_by('upload_order'))
+    outcomes = {
+        image_id: TransUploadedImage.DoesNotExist(f"画像が存在しません: 画像ID={image_id}")
+        for image_id in image_ids
+    }
+    if not images:
+        return outcomes
+    runs = _begin_batch_analysis(images, model_name)
+    
+    def on_stage(stage):
+        timer.start(stage)
+        if stage in STAGE_INFO:
+            publish_stages([image.image_id for image in images], stage)
+    
     try:
-        # 準備中の画像を取得
-        images = TransUploadedImage.objects.filter(status='preparing')
-        
-        for image in images:
-            process_single_image_analysis(image.image_id, model_name)
-        
-        logger.info(f"一括解析完了: {images.count()}件")
+        timer.start('lookup')
+        batch_results = perform_batch_image_analysis(images, model_name, on_stage=on_stage)
         
+        timer.start('persist')
+        succeeded = [
+            (image, run, results) for image, run, results in zip(images, runs, batch_results)
+            if not isinstance(results, Exception)
+        ]
+        if succeeded:
+            _save_batch_analysis_results(*(list(column) for column in zip(*succeeded)))
     except Exception as e:
-        logger.error(f"一括解析エラー: {e}")
+        _fail_analysis_runs(runs, e)
+        raise
+    
+    timings = timer.stop()
+    stage_histograms.observe(timings)
+    for image, run, results in zip(images, runs, batch_results):
+        if isinstance(results, Exception):
+            _fail_analysis_runs([run], results)
+        outcomes[image.image_id] = results if isinstance(results, Exception) else timings
+    TransAnalysisRun.objects.filter(run_id__in=[run.run_id for _, run, _ in succeeded]).update(timings=timings)
+    logger.info(f"一括解析完了: {len(succeeded)}/{len(images)}件成功, 処理時間={timings}")
+    return outcomes
 
 
-def start_analysis_processing(image_id, model_name):
-    """解析処理をバックグラウンドで開始"""
-    import threading
+def process_single_image_analysis(image_id, model_name):
+    """個別画像の解析処理"""
     import logging
     logger = logging.getLogger(__name__)
     
-    def process_analysis():
-        try:
-            if image_id:
-                # 個別画像解析
-                process_single_image_analysis(image_id, model_name)
-            else:
-                # 一括解析
-                process_batch_analysis(model_name)
-        except Exception as e:
-            logger.error(f"解析処理中にエラーが発生: {e}")
-    
-    # バックグラウンドで実行
-    thread = threading.Thread(target=process_analysis)
-    thread.daemon = True
-    thread.start()
+    try:
+        run_image_analysis(image_id, model_name)
+    except Exception as e:
+        logger.error(f"個別画像解析エラー: {e}")
+        _mark_analysis_error(image_id)
 
+
+def start_analysis_processing(image_id, model_name, image_ids=None):
+    """解析ジョブを登録する（ワーカーがバックグラウンドで実行）
+
+    image_idを指定した場合はその画像のみ、指定しない場合はimage_ids
+    （省略時は準備中の画像すべて）を対象とする。
+    """
+    import logging
+    from ..jobs import dispatch_analysis_jobs
+    logger = logging.getLogger(__name__)
+    
+    if image_id:
+        # 個別画像解析
+        target_ids = [int(image_id)]
+    elif image_ids is not None:
+        # 一括解析
+        target_ids = list(image_ids)
+    else:
+        target_ids = list(
+            TransUploadedImage.objects.filter(status='preparing').order_by('upload_order').values_list('image_id', flat=True)
+        )
+    
+    jobs = dispatch_analysis_jobs(target_ids, model_name)
+    logger.info(f"解析ジョブを登録: {len(jobs)}件")
+    return jobs
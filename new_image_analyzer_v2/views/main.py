@@ -9,10 +9,10 @@ from django.http import HttpRequest
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.core.paginator import Paginator
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_protect
-from ..models import MstUser, TransUploadedImage, TransImageAnalysis
+from ..models import MstUser, TransUploadedImage
+from ..pagination import ImageTablePaginator
 
 logger = logging.getLogger(__name__)
 
@@ -38,8 +38,8 @@ def user_image_table(request: HttpRequest):
             # MstUserが存在しない場合は空のクエリセット
             images = TransUploadedImage.objects.none()
     
-    # ページネーション設定
-    paginator = Paginator(images, 10)  # 10件/ページ
+    # ページネーション設定（総件数は大きなテーブルでは統計情報からの見積もり）
+    paginator = ImageTablePaginator(images, 10)  # 10件/ページ
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
@@ -87,8 +87,8 @@ def admin_image_table(request: HttpRequest):
         except MstUser.DoesNotExist:
             filtered_images = TransUploadedImage.objects.none()
     
-    # ページネーション設定
-    paginator = Paginator(filtered_images, 10)
+    # ページネーション設定（総件数は大きなテーブルでは統計情報からの見積もり）
+    paginator = ImageTablePaginator(filtered_images, 10)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
@@ -221,12 +221,12 @@ def re_analysis(request: HttpRequest):
             # analysis_completed_atが設定されていない場合は、まだ完全に完了していない
             if selected_image.status == 'completed' and selected_image.analysis_completed_at is None:
                 # 解析結果が存在するかどうかで進捗を調整
-                has_analysis_results = TransImageAnalysis.objects.filter(image_id=selected_image).exists()
+                has_analysis_results = bool(selected_image.latest_results)
                 if has_analysis_results:
                     # 解析結果はあるが、まだ完全に完了していない
                     # analysis_completed_atを設定して完全に完了させる
                     selected_image.analysis_completed_at = timezone.now()
-                    selected_image.save()
+                    selected_image.save(update_fields=['analysis_completed_at', 'updated_at'])
                     logger.info(f"DEBUG: analysis_completed_at設定完了: 画像ID={selected_image.image_id}")
             
             logger.info(f"DEBUG: selected_image found = {selected_image.filename}, status = {selected_image.status}, analysis_completed_at = {selected_image.analysis_completed_at}")
@@ -266,18 +266,9 @@ def re_analysis(request: HttpRequest):
     previous_results = []
     if selected_image:
         try:
-            # 最新の解析結果を取得（最新の解析実行の結果を信頼度順で取得）
-            # まず最新の解析完了時刻を取得
-            latest_analysis_time = TransImageAnalysis.objects.filter(image_id=selected_image).order_by('-analysis_completed_at').first()
-            if latest_analysis_time:
-                # 最新の解析実行の結果を信頼度順で取得（上位3件まで）
-                previous_results = TransImageAnalysis.objects.filter(
-                    image_id=selected_image,
-                    analysis_completed_at=latest_analysis_time.analysis_completed_at
-                ).order_by('-confidence')[:3]
-            else:
-                previous_results = []
-            logger.info(f"DEBUG: previous_results count = {previous_results.count()}")
+            # 最新の解析結果を取得（画像に記録済みの最新の解析実行の結果、信頼度順で上位3件）
+            previous_results = selected_image.get_previous_results()
+            logger.info(f"DEBUG: previous_results count = {len(previous_results)}")
             for i, result in enumerate(previous_results):
                 logger.info(f"DEBUG: previous_results[{i}] = {result.label} ({result.confidence}%)")
         except Exception as e:
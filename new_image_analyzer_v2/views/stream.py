@@ -0,0 +1,128 @@
+"""
+Stream views
+解析進捗をServer-Sent Events（SSE）で配信するビュー
+ASGIサーバー（image_analysis_app/asgi.py）で動かすことを前提とする
+"""
+import asyncio
+import json
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpRequest, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+
+from .. import events
+from ..models import TransUploadedImage
+from ..progress import TERMINAL_STATUSES, get_progress_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+def _get_stream_image_ids(request: HttpRequest):
+    """ストリーム対象の画像ID（image_id指定時はその画像、指定なしはセッションの画像）
+
+    ログインしていない場合はNoneを返し、画像IDが整数でない場合はValueErrorを送出する。
+    他のユーザーの画像は対象にしない（管理者は全ユーザーの画像を対象にできる）。
+    """
+    if not request.user.is_authenticated:
+        return None
+
+    image_id = request.GET.get('image_id')
+    if image_id:
+        image_ids = [int(image_id)]
+    else:
+        image_ids = [int(i) for i in request.session.get('uploaded_image_ids', [])]
+
+    images = TransUploadedImage.objects.filter(image_id__in=image_ids)
+    if not request.user.is_staff:
+        images = images.filter(user_id__username=request.user.username)
+    return list(images.order_by('image_id').values_list('image_id', flat=True))
+
+
+def _format_event(event_type: str, data) -> str:
+    return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _event_stream(image_ids):
+    """初回に現在の状態を送り、以降は変化があった時だけ送る
+
+    購読はストリームの送信開始時に行い、接続が切れた場合も含めて終了時に必ず解除する。
+    イベントがないまま心拍の間隔が過ぎた場合は、未完了の画像の状態をDBから読み直し、
+    取りこぼしたイベント（別プロセスのワーカーで解析された画像など）があれば送る。
+    """
+    heartbeat = getattr(settings, 'ANALYSIS_EVENTS_HEARTBEAT_SECONDS', 15)
+    max_duration = getattr(settings, 'ANALYSIS_EVENTS_MAX_SECONDS', 600)
+    started = time.monotonic()
+
+    # 初回の状態を読む前に購読し、その間の変化を取りこぼさないようにする
+    subscription = events.subscribe(image_ids)
+    try:
+        statuses = {}
+        sent = {}
+
+        def changed(event):
+            # 送信済みの状態と同じイベントは送らない
+            key = (event['status'], event['analysis_stage'])
+            if sent.get(event['image_id']) == key:
+                return False
+            sent[event['image_id']] = key
+            statuses[event['image_id']] = event['status']
+            return True
+
+        for event in await sync_to_async(get_progress_snapshot)(image_ids):
+            changed(event)
+            yield _format_event('progress', event)
+
+        while not statuses or not all(status in TERMINAL_STATUSES for status in statuses.values()):
+            if time.monotonic() - started > max_duration:
+                # 長時間の接続はクライアント側で再接続させる
+                return
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                pending_ids = [image_id for image_id, status in statuses.items() if status not in TERMINAL_STATUSES]
+                caught_up = [event for event in await sync_to_async(get_progress_snapshot)(pending_ids) if changed(event)]
+                for event in caught_up:
+                    yield _format_event('progress', event)
+                if not caught_up:
+                    # プロキシに接続を切られないようにコメント行を送る
+                    yield ': heartbeat\n\n'
+                continue
+            if changed(event):
+                yield _format_event('progress', event)
+
+        # 全画像の解析が終わったらストリームを閉じる
+        yield _format_event('end', {
+            'total_images': len(statuses),
+            'completed_images': sum(1 for status in statuses.values() if status == 'completed'),
+        })
+    finally:
+        events.unsubscribe(subscription)
+
+
+async def api_analysis_events(request: HttpRequest):
+    """解析進捗ストリームAPI（Server-Sent Events）"""
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+
+    if not isinstance(request, ASGIRequest):
+        # WSGIではストリームを最後までまとめて送ってしまうため、クライアントにはポーリングを使わせる
+        return JsonResponse({'ok': False, 'error': '進捗ストリームはASGIサーバーでのみ利用できます'}, status=501)
+
+    try:
+        image_ids = await sync_to_async(_get_stream_image_ids)(request)
+    except (TypeError, ValueError):
+        return JsonResponse({'ok': False, 'error': 'image_idには整数を指定してください'}, status=400)
+    if image_ids is None:
+        return JsonResponse({'ok': False, 'error': 'ログインが必要です'}, status=401)
+    if not image_ids:
+        return JsonResponse({'ok': False, 'error': '対象の画像がありません'}, status=400)
+
+    logger.info(f"進捗ストリーム開始: 画像IDs={image_ids}")
+
+    response = StreamingHttpResponse(_event_stream(image_ids), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
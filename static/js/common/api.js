@@ -122,6 +122,38 @@ async function getAnalysisProgress(imageId = null) {
   return apiCall(endpoint, { method: 'GET' });
 }
 
+/**
+ * 解析進捗ストリーム（Server-Sent Events）を購読
+ * @param {number|null} imageId - 画像ID（オプション、nullの場合はセッション全体）
+ * @param {Object} handlers - イベントハンドラー
+ * @param {Function} handlers.onProgress - 画像の進捗が変化した時（画像ごとの進捗情報を受け取る）
+ * @param {Function} handlers.onEnd - 全画像の解析が終わった時（集計情報を受け取る）
+ * @param {Function} handlers.onError - 接続できなかった時
+ * @returns {EventSource} 購読中のEventSource（close()で購読を終了）
+ */
+function subscribeAnalysisEvents(imageId = null, handlers = {}) {
+  const endpoint = imageId
+    ? `/v2/api/analysis/events/?image_id=${imageId}`
+    : '/v2/api/analysis/events/';
+  const source = new EventSource(endpoint, { withCredentials: true });
+
+  source.addEventListener('progress', event => {
+    if (handlers.onProgress) handlers.onProgress(JSON.parse(event.data));
+  });
+  source.addEventListener('end', event => {
+    source.close();
+    if (handlers.onEnd) handlers.onEnd(JSON.parse(event.data));
+  });
+  source.onerror = error => {
+    // 接続が閉じられた場合のみエラーとする（一時的な切断はEventSourceが自動で再接続）
+    if (source.readyState === EventSource.CLOSED && handlers.onError) {
+      handlers.onError(error);
+    }
+  };
+
+  return source;
+}
+
 /**
  * アップロード済み画像一覧取得API
  * @returns {Promise<Object>} アップロード済み画像リスト
@@ -81,11 +81,91 @@ function closeModelSelectionModal() {
   }
 }
 
+// 進捗ストリーム（SSE）の接続
+let progressEventSource = null;
+
 /**
  * 進捗監視開始
- * 3秒間隔で解析進捗をポーリング
+ * SSEが使える場合はサーバーからの通知で、使えない場合はポーリングで進捗を監視
  */
 function startProgressMonitoring() {
+  if (window.EventSource) {
+    startProgressStream();
+  } else {
+    startProgressPolling();
+  }
+}
+
+/**
+ * SSEで進捗を監視
+ * 画像の状態が変わった時だけ通知を受け取り、接続できない場合はポーリングに切り替える
+ */
+function startProgressStream() {
+  if (progressEventSource) {
+    progressEventSource.close();
+  }
+
+  const imageProgress = {};
+
+  progressEventSource = subscribeAnalysisEvents(null, {
+    onProgress: data => {
+      updateSingleImageProgress(data.image_id, data);
+
+      // 全体の進捗は各画像の進捗の平均
+      imageProgress[data.image_id] = data.progress || 0;
+      const values = Object.values(imageProgress);
+      const overall = values.reduce((sum, value) => sum + value, 0) / values.length;
+      updateAnalysisUI('analyzing', overall);
+      updateProgressBar(overall);
+
+      const progressDescription = document.getElementById('timeline-analysis-description');
+      if (progressDescription && data.description) {
+        progressDescription.textContent = data.description;
+      }
+    },
+    onEnd: data => {
+      progressEventSource = null;
+      if (data.completed_images === data.total_images && data.total_images > 0) {
+        console.log(`進捗ストリーム: 全画像完了検出 (${data.completed_images}/${data.total_images}枚)`);
+        handleAllImagesCompleted();
+      } else {
+        updateAnalysisUI('failed');
+      }
+    },
+    onError: () => {
+      console.warn('進捗ストリームに接続できないため、ポーリングに切り替えます');
+      progressEventSource = null;
+      startProgressPolling();
+    }
+  });
+}
+
+/**
+ * 全画像の解析完了時の処理
+ */
+function handleAllImagesCompleted() {
+  updateAnalysisUI('completed');
+
+  // 進捗バーのステータステキストを「解析成功」に変更
+  const progressBars = document.querySelectorAll('[data-analysis-progress-bar-pane]');
+  progressBars.forEach(progressBar => {
+    const statusText = progressBar.closest('.progress-container').querySelector('[data-analysis-file-size]');
+    if (statusText) {
+      statusText.textContent = '解析成功';
+    }
+  });
+
+  // 3秒後にリダイレクト
+  setTimeout(() => {
+    window.location.href = '/v2/';
+  }, 3000);
+}
+
+/**
+ * ポーリングで進捗を監視
+ * 3秒間隔で解析進捗をポーリング
+ */
+function startProgressPolling() {
   let attemptCount = 0;
   const maxAttempts = 60; // 最大60回（3分間）
 
@@ -125,21 +205,7 @@ function startProgressMonitoring() {
             console.log(`進捗監視: 全画像完了検出 (${data.completed_images}/${data.total_images}枚)`);
             clearInterval(progressInterval);
             progressInterval = null;
-            updateAnalysisUI('completed');
-
-            // 進捗バーのステータステキストを「解析成功」に変更
-            const progressBars = document.querySelectorAll('[data-analysis-progress-bar-pane]');
-            progressBars.forEach(progressBar => {
-              const statusText = progressBar.closest('.progress-container').querySelector('[data-analysis-file-size]');
-              if (statusText) {
-                statusText.textContent = '解析成功';
-              }
-            });
-
-            // 3秒後にリダイレクト
-            setTimeout(() => {
-              window.location.href = '/v2/';
-            }, 3000);
+            handleAllImagesCompleted();
           } else {
             console.log(`進捗監視: 解析継続中 (${data.completed_images}/${data.total_images}枚完了)`);
             // まだ完了していない画像がある場合は個別進捗を更新